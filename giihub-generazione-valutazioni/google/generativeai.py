@@ -1,95 +1,574 @@
-# File: google/generativeai.py
-# Questo è un modulo "shim" o "stub" locale.
-# Simula le parti essenziali della libreria 'google-generativeai'
-# per permettere al programma di avviarsi anche se non è installata
-# e per facilitare la modalità dry-run.
-
-import json
-import os
-import logging
-from dataclasses import dataclass, field
-from typing import Any, List, Dict
-
-# Configura un logger per questo modulo stub
-logger = logging.getLogger(__name__)
-
-# --- Variabili Globali Simulate ---
-_api_key_is_set = False
-
-# --- Funzioni Simulate ---
-
-def configure(api_key: str | None = None):
-    """Simula la funzione di configurazione dell'SDK."""
-    global _api_key_is_set
-    if api_key:
-        _api_key_is_set = True
-        logger.debug("Shim google.generativeai: configure() chiamata con una chiave API.")
-    else:
-        _api_key_is_set = False
-        logger.debug("Shim google.generativeai: configure() chiamata senza chiave API.")
-
-
-# --- Classi Simulate ---
-
-@dataclass
-class GenerationConfig:
-    """Simula la classe GenerationConfig."""
-    temperature: float = 0.8
-    max_output_tokens: int = 2048
-    response_mime_type: str = "text/plain"
-
-
-class GenerativeModel:
-    """Simula la classe GenerativeModel."""
-    def __init__(self, model_name: str, system_instruction: str = ""):
-        self.model_name = model_name
-        self.system_instruction = system_instruction
-        logger.debug(f"Shim GenerativeModel: istanziato per il modello '{model_name}'.")
-
-    def start_chat(self, history: List[Dict[str, Any]]):
-        """Simula l'avvio di una sessione di chat."""
-        # Restituisce un'istanza di una classe di chat simulata e passa il nome del modello
-        return _SimulatedChatSession(history=history, model_name=self.model_name)
-
-    def generate_content(self, prompt: str, generation_config: GenerationConfig | None = None):
-        """Simula la generazione di contenuto basata su un prompt."""
-        if generation_config is None:
-            generation_config = GenerationConfig()
-
-        class MockResponse:
-            def __init__(self, text: str):
-                # Simula l'oggetto risposta che ha un attributo .text
-                self.text = text
-                self.prompt_feedback = "SIMULATED_OK"
-
-        logger.info("Shim GenerativeModel: generate_content() chiamato. Restituzione di una risposta simulata.")
-        simulated_text = f"[RISPOSTA SIMULATA DAL MODULO 'google/generativeai.py' per il modello '{self.model_name}']"
-        return MockResponse(text=simulated_text)
-
-
-class _SimulatedChatSession:
-    """Classe interna che simula una sessione di chat attiva."""
-    def __init__(self, history: List[Dict[str, Any]], model_name: str = "<unknown>"):
-        self._history = history
-        self.model_name = model_name
-
-    def send_message(self, content: str, generation_config: GenerationConfig):
-        """Simula l'invio di un messaggio e la ricezione di una risposta."""
-        class MockResponse:
-            def __init__(self, text: str):
-                # Simula l'oggetto risposta che ha un attributo .text
-                self.text = text
-                self.prompt_feedback = "SIMULATED_OK"
-
-        logger.info("Shim _SimulatedChatSession: send_message() chiamato. Restituzione di una risposta simulata.")
-        
-        simulated_text = f"[RISPOSTA SIMULATA DAL MODULO 'google/generativeai.py' per il modello '{self.model_name}']"
-        return MockResponse(text=simulated_text)
-
-
-# --- Sezione Tipi (per compatibilità) ---
-# Alcuni SDK hanno un sottomodulo 'types', lo simuliamo.
-class TypesModule:
-    GenerationConfig = GenerationConfig
-
-types = TypesModule()
\ No newline at end of file
+# File: google/generativeai.py
+# Questo è un modulo "shim" o "stub" locale.
+# Simula le parti essenziali della libreria 'google-generativeai'
+# per permettere al programma di avviarsi anche se non è installata
+# e per facilitare la modalità dry-run.
+#
+# Oltre alla risposta fissa di default, lo shim può fare da simulatore configurabile
+# (latenze per modello, streaming a N token/s, lunghezze sintetiche, usage metadata
+# ed errori 429/500/timeout iniettati): vedi configure_simulator() e GENAI_SHIM_PROFILE.
+# Simula anche la cache di contesto (caching.CachedContent e GenerativeModel.from_cached_content) e, come
+# estensione non presente nell'SDK reale, un server locale con posti limitati che accetta richieste in batch
+# (send_message_batch_async), per provare la modalità a ondate senza GPU.
+
+import asyncio
+import itertools
+import json
+import os
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Dict
+
+# Configura un logger per questo modulo stub
+logger = logging.getLogger(__name__)
+
+# --- Variabili Globali Simulate ---
+_api_key_is_set = False
+
+# --- Funzioni Simulate ---
+
+def configure(api_key: str | None = None):
+    """Simula la funzione di configurazione dell'SDK."""
+    global _api_key_is_set
+    if api_key:
+        _api_key_is_set = True
+        logger.debug("Shim google.generativeai: configure() chiamata con una chiave API.")
+    else:
+        _api_key_is_set = False
+        logger.debug("Shim google.generativeai: configure() chiamata senza chiave API.")
+
+
+# --- Eccezioni Simulate ---
+# Stessi nomi e attributo `code` delle eccezioni di google.api_core usate dall'SDK reale.
+
+class GoogleAPICallError(Exception):
+    """Simula la classe base degli errori API."""
+    code: int = 0
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(f"{self.code} {message}")
+        self.message = message
+        self.retry_after = retry_after
+
+
+class ResourceExhausted(GoogleAPICallError):
+    """Simula l'errore 429 (quota o rate limit superati)."""
+    code = 429
+
+
+class InternalServerError(GoogleAPICallError):
+    """Simula l'errore 500."""
+    code = 500
+
+
+class DeadlineExceeded(GoogleAPICallError):
+    """Simula l'errore 504 (la richiesta non è terminata entro la scadenza del server)."""
+    code = 504
+
+
+class NotFound(GoogleAPICallError):
+    """Simula l'errore 404 (per esempio un contenuto in cache scaduto o eliminato)."""
+    code = 404
+
+
+class ExceptionsModule:
+    GoogleAPICallError = GoogleAPICallError
+    ResourceExhausted = ResourceExhausted
+    InternalServerError = InternalServerError
+    DeadlineExceeded = DeadlineExceeded
+    NotFound = NotFound
+
+exceptions = ExceptionsModule()
+
+
+# --- Simulatore ---
+
+@dataclass
+class ModelProfile:
+    """Comportamento simulato di un modello. Con i valori di default risponde subito con il testo fisso."""
+    latency_median: float = 0.0      # secondi prima del primo token (mediana)
+    latency_sigma: float = 0.0       # dispersione log-normale della latenza (0 = latenza fissa)
+    tokens_per_second: float = 0.0   # velocità di streaming (0 = tutto il testo in un colpo)
+    response_tokens_mean: int = 0    # lunghezza media della risposta sintetica (0 = testo fisso)
+    response_tokens_sd: int = 0      # deviazione standard della lunghezza
+    error_rate_429: float = 0.0      # probabilità di ResourceExhausted per chiamata
+    error_rate_500: float = 0.0      # probabilità di InternalServerError per chiamata
+    timeout_rate: float = 0.0        # probabilità che la chiamata resti appesa e poi fallisca con DeadlineExceeded
+    timeout_seconds: float = 60.0    # durata dell'attesa in caso di timeout simulato
+    retry_after: float | None = None  # suggerimento di attesa allegato agli errori 429
+    prefill_tokens_per_second: float = 0.0  # elaborazione dei token di prompt non in cache (0 = istantanea)
+    server_slots: int = 0            # richieste elaborate insieme dal server simulato (0 = illimitate)
+    batch_item_seconds: float = 0.0  # tempo aggiunto al primo token da ogni richiesta in più di un batch
+
+
+@dataclass
+class SimulatorConfig:
+    default: ModelProfile = field(default_factory=ModelProfile)
+    models: Dict[str, ModelProfile] = field(default_factory=dict)
+
+    def profile_for(self, model_name: str) -> ModelProfile:
+        return self.models.get(model_name, self.default)
+
+
+_simulator = SimulatorConfig()
+_rng = random.Random()
+_rng_lock = threading.Lock()
+# Istante (time.monotonic) in cui si libera ciascun posto del server simulato, per modello.
+_slots_free_at: Dict[str, List[float]] = {}
+_slots_lock = threading.Lock()
+
+_FILLER_WORDS = (
+    "the turnstile door sensor inverter alarm was checked and the motor current stayed within the nominal range "
+    "after recalibration of the limit switches so the issue is resolved"
+).split()
+
+
+def configure_simulator(
+    default: ModelProfile | Dict[str, Any] | None = None,
+    models: Dict[str, ModelProfile | Dict[str, Any]] | None = None,
+    seed: int | None = None,
+):
+    """Configura il simulatore. I profili possono essere passati come ModelProfile o come dizionari."""
+    global _simulator
+
+    def as_profile(value: ModelProfile | Dict[str, Any]) -> ModelProfile:
+        return value if isinstance(value, ModelProfile) else ModelProfile(**value)
+
+    _simulator = SimulatorConfig(
+        default=as_profile(default) if default is not None else ModelProfile(),
+        models={name: as_profile(p) for name, p in (models or {}).items()},
+    )
+    with _rng_lock:
+        _rng.seed(seed)
+    with _slots_lock:
+        _slots_free_at.clear()
+
+
+def _load_profile_from_env():
+    """Carica GENAI_SHIM_PROFILE: percorso di un file JSON oppure JSON inline con chiavi default/models/seed."""
+    raw = os.getenv("GENAI_SHIM_PROFILE")
+    if not raw:
+        return
+    if raw.lstrip().startswith("{"):
+        data = json.loads(raw)
+    else:
+        with open(raw, encoding="utf-8") as f:
+            data = json.load(f)
+    configure_simulator(default=data.get("default"), models=data.get("models"), seed=data.get("seed"))
+    logger.info("Shim google.generativeai: profilo del simulatore caricato da GENAI_SHIM_PROFILE.")
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+class UsageMetadata:
+    """Simula usage_metadata delle risposte."""
+    def __init__(self, prompt_token_count: int, candidates_token_count: int, cached_content_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+@dataclass
+class _Simulation:
+    """Esito pianificato di una chiamata: errore da sollevare, attese e testo da restituire."""
+    text: str
+    chunks: List[str]
+    first_token_delay: float
+    chunk_delay: float
+    usage: UsageMetadata
+    error: GoogleAPICallError | None = None
+    error_delay: float = 0.0
+    model_name: str = ""
+
+    @property
+    def service_seconds(self) -> float:
+        """Tempo per cui la chiamata occupa un posto del server simulato."""
+        if self.error is not None:
+            return self.error_delay
+        return self.first_token_delay + self.chunk_delay * max(0, len(self.chunks) - 1)
+
+
+def _plan(
+    model_name: str, prompt_text: str, generation_config: "GenerationConfig | None", cached_text: str = ""
+) -> _Simulation:
+    """Pianifica una chiamata. `cached_text` è il prefisso servito dalla cache di contesto: conta nei token
+    del prompt ma non nel tempo di elaborazione."""
+    model_name = model_name.removeprefix("models/")
+    profile = _simulator.profile_for(model_name)
+    max_tokens = generation_config.max_output_tokens if generation_config is not None else None
+    with _rng_lock:
+        roll = _rng.random()
+        latency = profile.latency_median
+        if profile.latency_sigma > 0 and latency > 0:
+            latency = _rng.lognormvariate(0.0, profile.latency_sigma) * latency
+        n_tokens = 0
+        if profile.response_tokens_mean > 0:
+            n_tokens = max(1, int(_rng.gauss(profile.response_tokens_mean, profile.response_tokens_sd)))
+        words = [_rng.choice(_FILLER_WORDS) for _ in range(n_tokens)]
+
+    cached_tokens = _estimate_tokens(cached_text)
+    prompt_tokens = _estimate_tokens(prompt_text) + cached_tokens
+    if profile.prefill_tokens_per_second > 0:
+        latency += _estimate_tokens(prompt_text) / profile.prefill_tokens_per_second
+    empty_usage = UsageMetadata(prompt_tokens, 0, cached_tokens)
+    if roll < profile.timeout_rate:
+        error = DeadlineExceeded("Deadline Exceeded")
+        return _Simulation("", [], 0.0, 0.0, empty_usage, error, profile.timeout_seconds, model_name)
+    roll -= profile.timeout_rate
+    if roll < profile.error_rate_429:
+        error = ResourceExhausted("Resource has been exhausted (e.g. check quota).", retry_after=profile.retry_after)
+        return _Simulation("", [], 0.0, 0.0, empty_usage, error, latency, model_name)
+    roll -= profile.error_rate_429
+    if roll < profile.error_rate_500:
+        error = InternalServerError("An internal error has occurred.")
+        return _Simulation("", [], 0.0, 0.0, empty_usage, error, latency, model_name)
+
+    header = f"[RISPOSTA SIMULATA DAL MODULO 'google/generativeai.py' per il modello '{model_name}']"
+    if max_tokens is not None:
+        words = words[:max(0, max_tokens)]
+    # Un chunk per parola: il primo porta l'intestazione fissa.
+    chunks = [header] + [f" {w}" for w in words]
+    text = "".join(chunks)
+    chunk_delay = 1.0 / profile.tokens_per_second if profile.tokens_per_second > 0 else 0.0
+    usage = UsageMetadata(prompt_tokens, _estimate_tokens(header) + len(words), cached_tokens)
+    return _Simulation(text, chunks, latency, chunk_delay, usage, model_name=model_name)
+
+
+def _queue_delay(model_name: str, service_seconds: float) -> float:
+    """Prenota un posto del server simulato per `service_seconds` e restituisce l'attesa prima che si liberi."""
+    slots = _simulator.profile_for(model_name).server_slots
+    if slots <= 0:
+        return 0.0
+    now = time.monotonic()
+    with _slots_lock:
+        free_at = _slots_free_at.setdefault(model_name, [])
+        free_at.extend([now] * (slots - len(free_at)))
+        index = min(range(slots), key=free_at.__getitem__)
+        start = max(now, free_at[index])
+        free_at[index] = start + service_seconds
+    return start - now
+
+
+class MockResponse:
+    """Simula l'oggetto risposta dell'SDK (.text, .prompt_feedback, .usage_metadata)."""
+    def __init__(self, text: str, usage_metadata: UsageMetadata | None = None):
+        self.text = text
+        self.prompt_feedback = "SIMULATED_OK"
+        self.usage_metadata = usage_metadata
+
+
+class _StreamingResponse:
+    """Simula una risposta in streaming: iterabile (sync o async) di chunk con attributo .text."""
+    def __init__(self, plan: _Simulation, on_complete=None):
+        self._plan = plan
+        self._on_complete = on_complete
+        self.prompt_feedback = "SIMULATED_OK"
+        self.usage_metadata = plan.usage
+        self.text = ""
+
+    def _finish(self):
+        self.text = self._plan.text
+        if self._on_complete is not None:
+            self._on_complete(self._plan.text)
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._plan.chunks):
+            if i > 0 and self._plan.chunk_delay:
+                time.sleep(self._plan.chunk_delay)
+            yield MockResponse(chunk, self._plan.usage)
+        self._finish()
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self._plan.chunks):
+            if i > 0 and self._plan.chunk_delay:
+                await asyncio.sleep(self._plan.chunk_delay)
+            yield MockResponse(chunk, self._plan.usage)
+        self._finish()
+
+
+def _run_sync(plan: _Simulation, stream: bool, on_complete=None):
+    queued = _queue_delay(plan.model_name, plan.service_seconds)
+    if queued:
+        time.sleep(queued)
+    if plan.error is not None:
+        if plan.error_delay:
+            time.sleep(plan.error_delay)
+        raise plan.error
+    if plan.first_token_delay:
+        time.sleep(plan.first_token_delay)
+    if stream:
+        return _StreamingResponse(plan, on_complete)
+    if plan.chunk_delay:
+        time.sleep(plan.chunk_delay * (len(plan.chunks) - 1))
+    if on_complete is not None:
+        on_complete(plan.text)
+    return MockResponse(plan.text, plan.usage)
+
+
+async def _run_async(plan: _Simulation, stream: bool, on_complete=None):
+    queued = _queue_delay(plan.model_name, plan.service_seconds)
+    if queued:
+        await asyncio.sleep(queued)
+    if plan.error is not None:
+        await asyncio.sleep(plan.error_delay)
+        raise plan.error
+    await asyncio.sleep(plan.first_token_delay)
+    if stream:
+        return _StreamingResponse(plan, on_complete)
+    if plan.chunk_delay:
+        await asyncio.sleep(plan.chunk_delay * (len(plan.chunks) - 1))
+    if on_complete is not None:
+        on_complete(plan.text)
+    return MockResponse(plan.text, plan.usage)
+
+
+def _history_text(history: List[Dict[str, Any]]) -> str:
+    return "".join(str(part.get("text", "")) for message in history for part in message.get("parts", []))
+
+
+# --- Classi Simulate ---
+
+class CachedContent:
+    """Simula caching.CachedContent: istruzione di sistema e contenuti registrati una volta e richiamati per nome."""
+    _registry: Dict[str, "CachedContent"] = {}
+    _registry_lock = threading.Lock()
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, model: str, system_instruction: str, contents: List[Dict[str, Any]],
+                 expire_time: datetime, display_name: str = ""):
+        self.name = name
+        self.model = model
+        self.system_instruction = system_instruction
+        self.contents = contents
+        self.expire_time = expire_time
+        self.display_name = display_name
+        self.usage_metadata = UsageMetadata(_estimate_tokens(self.text), 0)
+
+    @property
+    def text(self) -> str:
+        """Testo complessivo del prefisso in cache, usato per stimarne i token."""
+        return self.system_instruction + _history_text(self.contents)
+
+    @property
+    def expired(self) -> bool:
+        return datetime.now(timezone.utc) >= self.expire_time
+
+    @classmethod
+    def create(cls, model: str, system_instruction: str | None = None, contents: List[Dict[str, Any]] | None = None,
+               ttl: timedelta | float | None = None, display_name: str | None = None) -> "CachedContent":
+        """Registra un nuovo contenuto in cache; `ttl` accetta un timedelta o dei secondi (default un'ora)."""
+        if ttl is None:
+            ttl = timedelta(hours=1)
+        elif not isinstance(ttl, timedelta):
+            ttl = timedelta(seconds=ttl)
+        name = f"cachedContents/shim-{next(cls._ids)}"
+        cached = cls(name, model, system_instruction or "", list(contents or []),
+                     datetime.now(timezone.utc) + ttl, display_name or "")
+        with cls._registry_lock:
+            cls._registry[name] = cached
+        logger.debug(f"Shim CachedContent: creato '{name}' per il modello '{model}'.")
+        return cached
+
+    @classmethod
+    def get(cls, name: str) -> "CachedContent":
+        with cls._registry_lock:
+            cached = cls._registry.get(name)
+        if cached is None or cached.expired:
+            raise NotFound(f"CachedContent not found: {name}")
+        return cached
+
+    @classmethod
+    def list(cls) -> List["CachedContent"]:
+        with cls._registry_lock:
+            return [cached for cached in cls._registry.values() if not cached.expired]
+
+    def update(self, ttl: timedelta | float):
+        if not isinstance(ttl, timedelta):
+            ttl = timedelta(seconds=ttl)
+        self.expire_time = datetime.now(timezone.utc) + ttl
+
+    def delete(self):
+        with self._registry_lock:
+            self._registry.pop(self.name, None)
+
+
+class CachingModule:
+    CachedContent = CachedContent
+
+caching = CachingModule()
+
+
+@dataclass
+class GenerationConfig:
+    """Simula la classe GenerationConfig."""
+    temperature: float = 0.8
+    max_output_tokens: int = 2048
+    response_mime_type: str = "text/plain"
+
+
+class GenerativeModel:
+    """Simula la classe GenerativeModel."""
+    def __init__(self, model_name: str, system_instruction: str = ""):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached_content: CachedContent | None = None
+        logger.debug(f"Shim GenerativeModel: istanziato per il modello '{model_name}'.")
+
+    @classmethod
+    def from_cached_content(cls, cached_content: CachedContent | str, generation_config: Any = None):
+        """Simula un modello che usa come prefisso un contenuto in cache."""
+        if isinstance(cached_content, str):
+            cached_content = CachedContent.get(cached_content)
+        model = cls(model_name=cached_content.model, system_instruction=cached_content.system_instruction)
+        model.cached_content = cached_content
+        return model
+
+    def start_chat(self, history: List[Dict[str, Any]]):
+        """Simula l'avvio di una sessione di chat."""
+        # Restituisce un'istanza di una classe di chat simulata e passa il nome del modello
+        return _SimulatedChatSession(
+            history=history, model_name=self.model_name, system_instruction=self.system_instruction,
+            cached_content=self.cached_content,
+        )
+
+    def _plan(self, prompt: str, generation_config: GenerationConfig) -> _Simulation:
+        if self.cached_content is None:
+            return _plan(self.model_name, self.system_instruction + str(prompt), generation_config)
+        if self.cached_content.expired:
+            raise NotFound(f"CachedContent not found: {self.cached_content.name}")
+        return _plan(self.model_name, str(prompt), generation_config, self.cached_content.text)
+
+    def generate_content(self, prompt: str, generation_config: GenerationConfig | None = None, stream: bool = False):
+        """Simula la generazione di contenuto basata su un prompt."""
+        if generation_config is None:
+            generation_config = GenerationConfig()
+        logger.info("Shim GenerativeModel: generate_content() chiamato. Restituzione di una risposta simulata.")
+        return _run_sync(self._plan(prompt, generation_config), stream)
+
+    async def generate_content_async(
+        self, prompt: str, generation_config: GenerationConfig | None = None, stream: bool = False
+    ):
+        """Simula la variante asincrona di generate_content."""
+        if generation_config is None:
+            generation_config = GenerationConfig()
+        return await _run_async(self._plan(prompt, generation_config), stream)
+
+
+class _SimulatedChatSession:
+    """Classe interna che simula una sessione di chat attiva."""
+    def __init__(self, history: List[Dict[str, Any]], model_name: str = "<unknown>", system_instruction: str = "",
+                 cached_content: CachedContent | None = None):
+        self._history = list(history)
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+
+    @property
+    def history(self) -> List[Dict[str, Any]]:
+        """Come nell'SDK, la cronologia cresce di una coppia utente/modello a ogni send_message riuscito."""
+        return self._history
+
+    def _plan(self, content: str, generation_config: GenerationConfig | None) -> _Simulation:
+        if self.cached_content is None:
+            prompt_text = self.system_instruction + _history_text(self._history) + content
+            return _plan(self.model_name, prompt_text, generation_config)
+        if self.cached_content.expired:
+            raise NotFound(f"CachedContent not found: {self.cached_content.name}")
+        return _plan(self.model_name, _history_text(self._history) + content, generation_config, self.cached_content.text)
+
+    def _append_turn(self, content: str):
+        def on_complete(text: str):
+            self._history.append({"role": "user", "parts": [{"text": content}]})
+            self._history.append({"role": "model", "parts": [{"text": text}]})
+        return on_complete
+
+    def send_message(
+        self,
+        content: str,
+        generation_config: GenerationConfig | None = None,
+        stream: bool = False,
+        request_options: Dict[str, Any] | None = None,
+    ):
+        """Simula l'invio di un messaggio e la ricezione di una risposta (`request_options` è accettato e ignorato)."""
+        logger.info("Shim _SimulatedChatSession: send_message() chiamato. Restituzione di una risposta simulata.")
+        return _run_sync(self._plan(content, generation_config), stream, self._append_turn(content))
+
+    async def send_message_async(
+        self,
+        content: str,
+        generation_config: GenerationConfig | None = None,
+        stream: bool = False,
+        request_options: Dict[str, Any] | None = None,
+    ):
+        """Simula ChatSession.send_message_async, rispettando latenze ed errori del profilo configurato.
+
+        `request_options` è accettato come nell'SDK; la scadenza è applicata dal chiamante.
+        """
+        return await _run_async(self._plan(content, generation_config), stream, self._append_turn(content))
+
+
+async def send_message_batch_async(requests: List[tuple], stream: bool = False) -> List[Any]:
+    """Invia in un'unica richiesta un messaggio per ciascuna sessione di chat, come un server locale con batching.
+
+    `requests` è una lista di tuple (sessione, messaggio, generation_config) dello stesso modello. Il batch occupa
+    un solo posto del server: il primo token arriva per tutti dopo la latenza più lunga, più `batch_item_seconds`
+    per ogni richiesta oltre la prima. Restituisce, nello stesso ordine, la risposta oppure l'eccezione di
+    ciascuna richiesta; le sessioni registrano lo scambio come con send_message_async.
+    """
+    if not requests:
+        return []
+    models = {chat.model_name.removeprefix("models/") for chat, _, _ in requests}
+    if len(models) != 1:
+        raise ValueError(f"Un batch deve contenere richieste per un solo modello, non {sorted(models)}.")
+    model_name = models.pop()
+    profile = _simulator.profile_for(model_name)
+    plans: List[Any] = []
+    for chat, content, generation_config in requests:
+        try:
+            plans.append(chat._plan(content, generation_config))
+        except GoogleAPICallError as e:
+            plans.append(e)
+    ok = [plan for plan in plans if isinstance(plan, _Simulation) and plan.error is None]
+    batch_cost = profile.batch_item_seconds * (len(requests) - 1)
+    first_token = max((plan.first_token_delay for plan in ok), default=0.0) + batch_cost
+    decode = max((plan.service_seconds - plan.first_token_delay for plan in ok), default=0.0)
+    queued = _queue_delay(model_name, first_token + decode)
+    await asyncio.sleep(queued + first_token)
+    logger.debug(f"Shim send_message_batch_async: batch di {len(requests)} richieste per '{model_name}'.")
+
+    results: List[Any] = []
+    for (chat, content, _), plan in zip(requests, plans):
+        if not isinstance(plan, _Simulation):
+            results.append(plan)
+        elif plan.error is not None:
+            results.append(plan.error)
+        elif stream:
+            results.append(_StreamingResponse(plan, chat._append_turn(content)))
+        else:
+            results.append(plan)
+    if not stream:
+        # Senza streaming le risposte arrivano tutte insieme, alla fine della più lunga.
+        if decode:
+            await asyncio.sleep(decode)
+        for index, ((chat, content, _), plan) in enumerate(zip(requests, results)):
+            if isinstance(plan, _Simulation):
+                chat._append_turn(content)(plan.text)
+                results[index] = MockResponse(plan.text, plan.usage)
+    return results
+
+
+# --- Sezione Tipi (per compatibilità) ---
+# Alcuni SDK hanno un sottomodulo 'types', lo simuliamo.
+class TypesModule:
+    GenerationConfig = GenerationConfig
+
+types = TypesModule()
+
+_load_profile_from_env()
@@ -1,10 +1,8 @@
 import argparse
-import copy
 import itertools
 import json
 import os
 import sys
-import time
 import traceback
 from datetime import timedelta
 from pathlib import Path
@@ -17,10 +15,6 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 # Defer importing 'rich' to a later try/except that provides a safe fallback when 'rich' is not installed.
 # The actual import (with fallback) appears further below in this file.
 
-from llm_conversation.config import load_config, AgentConfig
-from llm_conversation.ai_agent import AIAgent
-from llm_conversation.conversation_manager import ConversationManager
-from llm_conversation.logging_config import setup_logging, get_logger
 # Optional environment loader: provide a no-op fallback if the module is not available.
 try:
     import importlib
@@ -73,15 +67,23 @@ except Exception:
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 # Importa i moduli dell'applicazione
-from llm_conversation.config import load_config, Config as AppConfig
-from llm_conversation.ai_agent import AIAgent
-from llm_conversation.conversation_manager import ConversationManager
-from llm_conversation.logging_config import setup_logging, get_logger
+from llm_conversation.matrix_runner import MatrixSpec, RunOptions, add_run_arguments, run_matrix
 
 
 # --- Blocco 2: Dati Costanti della Simulazione ---
 # Questi dati definiscono lo spazio degli esperimenti. Incollare qui i contenuti completi.
 
+# Approccio di debriefing simulato da questo script (etichetta per metriche e statistiche).
+APPROACH = "A"
+
+# Frasi di congedo che chiudono la conversazione (se settings.allow_termination è attivo), per interlocutore:
+# stringhe confrontate senza distinzione di maiuscole oppure regex compilate. Quelle dell'Agente 2 valgono solo se
+# la configurazione lo include in settings.closing_speakers.
+TERMINATION_PHRASES = {
+    "agent1": ["goodbye", "concludes my report", "completes the debrief"],
+    "agent2": ["goodbye"],
+}
+
 # --- Agent 1 System Prompt (Static text used as default, formatted at runtime) ---
 AGENT_1_SYSTEM_PROMPT = """
 // SYSTEM PROMPT CONFIGURATION: SAIMA_TECHNICIAN_DEBRIEF_AI_V2.1
@@ -339,60 +341,21 @@ KNOWLEDGE_VARIABLES = [
         "prompt": """{ "holistic_understanding": { "problem_analysis": "The ticket is extremely vague: 'anomalous alarms.' Once on-site, the user can't give me precise details. The description is confusing, so I immediately rely on diagnostics. I connect with Iuppiter and the first thing I check is the weight page: it shows a perfect 0.00 kg. This immediately rules out any issue related to the weighing system. I know the turnstile has other safety systems, like transit photocells, which generate an alarm if they are obstructed for too long. I decide to observe a passage under real conditions. I notice an elderly user pausing for a moment inside, right in line with the photocells. Immediately, the turnstile locks and emits a voice message. There's the cause: the user mistook an 'abnormal presence' alarm for a weight alarm. The ticket era completamente fuorviante.", "expert_intuition_and_diagnosis": "This is a case where the diagnosis is not technical, but contextual. The system is not faulty; it is simply calibrated in a way that is unsuitable for the specific users. The photocell timeout is set to a standard that assumes a quick transit. In contexts like hospitals or nursing homes, where people move more slowly, this parameter is too restrictive and generates false alarms. an expert technician doesn't just say 'the machine works,' but understands the need to adapt parameters to the operating environment. This solution is not found in the 'troubleshooting' section of the manual but comes from understanding the customer's needs.", "solution_and_procedure": "The solution is a simple software modification. After identifying the problem by observing real use, I access the 'ED Setup Page - Master' in Iuppiter. I locate the parameter that manages the transit time, 'PARAM 1 – PHOTOCELLS TIME,' and increase its value from a standard 3 seconds to a more permissive 6 seconds. This change allows for a slower crossing without generating alarms. The test è immediate: I ask the same user to try again, and the transit occurs without any problems. I explain the change to the customer, who appreciates the personalized solution. The intervention is completed without touching a single physical component." } }"""
     },
 ]
-def run_single_conversation(config: AppConfig, output_path: Path, console: Console):
-    logger = get_logger(__name__)
-    try:
-        agents = [AIAgent(config=agent_config) for agent_config in config.agents]
-        manager = ConversationManager(agents=agents, initial_message=config.settings.initial_message)
-        list(manager.run_conversation())
-        manager.save_conversation(output_path)
-    except Exception as e:
-        logger.error(f"Errore irreversibile nella conversazione per {output_path.name}: {e}", exc_info=True)
-        console.print(f"[bold red]Errore nella conversazione per {output_path.name}: {e}[/bold red]")
-        # ... (logica di salvataggio dell'errore)
-
-def main(config_path: Path, output_dir: Path, dry_run: bool = False, limit: Optional[int] = None):
-    console = Console()
-    setup_logging() # Attiva il logging configurato nel .env
-    logger = get_logger(__name__)
-
-    if dry_run:
-        os.environ["LLM_CONVERSATION_DRY_RUN"] = "1"
-        console.print("[bold yellow]Modalità DRY-RUN attivata.[/bold yellow]")
-
-    try:
-        base_config = load_config(str(config_path))
-    except ValueError as e:
-        console.print(f"[bold red]Errore fatale: {e}[/bold red]"); return
+# Parti della matrice specifiche di questo approccio; esecuzione e opzioni comuni sono in matrix_runner.
+MATRIX = MatrixSpec(
+    approach=APPROACH,
+    agent1_prompt=AGENT_1_SYSTEM_PROMPT,
+    ticket_metadata=TICKET_METADATA,
+    termination_phrases=TERMINATION_PHRASES,
+)
+
 
+def main(config_path: Path, output_dir: Path, options: RunOptions | None = None, limit: Optional[int] = None):
     combinations = list(itertools.product(BEHAVIORAL_VARIABLES, KNOWLEDGE_VARIABLES))
     if limit is not None and 0 < limit < len(combinations):
         combinations = combinations[:limit]
 
-    total_conversations = len(combinations)
-    console.print(f"[bold cyan]Trovate {total_conversations} combinazioni uniche da generare.[/bold cyan]")
-
-    with Progress(console=console) as progress:
-        task = progress.add_task("[green]Generazione conversazioni...", total=total_conversations)
-        start_time_total = time.time()
-        for i, (behavior_dict, knowledge_dict) in enumerate(combinations):
-            current_config = copy.deepcopy(base_config)
-            behavior_name = behavior_dict["name"]
-            knowledge_name = knowledge_dict["name"]
-            context_key = knowledge_dict["context_key"]
-            ticket_info = TICKET_METADATA[context_key]
-            final_agent1_prompt = AGENT_1_SYSTEM_PROMPT.format(
-                ticket_id=ticket_info['ticket_id'], customer_problem=ticket_info['customer_problem']
-            )
-            final_agent2_prompt = behavior_dict["prompt"].format(knowledge=knowledge_dict["prompt"])
-            current_config.agents[0].system_prompt = final_agent1_prompt
-            current_config.agents[1].system_prompt = final_agent2_prompt
-            behavior_dir = output_dir / behavior_name
-            output_path = behavior_dir / f"{knowledge_name}.json"
-            run_single_conversation(current_config, output_path, console)
-            progress.update(task, advance=1)
-
-    console.print(f"\n[bold green]Operazione completata![/bold green]")
+    run_matrix(MATRIX, combinations, config_path, output_dir, options or RunOptions(), Console(), Progress)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Genera una matrice di conversazioni tra due LLM.")
@@ -401,5 +364,6 @@ if __name__ == "__main__":
     parser.add_argument("-o", "--output", type=Path, default="conversation_logs")
     parser.add_argument("--dry-run", action="store_true")
     parser.add_argument("--limit", type=int, default=None)
+    add_run_arguments(parser)
     args = parser.parse_args()
-    main(config_path=args.config, output_dir=args.output, dry_run=args.dry_run, limit=args.limit)
\ No newline at end of file
+    main(config_path=args.config, output_dir=args.output, options=RunOptions.from_args(args), limit=args.limit)
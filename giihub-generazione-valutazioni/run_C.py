@@ -1,10 +1,8 @@
 import argparse
-import copy
 import itertools
 import json
 import os
 import sys
-import time
 import traceback
 from datetime import timedelta
 from pathlib import Path
@@ -17,10 +15,6 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 # Defer importing 'rich' to a later try/except that provides a safe fallback when 'rich' is not installed.
 # The actual import (with fallback) appears further below in this file.
 
-from llm_conversation.config import load_config, AgentConfig
-from llm_conversation.ai_agent import AIAgent
-from llm_conversation.conversation_manager import ConversationManager
-from llm_conversation.logging_config import setup_logging, get_logger
 # Optional environment loader: provide a no-op fallback if the module is not available.
 try:
     import importlib
@@ -73,15 +67,23 @@ except Exception:
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 # Importa i moduli dell'applicazione
-from llm_conversation.config import load_config, Config as AppConfig
-from llm_conversation.ai_agent import AIAgent
-from llm_conversation.conversation_manager import ConversationManager
-from llm_conversation.logging_config import setup_logging, get_logger
+from llm_conversation.matrix_runner import MatrixSpec, RunOptions, add_run_arguments, run_matrix
 
 
 # --- Blocco 2: Dati Costanti della Simulazione ---
 # Questi dati definiscono lo spazio degli esperimenti. Incollare qui i contenuti completi.
 
+# Approccio di debriefing simulato da questo script (etichetta per metriche e statistiche).
+APPROACH = "C"
+
+# Frasi di congedo che chiudono la conversazione (se settings.allow_termination è attivo), per interlocutore:
+# stringhe confrontate senza distinzione di maiuscole oppure regex compilate. Quelle dell'Agente 2 valgono solo se
+# la configurazione lo include in settings.closing_speakers.
+TERMINATION_PHRASES = {
+    "agent1": ["goodbye", "concludes my report", "completes my report"],
+    "agent2": ["goodbye"],
+}
+
 # --- Agent 1 System Prompt (Static text used as default, formatted at runtime) ---
 AGENT_1_SYSTEM_PROMPT = """
 // SYSTEM PROMPT CONFIGURATION: FEW-SHOT PROACTIVE APPROACH
@@ -302,32 +304,16 @@ KNOWLEDGE_VARIABLES = [
     },
 ]
 
-def run_single_conversation(config: "AppConfig", output_path: Path, console: "Console"):
-    logger = get_logger(__name__)
-    try:
-        agents = [AIAgent(config=agent_config) for agent_config in config.agents]
-        manager = ConversationManager(agents=agents, initial_message=config.settings.initial_message)
-        list(manager.run_conversation())
-        manager.save_conversation(output_path)
-    except Exception as e:
-        logger.error(f"Errore irreversibile nella conversazione per {output_path.name}: {e}", exc_info=True)
-        console.print(f"[bold red]Errore nella conversazione per {output_path.name}: {e}[/bold red]")
-        # ... (logica di salvataggio dell'errore)
-
-def main(config_path: Path, output_dir: Path, dry_run: bool = False, limit: Optional[int] = None, last_two: bool = False):
-    console = Console()
-    setup_logging() # Attiva il logging configurato nel .env
-    logger = get_logger(__name__)
-
-    if dry_run:
-        os.environ["LLM_CONVERSATION_DRY_RUN"] = "1"
-        console.print("[bold yellow]Modalità DRY-RUN attivata.[/bold yellow]")
-
-    try:
-        base_config = load_config(str(config_path))
-    except ValueError as e:
-        console.print(f"[bold red]Errore fatale: {e}[/bold red]"); return
+# Parti della matrice specifiche di questo approccio; esecuzione e opzioni comuni sono in matrix_runner.
+MATRIX = MatrixSpec(
+    approach=APPROACH,
+    agent1_prompt=AGENT_1_SYSTEM_PROMPT,
+    ticket_metadata=TICKET_METADATA,
+    termination_phrases=TERMINATION_PHRASES,
+)
+
 
+def main(config_path: Path, output_dir: Path, options: RunOptions | None = None, limit: Optional[int] = None, last_two: bool = False):
     combinations = list(itertools.product(BEHAVIORAL_VARIABLES, KNOWLEDGE_VARIABLES))
 
     if last_two:
@@ -335,32 +321,7 @@ def main(config_path: Path, output_dir: Path, dry_run: bool = False, limit: Opti
     elif limit is not None and 0 < limit < len(combinations):
         combinations = combinations[:limit]
 
-    total_conversations = len(combinations)
-    console.print(f"[bold cyan]Trovate {total_conversations} combinazioni uniche da generare.[/bold cyan]")
-
-    with Progress(console=console) as progress:
-        task = progress.add_task("[green]Generazione conversazioni...", total=total_conversations)
-        # ... (il resto della funzione main rimane identico alla versione che ti ho già fornito)
-        start_time_total = time.time()
-        for i, (behavior_dict, knowledge_dict) in enumerate(combinations):
-            current_config = copy.deepcopy(base_config)
-            behavior_name = behavior_dict["name"]
-            knowledge_name = knowledge_dict["name"]
-            context_key = knowledge_dict["context_key"]
-            ticket_info = TICKET_METADATA[context_key]
-            final_agent1_prompt = AGENT_1_SYSTEM_PROMPT.format(
-                ticket_id=ticket_info['ticket_id'], customer_problem=ticket_info['customer_problem']
-            )
-            final_agent2_prompt = behavior_dict["prompt"].format(knowledge=knowledge_dict["prompt"])
-            current_config.agents[0].system_prompt = final_agent1_prompt
-            current_config.agents[1].system_prompt = final_agent2_prompt
-            behavior_dir = output_dir / behavior_name
-            output_path = behavior_dir / f"{knowledge_name}.json"
-            run_single_conversation(current_config, output_path, console)
-            progress.update(task, advance=1)
-            # ... (logica di aggiornamento ETA)
-
-    console.print(f"\n[bold green]Operazione completata![/bold green]")
+    run_matrix(MATRIX, combinations, config_path, output_dir, options or RunOptions(), Console(), Progress)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Esegui il generatore di conversazioni.")
@@ -370,5 +331,6 @@ if __name__ == "__main__":
     parser.add_argument("--limit", type=int, help="Limita il numero di conversazioni generate.")
     parser.add_argument("--last-two", action="store_true", help="Genera solo le ultime due conversazioni.")
 
+    add_run_arguments(parser)
     args = parser.parse_args()
-    main(config_path=args.config, output_dir=args.output, dry_run=args.dry_run, limit=args.limit, last_two=args.last_two)
\ No newline at end of file
+    main(config_path=args.config, output_dir=args.output, options=RunOptions.from_args(args), limit=args.limit, last_two=args.last_two)
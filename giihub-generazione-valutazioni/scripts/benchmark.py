@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""End-to-end throughput benchmark of the run_A/run_B/run_C conversation matrix against the local shim.
+
+The model is always the local `google/generativeai.py` shim, driven by a fixed latency profile
+(`scripts/benchmark_profile.json` by default), so results are comparable between commits. The report is written as
+JSON and contains conversations/minute, turns/second, turn latency percentiles, peak RSS and per-stage time splits.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PROFILE = Path(__file__).resolve().parent / "benchmark_profile.json"
+APPROACHES = {"A": "run_A", "B": "run_B", "C": "run_C"}
+STAGES = ("render", "agent_init", "conversation", "save")
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Return the `q`-th percentile (0-100) of `values` using linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of this process, in MB."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def git_revision() -> str | None:
+    """Return the current git commit, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkStats:
+    """Thread-safe accumulator of timings collected while the matrix runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.turn_latencies: list[float] = []
+        self.conversations = 0
+        self.failures = 0
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    def add_conversation(self, turn_latencies: list[float]) -> None:
+        with self._lock:
+            self.turn_latencies.extend(turn_latencies)
+            self.conversations += 1
+
+    def add_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+
+def main() -> None:
+    """Run the benchmark and write the JSON report."""
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end della matrice di conversazioni sullo shim.")
+    parser.add_argument("-c", "--config", type=Path, default=ROOT / "config_matrix.json")
+    parser.add_argument("--approaches", default="ABC", help="Approcci da eseguire (sottoinsieme di 'ABC').")
+    parser.add_argument("--profile", type=Path, default=DEFAULT_PROFILE, help="Profilo di latenza dello shim.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="Numero di ripetizioni della matrice per approccio.")
+    parser.add_argument("--limit", type=int, default=None, help="Limita le combinazioni per approccio.")
+    parser.add_argument("--report", type=Path, default=None, help="Percorso del report JSON.")
+    args = parser.parse_args()
+
+    # Il profilo va impostato prima che lo shim venga importato dai moduli run_*.
+    os.environ["GENAI_SHIM_PROFILE"] = str(args.profile)
+    os.environ.pop("LLM_CONVERSATION_DRY_RUN", None)
+    sys.path.insert(0, str(ROOT / "src"))
+    sys.path.insert(0, str(ROOT))
+
+    import itertools
+
+    from llm_conversation.ai_agent import AIAgent
+    from llm_conversation.config import load_config
+    from llm_conversation.conversation_manager import ConversationManager
+    from llm_conversation.matrix_runner import MatrixJob, build_jobs, run_jobs
+    from llm_conversation.rate_limiter import get_rate_limiter
+    from llm_conversation.termination import TerminationEngine
+
+    base_config = load_config(str(args.config))
+    get_rate_limiter().configure(base_config.rate_limits)
+    stats = BenchmarkStats()
+    per_approach: dict[str, dict[str, Any]] = {}
+
+    def run_job(job: MatrixJob, termination_phrases: dict) -> None:
+        try:
+            started = time.perf_counter()
+            agents = [AIAgent(config=agent_config) for agent_config in job.config.agents]
+            manager = ConversationManager(
+                agents=agents,
+                initial_message=job.config.settings.initial_message,
+                termination=TerminationEngine.from_settings(job.config.settings, termination_phrases),
+            )
+            stats.add_stage("agent_init", time.perf_counter() - started)
+
+            started = time.perf_counter()
+            turn_latencies = []
+            previous = started
+            for _ in manager.run_conversation():
+                now = time.perf_counter()
+                turn_latencies.append(now - previous)
+                previous = now
+            stats.add_stage("conversation", time.perf_counter() - started)
+
+            started = time.perf_counter()
+            manager.save_conversation(job.output_path)
+            stats.add_stage("save", time.perf_counter() - started)
+            stats.add_conversation(turn_latencies)
+        except Exception as e:
+            stats.add_failure()
+            print(f"Errore nella conversazione {job.output_path}: {e}", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix="llm-benchmark-") as tmp:
+        output_root = Path(tmp)
+        wall_started = time.perf_counter()
+        for approach in args.approaches:
+            module = importlib.import_module(APPROACHES[approach])
+            combinations = list(itertools.product(module.BEHAVIORAL_VARIABLES, module.KNOWLEDGE_VARIABLES))
+            if args.limit is not None and 0 < args.limit < len(combinations):
+                combinations = combinations[: args.limit]
+
+            started = time.perf_counter()
+            jobs = []
+            for repetition in range(args.repeat):
+                jobs.extend(
+                    build_jobs(
+                        base_config,
+                        combinations,
+                        module.AGENT_1_SYSTEM_PROMPT,
+                        module.TICKET_METADATA,
+                        output_root / approach / str(repetition),
+                    )
+                )
+            stats.add_stage("render", time.perf_counter() - started)
+
+            approach_started = time.perf_counter()
+            run_jobs(jobs, lambda job: run_job(job, module.TERMINATION_PHRASES), workers=args.workers)
+            per_approach[approach] = {"conversations": len(jobs), "seconds": time.perf_counter() - approach_started}
+        wall_seconds = time.perf_counter() - wall_started
+
+    turns = len(stats.turn_latencies)
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "parameters": {
+            "approaches": args.approaches,
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "limit": args.limit,
+            "profile": json.loads(args.profile.read_text(encoding="utf-8")),
+        },
+        "conversations": stats.conversations,
+        "failures": stats.failures,
+        "turns": turns,
+        "wall_seconds": wall_seconds,
+        "conversations_per_minute": stats.conversations / wall_seconds * 60 if wall_seconds else 0.0,
+        "turns_per_second": turns / wall_seconds if wall_seconds else 0.0,
+        "turn_latency_seconds": {
+            "p50": percentile(stats.turn_latencies, 50),
+            "p95": percentile(stats.turn_latencies, 95),
+            "p99": percentile(stats.turn_latencies, 99),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        # Somma dei tempi per fase su tutte le conversazioni: con più worker può superare wall_seconds.
+        "stage_seconds": stats.stage_seconds,
+        "approaches": per_approach,
+    }
+
+    report_path = args.report or ROOT / "benchmark_results" / f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(report, indent=4), encoding="utf-8")
+
+    print(
+        f"{stats.conversations} conversazioni ({stats.failures} fallite), {turns} turni in {wall_seconds:.1f}s: "
+        f"{report['conversations_per_minute']:.1f} conv/min, {report['turns_per_second']:.1f} turni/s, "
+        f"p50/p95/p99 {report['turn_latency_seconds']['p50']:.3f}/{report['turn_latency_seconds']['p95']:.3f}/"
+        f"{report['turn_latency_seconds']['p99']:.3f}s, RSS max {report['peak_rss_mb']:.0f} MB"
+    )
+    print(f"Report scritto in {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,237 @@
 # File: src/llm_conversation/ai_agent.py
 import os
-import concurrent.futures
+import asyncio
+import contextlib
+import re
 import time
-from typing import List, Dict, Any, Iterator
+from typing import List, Dict, Any, Iterator, AsyncIterator
 import google.generativeai as genai
+from .async_utils import iterate_sync
+from .cassette import get_cassette_player, get_cassette_recorder
 from .config import AgentConfig
+from .context_window import compact_messages, estimate_tokens
+from .concurrency import get_concurrency_controller
+from .errors import EmptyResponseError, ModelTimeoutError, RateLimitError, classify_exception, is_overload
+from .hedging import get_hedger
 from .logging_config import get_logger
+from .model_pool import get_model_pool
+from .rate_limiter import get_rate_limiter
+from .request_executor import get_request_executor
+from .response_cache import ResponseCache, chain_hash, get_response_cache, sha256_text
+from .retry import get_retry_policy
+from .wavefront import get_wavefront_batcher
 
 logger = get_logger(__name__)
 
+
+_SENTENCE_END = re.compile(r"[.!?\n]")
+
+
+def _cut_index(text: str, stop_patterns: tuple[re.Pattern, ...]) -> int | None:
+    """Posizione in cui troncare `text`: fine della frase con la prima frase di chiusura, se è già completa."""
+    ends = [match.end() for match in (pattern.search(text) for pattern in stop_patterns) if match]
+    if not ends:
+        return None
+    sentence_end = _SENTENCE_END.search(text, min(ends))
+    return sentence_end.end() if sentence_end else None
+
+
 class AIAgent:
     def __init__(self, config: AgentConfig):
+        self.config = config
         self.name = config.name
         self.model_name = config.model
         self.system_prompt = config.system_prompt
         self.temperature = config.temperature
         self.ctx_size = config.ctx_size
+        self.history_budget = config.history_budget
+        self.history_policy = config.history_policy
         self.genai_model = None
+        # Messaggi iniziali di _messages già presenti nella cache di contesto del modello (non vanno rinviati).
+        self._cached_messages = 0
         self._messages: List[Dict[str, Any]] = []
+        # Sessione di chat live: a ogni turno le si invia solo il nuovo messaggio, invece di ricostruire
+        # l'intera cronologia. _synced conta i messaggi di _messages già presenti nella sessione.
+        self._chat = None
+        self._synced = 0
+        self._pending_reply: str | None = None
+        # Hash incrementali usati come chiave della cache delle risposte.
+        self._system_prompt_hash = sha256_text(self.system_prompt or "")
+        self._hash_chain: List[str] = []
+        # Indice del campione: rami diversi della stessa conversazione (vedi ConversationManager.branch) usano
+        # indici diversi, così cache e cassette non restituiscono a tutti la stessa risposta.
+        self.sample = 0
+        # Frasi di chiusura: lo streaming si interrompe alla fine della frase che ne contiene una.
+        self.stop_patterns: tuple[re.Pattern, ...] = ()
+        # Misure dell'ultima chiamata (tempi, token, tentativi), lette dal ConversationManager dopo ogni turno.
+        self.last_call: Dict[str, Any] = {}
 
         # Aggiungi il prompt di sistema come primo messaggio
         if self.system_prompt:
             self._messages.append({"role": "system", "content": self.system_prompt})
 
-        if os.environ.get("GOOGLE_API_KEY"):
-            genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
-
         self._initialize_model()
 
     def _initialize_model(self):
         if os.getenv("LLM_CONVERSATION_DRY_RUN", "0").lower() in ("1", "true"): return
         try:
-            self.genai_model = genai.GenerativeModel(
-                model_name=self.model_name,
-                system_instruction=self.system_prompt
-            )
+            self._acquire_model()
             logger.info(f"Agente '{self.name}': Modello '{self.model_name}' inizializzato.")
         except Exception as e:
             logger.error(f"Agente '{self.name}': Fallita inizializzazione del modello. Errore: {e}")
             self.genai_model = None
 
+    def _acquire_model(self):
+        """Prende dal pool il modello condiviso per (modello, prompt di sistema) tra tutte le conversazioni."""
+        pooled = get_model_pool().get(self.model_name, self.system_prompt)
+        self.genai_model = pooled.model
+        self._cached_messages = pooled.cached_messages
+
+    async def _aacquire_model(self):
+        """Variante di `_acquire_model` per l'event loop: la creazione di una cache di contesto avviene in un thread."""
+        pooled = await get_model_pool().aget(self.model_name, self.system_prompt)
+        self.genai_model = pooled.model
+        self._cached_messages = pooled.cached_messages
+
     def add_message(self, role: str, content: str):
+        # La risposta appena generata è già nella cronologia della sessione. Se invece viene registrato un
+        # messaggio diverso, la sessione non è più allineata e verrà ricostruita al prossimo turno.
+        if self._synced > len(self._messages) and not (role == "model" and content == self._pending_reply):
+            self._synced = len(self._messages)
+        self._pending_reply = None
         self._messages.append({"role": role, "content": content})
 
+    def clone(self) -> "AIAgent":
+        """Nuovo agente con la stessa configurazione e una copia della cronologia, indipendente da questo."""
+        agent = AIAgent(self.config)
+        agent.load_state(self.get_state())
+        agent.stop_patterns = self.stop_patterns
+        agent.sample = self.sample
+        return agent
+
+    def get_state(self) -> Dict[str, Any]:
+        """Stato serializzabile dell'agente: la cronologia dei messaggi (prompt di sistema compreso)."""
+        return {"messages": [dict(message) for message in self._messages]}
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        """Ripristina una cronologia salvata con `get_state`; la sessione di chat viene ricostruita al prossimo invio."""
+        self._messages = [dict(message) for message in state["messages"]]
+        self._chat = None
+        self._synced = 0
+        self._pending_reply = None
+        self._hash_chain = []
+
+    @staticmethod
+    def _to_gemini(message: Dict[str, Any]) -> Dict[str, Any]:
+        role = "model" if message["role"] == "model" else "user"
+        return {"role": role, "parts": [{"text": str(message["content"])}]}
+
+    async def _aprepare_chat(self) -> str:
+        """Restituisce il testo da inviare, ricostruendo la sessione solo quando non è allineata a _messages."""
+        if self.genai_model is None:
+            raise ValueError("Il modello genai_model non è stato inizializzato.")
+        pending = self._messages[self._synced:]
+        if self._chat is None or len(pending) != 1 or pending[0]["role"] == "model":
+            # Il pool ricrea la cache di contesto in scadenza: si riprende il modello a ogni ricostruzione.
+            await self._aacquire_model()
+            self._chat = self.genai_model.start_chat(history=self._gemini_history())
+            self._synced = len(self._messages) - 1
+        return self._to_gemini(self._messages[-1])["parts"][0]["text"]
+
+    def _gemini_history(self) -> List[Dict[str, Any]]:
+        """Cronologia per start_chat: tutti i messaggi tranne l'ultimo, esclusi quelli già nella cache di contesto."""
+        skip = 0
+        if self._messages[0]["role"] == "system" and len(self._messages) > self._cached_messages:
+            skip = self._cached_messages
+        gemini_history = [self._to_gemini(message) for message in self._messages[skip:]]
+        if not gemini_history:
+            raise ValueError("La lista gemini_history è vuota. Impossibile eseguire pop().")
+        gemini_history.pop()
+        return gemini_history
+
+    def _apply_history_budget(self) -> None:
+        """Mantiene la cronologia entro il budget di token, compattando i turni più vecchi."""
+        if self.history_budget is None:
+            return
+        compacted = compact_messages(self._messages, self.history_budget, self.history_policy)
+        if compacted is None:
+            return
+        logger.debug(
+            f"Agente '{self.name}': cronologia compattata da {len(self._messages)} a {len(compacted)} messaggi "
+            f"(politica '{self.history_policy}')."
+        )
+        self._messages = compacted
+        # La cronologia è cambiata: hash e sessione di chat vanno ricostruiti al prossimo invio.
+        self._hash_chain = []
+        self._chat = None
+        self._synced = 0
+
+    def _history_digest(self) -> str:
+        """Hash dell'intera cronologia, esteso solo con i messaggi aggiunti dall'ultima chiamata."""
+        while len(self._hash_chain) < len(self._messages):
+            message = self._messages[len(self._hash_chain)]
+            previous = self._hash_chain[-1] if self._hash_chain else ""
+            self._hash_chain.append(chain_hash(previous, message["role"], str(message["content"])))
+        return self._hash_chain[-1] if self._hash_chain else ""
+
+    def _request_key(self) -> str:
+        """Chiave che identifica la richiesta corrente, condivisa da cache e cassette."""
+        history_hash = self._history_digest()
+        if self.sample:
+            history_hash = chain_hash(history_hash, "sample", str(self.sample))
+        return ResponseCache.make_key(
+            self.model_name, self.temperature, self.ctx_size, self._system_prompt_hash, history_hash
+        )
+
     def get_response(self) -> Iterator[str]:
+        """Variante sincrona di `aget_response`, eseguita sull'event loop condiviso del processo."""
+        yield from iterate_sync(self.aget_response())
+
+    async def aget_response(self) -> AsyncIterator[str]:
+        call: Dict[str, Any] = {
+            "request_start": time.time(),
+            "request_end": None,
+            "latency_seconds": None,
+            "ttft_seconds": None,
+            "prompt_tokens": None,
+            "output_tokens": None,
+            "cached_tokens": None,
+            "retries": 0,
+            "source": None,
+            "history_tokens": None,
+            "stopped_early": None,
+            "rate_limit_wait_seconds": 0.0,
+            "hedged": False,
+            "hedge_won": False,
+            "batch_size": None,
+        }
+        self.last_call = call
+        started = time.perf_counter()
+        try:
+            async for chunk in self._agenerate(call):
+                if call["ttft_seconds"] is None:
+                    call["ttft_seconds"] = time.perf_counter() - started
+                yield chunk
+        finally:
+            call["request_end"] = time.time()
+            call["latency_seconds"] = time.perf_counter() - started
+
+    async def _agenerate(self, call: Dict[str, Any]) -> AsyncIterator[str]:
         if not self._messages:
             logger.warning(f"Agente '{self.name}': Nessun messaggio nella lista _messages. Impossibile generare una risposta.")
             yield f"[ERRORE: Nessun messaggio disponibile per l'agente {self.name}]"; return
 
+        self._apply_history_budget()
+        call["history_tokens"] = sum(estimate_tokens(str(message["content"])) for message in self._messages)
+
+        # In riproduzione la risposta arriva dalla cassetta, senza rete né modello.
+        player = get_cassette_player()
+        if player is not None:
+            call["source"] = "replay"
+            yield await player.aplay(self._request_key()); return
+
         if os.getenv("LLM_CONVERSATION_DRY_RUN", "0").lower() in ("1", "true") or not self.genai_model:
+            call["source"] = "dry_run"
             yield f"[RISPOSTA SIMULATA per {self.name}]"; return
 
         generation_config = genai.types.GenerationConfig(
@@ -59,32 +242,226 @@ class AIAgent:
         except ValueError:
             raise ValueError("GEMINI_API_TIMEOUT deve essere un numero intero valido.")
 
-        def api_call_wrapper():
-            gemini_history = []
-            for message in self._messages:
-                role = "model" if message["role"] == "model" else "user"
-                gemini_history.append({"role": role, "parts": [{"text": str(message["content"])}]})
-            
-            if not gemini_history:
-                raise ValueError("La lista gemini_history è vuota. Impossibile eseguire pop().")
-            last_message = gemini_history.pop()["parts"][0]["text"]
-            if self.genai_model is None:
-                raise ValueError("Il modello genai_model non è stato inizializzato.")
-            chat = self.genai_model.start_chat(history=gemini_history)
-            return chat.send_message(last_message, generation_config=generation_config)
+        rate_limiter = get_rate_limiter()
 
-        try:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(api_call_wrapper)
-                response = future.result(timeout=timeout_seconds)
+        reserved_tokens = call["history_tokens"]
+
+        @contextlib.asynccontextmanager
+        async def model_slot() -> AsyncIterator[Dict[str, float]]:
+            """Posto per una richiesta al modello: capacità del rate limiter e, se attivo, del controllore adattivo.
+
+            Chi lo usa registra in `slot["latency"]` la latenza al primo token, da cui il controllore impara.
+            """
+            # Prima della chiamata si prenota la capacità del modello (richieste e token al minuto); il consumo
+            # reale di token viene riallineato quando arriva la risposta.
+            call["rate_limit_wait_seconds"] += await rate_limiter.acquire(self.model_name, reserved_tokens)
+            controller = get_concurrency_controller()
+            if controller is None:
+                yield {"sent": time.perf_counter()}
+                return
+            # Il controllore adattivo limita le chiamate in volo e impara dalla latenza al primo token e dagli errori.
+            await controller.acquire()
+            slot = {"sent": time.perf_counter()}
+            overloaded = False
+            try:
+                yield slot
+            except Exception as e:
+                overloaded = is_overload(classify_exception(e, self.name))
+                raise
+            finally:
+                controller.release(slot.get("latency"), overloaded)
+
+        async def stream_model() -> AsyncIterator[str]:
+            last_message = await self._aprepare_chat()
+            chat = self._chat
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout_seconds
+            executor = get_request_executor()
+            # L'SDK espone send_message_async: nessun thread occupato mentre la richiesta è in volo.
+            # Per backend che offrono solo la variante bloccante si usa l'executor condiviso del processo,
+            # che rilascia il chiamante alla scadenza anche se il thread è ancora occupato.
+            send_message_async = getattr(chat, "send_message_async", None)
+            # Come nell'SDK, la scadenza vale per l'intera richiesta: i backend HTTP la applicano a ogni lettura.
+            request_options = {"timeout": timeout_seconds}
+            if send_message_async is not None:
+                batcher = get_wavefront_batcher()
+                hedger = get_hedger()
+                if batcher is not None and batcher.supports(self.model_name):
+                    # Modalità a ondate: il messaggio parte nello stesso batch dei turni in attesa degli altri dialoghi.
+                    response, call["batch_size"] = await asyncio.wait_for(
+                        batcher.submit(self.model_name, chat, last_message, generation_config),
+                        timeout=timeout_seconds,
+                    )
+                elif hedger is None:
+                    response = await asyncio.wait_for(
+                        send_message_async(
+                            last_message,
+                            generation_config=generation_config,
+                            stream=True,
+                            request_options=request_options,
+                        ),
+                        timeout=timeout_seconds,
+                    )
+                else:
+                    hedge_chat = None
+
+                    async def backup():
+                        # La copia usa una sessione nuova con la stessa cronologia e passa dallo stesso varco delle
+                        # altre chiamate. Occupa il suo posto solo finché è in gara: se vince, il resto della risposta
+                        # arriva nel posto della chiamata originale, che resta occupato fino alla fine dello stream.
+                        nonlocal hedge_chat
+                        call["hedged"] = True
+                        async with model_slot() as slot:
+                            hedge_chat = self.genai_model.start_chat(history=self._gemini_history())
+                            response = await hedge_chat.send_message_async(
+                                last_message,
+                                generation_config=generation_config,
+                                stream=True,
+                                request_options={"timeout": deadline - loop.time()},
+                            )
+                            slot["latency"] = time.perf_counter() - slot["sent"]
+                            return response
 
-            if hasattr(response, "text") and response.text:
-                yield response.text
+                    async def primary():
+                        return await send_message_async(
+                            last_message,
+                            generation_config=generation_config,
+                            stream=True,
+                            request_options=request_options,
+                        )
+
+                    response, call["hedge_won"] = await asyncio.wait_for(
+                        hedger.race(self.model_name, primary, backup),
+                        timeout=timeout_seconds,
+                    )
+                    if call["hedge_won"]:
+                        # Lo scambio è registrato nella sessione della copia, che diventa quella dell'agente.
+                        self._chat = hedge_chat
+                stream = aiter(response)
+
+                async def next_chunk():
+                    # Ogni lettura ha come limite il tempo rimasto alla richiesta, non un timeout nuovo.
+                    return await asyncio.wait_for(anext(stream), timeout=deadline - loop.time())
             else:
-                feedback = getattr(response, 'prompt_feedback', 'N/A')
-                yield f"[RISPOSTA VUOTA O BLOCCATA: {feedback}]"
-        except concurrent.futures.TimeoutError:
-            yield f"[ERRORE: TIMEOUT per l'agente {self.name}]"
-        except Exception as e:
-            logger.error(f"Agente '{self.name}': Errore API: {e}")
-            yield f"[ERRORE API per l'agente {self.name}: {e}]"
\ No newline at end of file
+                response = await executor.acall(
+                    chat.send_message, last_message, generation_config=generation_config, stream=True,
+                    timeout=timeout_seconds,
+                )
+                sync_stream = iter(response)
+
+                async def next_chunk():
+                    # next() non può sollevare StopIteration dentro un Future: si usa un valore sentinella.
+                    chunk = await executor.acall(next, sync_stream, None, timeout=deadline - loop.time())
+                    if chunk is None:
+                        raise StopAsyncIteration
+                    return chunk
+
+            text = ""
+            try:
+                while True:
+                    try:
+                        chunk = await next_chunk()
+                    except StopAsyncIteration:
+                        break
+                    try:
+                        chunk_text = chunk.text
+                    except ValueError:
+                        # Chunk senza testo (per esempio solo metadati di sicurezza).
+                        continue
+                    if not chunk_text:
+                        continue
+                    previous = len(text)
+                    text += chunk_text
+                    cut = _cut_index(text, self.stop_patterns)
+                    if cut is not None:
+                        call["stopped_early"] = "stop_phrase"
+                    elif estimate_tokens(text) > self.ctx_size:
+                        call["stopped_early"] = "output_cap"
+                        cut = len(text)
+                    if cut is not None:
+                        # Il resto della risposta non viene letto: la sessione non ha registrato lo scambio
+                        # e va ricostruita al prossimo turno.
+                        self._chat = None
+                        text = text[:cut]
+                        if cut > previous:
+                            yield text[previous:]
+                        break
+                    yield chunk_text
+            finally:
+                # Una risposta abbandonata a metà (frase di chiusura, limite di output, scadenza) si chiude subito:
+                # per i backend HTTP la connessione viene scartata invece di restare aperta fino al garbage collector.
+                close = getattr(response, "close", None)
+                if close is not None:
+                    close()
+
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                call["prompt_tokens"] = getattr(usage, "prompt_token_count", None)
+                call["output_tokens"] = getattr(usage, "candidates_token_count", None)
+                call["cached_tokens"] = getattr(usage, "cached_content_token_count", None)
+                if call["prompt_tokens"] is not None:
+                    rate_limiter.record_usage(
+                        self.model_name, reserved_tokens, call["prompt_tokens"] + (call["output_tokens"] or 0)
+                    )
+            if not text.strip():
+                raise EmptyResponseError(self.name, getattr(response, 'prompt_feedback', 'N/A'))
+            if call["stopped_early"] is None:
+                # La sessione contiene ora anche questo scambio; si attende che il chiamante registri la risposta.
+                self._synced = len(self._messages) + 1
+                self._pending_reply = text
+
+        cache = get_response_cache()
+        recorder = get_cassette_recorder()
+        key = self._request_key() if cache is not None or recorder is not None else ""
+        async def call_model() -> AsyncIterator[str]:
+            async with model_slot() as slot:
+                async for chunk in stream_model():
+                    slot.setdefault("latency", time.perf_counter() - slot["sent"])
+                    yield chunk
+
+        policy = get_retry_policy()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            cached = False
+            parts: List[str] = []
+            try:
+                if cache is None:
+                    async for chunk in call_model():
+                        parts.append(chunk)
+                        yield chunk
+                else:
+                    async for chunk, cached in cache.astream_or_compute(key, self.model_name, call_model):
+                        parts.append(chunk)
+                        yield chunk
+                    if cached:
+                        logger.debug(f"Agente '{self.name}': risposta servita dalla cache.")
+                break
+            except Exception as e:
+                # Dopo un errore lo stato della sessione non è affidabile: viene ricostruita al prossimo invio.
+                self._chat = None
+                error = (
+                    ModelTimeoutError(self.name, timeout_seconds)
+                    if isinstance(e, asyncio.TimeoutError)
+                    else classify_exception(e, self.name)
+                )
+                if isinstance(error, RateLimitError) and error.retry_after:
+                    # La pausa chiesta dal server vale per tutti gli agenti che usano lo stesso modello.
+                    rate_limiter.honour_retry_after(self.model_name, error.retry_after)
+                # Una risposta già in parte inoltrata al chiamante non può essere ripetuta.
+                if parts or not error.retryable or attempt + 1 >= policy.max_attempts:
+                    call["source"] = "error"
+                    logger.error(f"{error} (tentativi: {attempt + 1})")
+                    raise error from e
+                delay = policy.delay(attempt, error.retry_after)
+                attempt += 1
+                call["retries"] = attempt
+                logger.warning(f"{error}. Nuovo tentativo {attempt + 1}/{policy.max_attempts} tra {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+        call["source"] = "cache" if cached else "model"
+        if recorder is not None:
+            await recorder.arecord(
+                key, self.name, self.model_name, "".join(parts), time.perf_counter() - started,
+                "cache" if cached else "model",
+            )
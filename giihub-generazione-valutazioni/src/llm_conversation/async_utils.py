@@ -0,0 +1,56 @@
+"""Utility per esporre le API asincrone anche a chiamanti sincroni."""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Iterator
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def _shared_loop() -> asyncio.AbstractEventLoop:
+    """Restituisce l'event loop del processo, avviandolo su un thread daemon alla prima chiamata.
+
+    Tutte le chiamate sincrone, da qualsiasi thread, girano su questo unico loop. I client asincroni dell'SDK
+    (per esempio i canali grpc.aio di google.generativeai) sono legati al loop su cui vengono creati e non
+    possono essere condivisi tra più loop, come accadrebbe con un loop per thread e `--workers N`.
+
+    Di conseguenza il codice che gira sul loop non deve mai bloccare: una lettura SQLite o una chiamata di rete
+    sincrona fermerebbe tutte le conversazioni in corso. Le operazioni bloccanti passano da `asyncio.to_thread`
+    (I/O locale) o dall'executor delle richieste (chiamate al modello).
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+async def _next[T](agen: AsyncIterator[T]) -> T:
+    return await anext(agen)
+
+
+def iterate_sync[T](agen: AsyncIterator[T]) -> Iterator[T]:
+    """Consuma un generatore asincrono da codice sincrono, un elemento alla volta, sull'event loop del processo.
+
+    Non può essere usato dall'interno di quel loop: in quel caso va usata direttamente la variante `a*` dell'API.
+    """
+    loop = _shared_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("iterate_sync chiamato dall'event loop condiviso: usare la variante asincrona dell'API.")
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(_next(agen), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(agen, "aclose", None)
+        if aclose is not None:
+            asyncio.run_coroutine_threadsafe(aclose(), loop).result()
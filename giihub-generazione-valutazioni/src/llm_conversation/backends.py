@@ -0,0 +1,634 @@
+"""Backend dei modelli (Gemini, server compatibili OpenAI, Ollama) con connessioni HTTP persistenti condivise."""
+
+import asyncio
+import concurrent.futures
+import http.client
+import json
+import os
+import ssl
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+from urllib.parse import urlsplit
+
+import google.generativeai as genai
+
+from .logging_config import get_logger
+from .request_executor import get_request_executor
+
+logger = get_logger(__name__)
+
+DEFAULT_OPENAI_BASE_URL = "http://localhost:8000/v1"
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+DEFAULT_MAX_IDLE = 32
+DEFAULT_HTTP_TIMEOUT = 60.0
+
+# Errori di una connessione riusata che il server ha chiuso mentre era inattiva: la richiesta non è stata
+# elaborata e può essere ripetuta su una connessione nuova.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class BackendHTTPError(Exception):
+    """Risposta HTTP di errore da un backend; `code` e `retry_after` sono letti da classify_exception."""
+
+    def __init__(self, code: int, message: str, retry_after: float | None = None):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+
+class ConnectionPool:
+    """Connessioni HTTP keep-alive condivise dal processo, riusate tra le chiamate allo stesso host.
+
+    Una connessione torna nel pool solo dopo che la risposta è stata letta fino in fondo e il server non ha chiesto
+    di chiuderla; una risposta abbandonata a metà (per esempio alla frase di chiusura) chiude la sua connessione.
+    Il contesto TLS è unico, così le connessioni HTTPS nuove non ricaricano i certificati.
+
+    Args:
+        max_idle_per_host: Connessioni inattive conservate per host.
+        timeout: Attesa massima, in secondi, di ogni operazione sul socket.
+    """
+
+    def __init__(self, max_idle_per_host: int = DEFAULT_MAX_IDLE, timeout: float = DEFAULT_HTTP_TIMEOUT):
+        if max_idle_per_host < 0 or timeout <= 0:
+            raise ValueError("Le connessioni inattive non possono essere negative e il timeout deve essere positivo.")
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self._ssl_context: ssl.SSLContext | None = None
+        self.created = 0
+        self.reused = 0
+
+    def _connect(self, host_key: tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = host_key
+        with self._lock:
+            self.created += 1
+            if scheme == "https" and self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            context = self._ssl_context
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def request(
+        self, method: str, url: str, body: bytes | None = None, headers: dict[str, str] | None = None
+    ) -> "PooledResponse":
+        """Invia la richiesta su una connessione del pool e restituisce la risposta, con gli header già letti."""
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        host_key = (scheme, parts.hostname or "localhost", parts.port or (443 if scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        while True:
+            with self._lock:
+                idle = self._idle.get(host_key)
+                conn = idle.pop() if idle else None
+                if conn is not None:
+                    self.reused += 1
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(host_key)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if reused:
+                    logger.debug(f"Connessione inattiva verso {host_key[1]} chiusa dal server: ne apro una nuova.")
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            return PooledResponse(self, host_key, conn, response)
+
+    def _release(self, host_key: tuple[str, str, int], conn: http.client.HTTPConnection, reusable: bool) -> None:
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(host_key, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "idle": sum(len(idle) for idle in self._idle.values()),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+
+class PooledResponse:
+    """Risposta HTTP letta riga per riga, che restituisce la connessione al pool quando è stata letta tutta."""
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        host_key: tuple[str, str, int],
+        conn: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+    ):
+        self.status = response.status
+        self.headers = response.headers
+        self._pool = pool
+        self._host_key = host_key
+        self._conn = conn
+        self._response = response
+        self._released = False
+        self._lock = threading.Lock()
+
+    def lines(self) -> Iterator[bytes]:
+        """Righe non vuote del corpo; se l'iterazione viene interrotta la connessione viene chiusa."""
+        try:
+            while line := self._response.readline():
+                if line.strip():
+                    yield line.strip()
+        finally:
+            self.close()
+
+    def read(self) -> bytes:
+        try:
+            return self._response.read()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        # Può essere chiamato dal thread che legge (fine del corpo) e da chi abbandona la risposta a metà.
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        reusable = self._response.isclosed() and not self._response.will_close
+        if not reusable:
+            self._response.close()
+        self._pool._release(self._host_key, self._conn, reusable)
+
+
+class UsageMetadata:
+    """Token della chiamata, con gli stessi nomi di usage_metadata dell'SDK di Gemini."""
+
+    def __init__(
+        self,
+        prompt_token_count: int | None,
+        candidates_token_count: int | None,
+        cached_content_token_count: int | None = None,
+    ):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StreamedResponse:
+    """Risposta di un backend HTTP: iterabile (sync o async) di chunk con `.text`, come lo streaming dell'SDK di Gemini.
+
+    `usage_metadata` e `text` sono disponibili dopo aver letto tutti i chunk; solo allora lo scambio viene aggiunto
+    alla cronologia della sessione, come fa l'SDK. Una risposta non letta fino in fondo va chiusa con `close()`.
+
+    Args:
+        backend: Backend che ha inviato la richiesta, per interpretare le righe.
+        response: Risposta HTTP con gli header già letti.
+        on_complete: Chiamata con il testo completo dopo l'ultimo chunk.
+        timeout: Secondi, da ora, entro cui la lettura asincrona deve finire (None = solo il timeout del socket).
+    """
+
+    def __init__(self, backend: "HTTPBackend", response: PooledResponse, on_complete, timeout: float | None = None):
+        self._backend = backend
+        self._response = response
+        self._on_complete = on_complete
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+        # Una lettura in corso su un thread dell'executor e una chiusura richiesta nel frattempo (vedi close).
+        self._lock = threading.Lock()
+        self._reading = False
+        self._closed = False
+        self.prompt_feedback = None
+        self.usage_metadata: UsageMetadata | None = None
+        self.text = ""
+
+    def _parse(self, line: bytes) -> str:
+        chunk_text, usage = self._backend._parse_line(line)
+        if usage is not None:
+            self.usage_metadata = usage
+        return chunk_text
+
+    def _finish(self, text: str) -> None:
+        self.text = text
+        self._on_complete(text)
+
+    def __iter__(self) -> Iterator[_Chunk]:
+        text = ""
+        for line in self._response.lines():
+            if chunk_text := self._parse(line):
+                text += chunk_text
+                yield _Chunk(chunk_text)
+        self._finish(text)
+
+    def _read_line(self, lines: Iterator[bytes]) -> bytes | None:
+        # Gira su un thread dell'executor. Una close() arrivata durante la lettura viene eseguita qui, alla fine della
+        # readline: chiudere la risposta mentre un altro thread la sta leggendo non è sicuro.
+        with self._lock:
+            if self._closed:
+                return None
+            self._reading = True
+        try:
+            return next(lines, None)
+        finally:
+            with self._lock:
+                self._reading = False
+                close = self._closed
+            if close:
+                self._response.close()
+
+    async def __aiter__(self) -> AsyncIterator[_Chunk]:
+        # La lettura dal socket è bloccante: ogni riga viene letta su un thread dell'executor condiviso, così
+        # l'event loop resta libero per gli altri dialoghi. Ogni lettura ha come limite il tempo rimasto alla
+        # richiesta: alla scadenza solleva TimeoutError e la riga in corso viene abbandonata al suo thread.
+        executor = get_request_executor()
+        lines = self._response.lines()
+        text = ""
+        while True:
+            timeout = self._deadline - time.monotonic() if self._deadline is not None else None
+            line = await executor.acall(self._read_line, lines, timeout=timeout)
+            if line is None:
+                break
+            if chunk_text := self._parse(line):
+                text += chunk_text
+                yield _Chunk(chunk_text)
+        if not self._closed:
+            # Una risposta chiusa prima della fine non entra nella cronologia della sessione.
+            self._finish(text)
+
+    def close(self) -> None:
+        """Chiude la risposta: la connessione torna al pool solo se il corpo è stato letto tutto.
+
+        Se una riga è in lettura su un altro thread, la chiusura avviene appena la lettura finisce; la chiamata non
+        aspetta, quindi può essere fatta dall'event loop.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._reading:
+                return
+        self._response.close()
+
+
+class HTTPChatSession:
+    """Sessione di chat di un backend HTTP, con la stessa interfaccia di quella dell'SDK di Gemini.
+
+    I server compatibili OpenAI e Ollama sono senza stato: a ogni messaggio si invia l'intera cronologia, che la
+    sessione tiene nel formato dell'SDK (`role` "user"/"model" e `parts`).
+    """
+
+    def __init__(
+        self, backend: "HTTPBackend", model_name: str, system_instruction: str, history: list[dict[str, Any]]
+    ):
+        self._backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self._history = list(history)
+
+    @property
+    def backend(self) -> "HTTPBackend":
+        return self._backend
+
+    @property
+    def history(self) -> list[dict[str, Any]]:
+        return self._history
+
+    def _messages(self, content: str) -> list[dict[str, str]]:
+        messages = [{"role": "system", "content": self.system_instruction}] if self.system_instruction else []
+        for message in self._history:
+            text = "".join(str(part.get("text", "")) for part in message.get("parts", []))
+            messages.append({"role": "assistant" if message["role"] == "model" else "user", "content": text})
+        messages.append({"role": "user", "content": content})
+        return messages
+
+    def _append_turn(self, content: str):
+        def on_complete(text: str) -> None:
+            self._history.append({"role": "user", "parts": [{"text": content}]})
+            self._history.append({"role": "model", "parts": [{"text": text}]})
+
+        return on_complete
+
+    def send_message(
+        self,
+        content: str,
+        generation_config: Any = None,
+        stream: bool = False,
+        request_options: dict[str, Any] | None = None,
+    ):
+        """Invia il messaggio; con `stream` la risposta si legge a chunk, altrimenti viene letta subito per intero.
+
+        Come nell'SDK, `request_options["timeout"]` è la scadenza dell'intera richiesta, in secondi.
+        """
+        response = StreamedResponse(
+            self._backend,
+            self._backend.post(self.model_name, self._messages(content), generation_config),
+            self._append_turn(content),
+            timeout=(request_options or {}).get("timeout"),
+        )
+        if not stream:
+            for _ in response:
+                pass
+        return response
+
+    async def send_message_async(
+        self,
+        content: str,
+        generation_config: Any = None,
+        stream: bool = False,
+        request_options: dict[str, Any] | None = None,
+    ):
+        """Variante asincrona di `send_message`, usata dagli agenti e dalle richieste hedged."""
+        timeout = (request_options or {}).get("timeout")
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        posted = await self._backend.apost(self.model_name, self._messages(content), generation_config)
+        response = StreamedResponse(
+            self._backend,
+            posted,
+            self._append_turn(content),
+            timeout=deadline - time.monotonic() if deadline is not None else None,
+        )
+        if not stream:
+            async for _ in response:
+                pass
+        return response
+
+
+class HTTPModel:
+    """Modello di un backend HTTP con la stessa interfaccia di genai.GenerativeModel usata dagli agenti."""
+
+    def __init__(self, backend: "HTTPBackend", model_name: str, system_instruction: str = ""):
+        self._backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def start_chat(self, history: list[dict[str, Any]]) -> HTTPChatSession:
+        return HTTPChatSession(self._backend, self.model_name, self.system_instruction, history)
+
+
+class HTTPBackend:
+    """Base dei backend che parlano HTTP in streaming; le sottoclassi definiscono endpoint, payload e formato.
+
+    Args:
+        base_url: URL del server, per esempio "http://localhost:11434".
+        pool: Pool di connessioni condiviso.
+        api_key: Chiave inviata come bearer token, se il server la richiede.
+    """
+
+    name = ""
+    path = ""
+    # Solo Gemini supporta la cache di contesto dei prompt di sistema (vedi ModelPool).
+    context_cache = False
+    # Accetta i turni della modalità a ondate tramite send_batch_async (vedi WavefrontBatcher).
+    batching = True
+
+    def __init__(self, base_url: str, pool: ConnectionPool, api_key: str | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.pool = pool
+        self.api_key = api_key
+
+    def create_model(self, model_name: str, system_prompt: str) -> HTTPModel:
+        return HTTPModel(self, model_name, system_prompt)
+
+    def _payload(self, model_name: str, messages: list[dict[str, str]], generation_config: Any) -> dict[str, Any]:
+        raise NotImplementedError
+
+    def _parse_line(self, line: bytes) -> tuple[str, UsageMetadata | None]:
+        """Testo e, se presente, consumo di token di una riga della risposta in streaming."""
+        raise NotImplementedError
+
+    def post(self, model_name: str, messages: list[dict[str, str]], generation_config: Any) -> PooledResponse:
+        headers = {"Content-Type": "application/json", "Accept": "application/json, text/event-stream"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        body = json.dumps(self._payload(model_name, messages, generation_config), ensure_ascii=False).encode("utf-8")
+        response = self.pool.request("POST", self.base_url + self.path, body=body, headers=headers)
+        if response.status >= 400:
+            raw = response.read().decode("utf-8", errors="replace")
+            try:
+                error = json.loads(raw).get("error", raw)
+                message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            except (json.JSONDecodeError, AttributeError):
+                message = raw
+            retry_after = response.headers.get("Retry-After")
+            raise BackendHTTPError(
+                response.status,
+                f"{self.name}: {message.strip()[:500]}",
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        return response
+
+    async def apost(self, model_name: str, messages: list[dict[str, str]], generation_config: Any) -> PooledResponse:
+        """Variante asincrona di `post`: la richiesta viene inviata da un thread dell'executor condiviso."""
+        future = get_request_executor().submit(self.post, model_name, messages, generation_config)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Il chiamante ha rinunciato (scadenza o copia hedged più veloce): se la richiesta era già partita,
+            # la risposta che arriverà non verrà letta e la sua connessione va chiusa.
+            future.add_done_callback(_close_abandoned)
+            raise
+
+    async def send_batch_async(self, requests: list[tuple[Any, str, Any]], stream: bool = False) -> list[Any]:
+        """Invia insieme i messaggi di più sessioni: (sessione, messaggio, generation_config) per richiesta.
+
+        L'API di chat non accetta più conversazioni in una richiesta, ma i server locali (vLLM, llama.cpp, Ollama)
+        raggruppano da sé le richieste che arrivano insieme: i messaggi partono tutti subito, ciascuno su una
+        connessione del pool, e il server li elabora nello stesso batch. Restituisce, nello stesso ordine, la
+        risposta oppure l'eccezione di ciascuna richiesta.
+        """
+        return await asyncio.gather(
+            *(
+                chat.send_message_async(content, generation_config=generation_config, stream=stream)
+                for chat, content, generation_config in requests
+            ),
+            return_exceptions=True,
+        )
+
+
+def _close_abandoned(future: concurrent.futures.Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class OpenAIBackend(HTTPBackend):
+    """Server con l'API /chat/completions di OpenAI (vLLM, llama.cpp, LM Studio, ...), in streaming SSE."""
+
+    name = "openai"
+    path = "/chat/completions"
+
+    def _payload(self, model_name: str, messages: list[dict[str, str]], generation_config: Any) -> dict[str, Any]:
+        payload: dict[str, Any] = {
+            "model": model_name,
+            "messages": messages,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if generation_config is not None:
+            payload["temperature"] = generation_config.temperature
+            payload["max_tokens"] = generation_config.max_output_tokens
+        return payload
+
+    def _parse_line(self, line: bytes) -> tuple[str, UsageMetadata | None]:
+        if not line.startswith(b"data:"):
+            return "", None
+        data = line[len(b"data:"):].strip()
+        if data == b"[DONE]":
+            return "", None
+        event = json.loads(data)
+        if "error" in event:
+            raise BackendHTTPError(500, f"{self.name}: {event['error']}")
+        text = "".join((choice.get("delta") or {}).get("content") or "" for choice in event.get("choices") or [])
+        usage = event.get("usage")
+        if not usage:
+            return text, None
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        return text, UsageMetadata(usage.get("prompt_tokens"), usage.get("completion_tokens"), cached)
+
+
+class OllamaBackend(HTTPBackend):
+    """Server Ollama (/api/chat), in streaming JSON una riga per chunk."""
+
+    name = "ollama"
+    path = "/api/chat"
+
+    def _payload(self, model_name: str, messages: list[dict[str, str]], generation_config: Any) -> dict[str, Any]:
+        payload: dict[str, Any] = {"model": model_name, "messages": messages, "stream": True}
+        if generation_config is not None:
+            payload["options"] = {
+                "temperature": generation_config.temperature,
+                "num_predict": generation_config.max_output_tokens,
+            }
+        return payload
+
+    def _parse_line(self, line: bytes) -> tuple[str, UsageMetadata | None]:
+        event = json.loads(line)
+        if "error" in event:
+            raise BackendHTTPError(500, f"{self.name}: {event['error']}")
+        text = (event.get("message") or {}).get("content") or ""
+        if not event.get("done"):
+            return text, None
+        return text, UsageMetadata(event.get("prompt_eval_count"), event.get("eval_count"))
+
+
+class GeminiBackend:
+    """Gemini tramite google.generativeai, configurato una sola volta per processo.
+
+    L'SDK gestisce da sé le proprie connessioni: basta non ricrearne il client a ogni agente.
+    """
+
+    name = "gemini"
+    context_cache = True
+
+    def __init__(self):
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        if api_key:
+            genai.configure(api_key=api_key)
+        # L'SDK non ha un invio in batch delle sessioni di chat; lo shim lo simula.
+        self.batching = hasattr(genai, "send_message_batch_async")
+
+    async def send_batch_async(self, requests: list[tuple[Any, str, Any]], stream: bool = False) -> list[Any]:
+        return await genai.send_message_batch_async(requests, stream=stream)
+
+    def create_model(self, model_name: str, system_prompt: str) -> Any:
+        return genai.GenerativeModel(model_name=model_name, system_instruction=system_prompt)
+
+
+BACKENDS = ("gemini", "openai", "ollama")
+
+
+def split_model(model: str) -> tuple[str, str]:
+    """Separa backend e nome del modello: "ollama:llama3.1:8b" -> ("ollama", "llama3.1:8b").
+
+    Senza un prefisso noto il modello è di Gemini, come nelle configurazioni esistenti.
+    """
+    prefix, separator, name = model.partition(":")
+    if separator and prefix in BACKENDS:
+        return prefix, name
+    return "gemini", model
+
+
+class BackendRegistry:
+    """Un'istanza per backend, creata al primo modello che la usa e condivisa da tutti gli agenti del processo.
+
+    I backend HTTP usano tutti lo stesso pool di connessioni.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._backends: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _create(self, name: str) -> Any:
+        if name == "gemini":
+            return GeminiBackend()
+        if name == "openai":
+            return OpenAIBackend(
+                os.getenv("LLM_CONVERSATION_OPENAI_BASE_URL", DEFAULT_OPENAI_BASE_URL),
+                self.pool,
+                api_key=os.getenv("LLM_CONVERSATION_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY"),
+            )
+        if name == "ollama":
+            host = os.getenv("OLLAMA_HOST", DEFAULT_OLLAMA_HOST)
+            return OllamaBackend(host if "://" in host else f"http://{host}", self.pool)
+        raise ValueError(f"Backend '{name}' non valido. Valori ammessi: {', '.join(BACKENDS)}.")
+
+    def get(self, name: str) -> Any:
+        with self._lock:
+            backend = self._backends.get(name)
+            if backend is None:
+                backend = self._create(name)
+                self._backends[name] = backend
+            return backend
+
+    def resolve(self, model: str) -> tuple[Any, str]:
+        """Backend e nome del modello per il valore di `AgentConfig.model`."""
+        name, model_name = split_model(model)
+        return self.get(name), model_name
+
+
+_registry: BackendRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_backend_registry() -> BackendRegistry:
+    """Restituisce il registro dei backend del processo, creandolo alla prima chiamata.
+
+    Env vars:
+        LLM_CONVERSATION_OPENAI_BASE_URL: URL dell'API compatibile OpenAI (default: http://localhost:8000/v1)
+        LLM_CONVERSATION_OPENAI_API_KEY: Chiave dell'API compatibile OpenAI (default: OPENAI_API_KEY, se presente)
+        OLLAMA_HOST: Indirizzo del server Ollama (default: http://localhost:11434)
+        LLM_CONVERSATION_HTTP_POOL_SIZE: Connessioni inattive conservate per host (default: 32)
+        LLM_CONVERSATION_HTTP_TIMEOUT: Attesa massima di ogni operazione sul socket, in secondi (default: 60)
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            try:
+                pool = ConnectionPool(
+                    max_idle_per_host=int(os.getenv("LLM_CONVERSATION_HTTP_POOL_SIZE", str(DEFAULT_MAX_IDLE))),
+                    timeout=float(os.getenv("LLM_CONVERSATION_HTTP_TIMEOUT", str(DEFAULT_HTTP_TIMEOUT))),
+                )
+            except ValueError as e:
+                raise ValueError(f"Configurazione del pool di connessioni HTTP non valida: {e}")
+            _registry = BackendRegistry(pool)
+        return _registry
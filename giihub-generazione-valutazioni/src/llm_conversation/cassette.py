@@ -0,0 +1,134 @@
+"""Registrazione e riproduzione ("cassette") delle coppie richiesta/risposta del modello.
+
+In modalità record ogni risposta passata da `AIAgent.aget_response` viene salvata insieme alla chiave della
+richiesta e alla latenza osservata. In modalità replay le risposte vengono servite dalla cassetta, attendendo la
+latenza originale (eventualmente scalata), così l'intera pipeline può essere profilata senza rete.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class CassetteMissError(KeyError):
+    """La richiesta non è presente nella cassetta in riproduzione."""
+
+
+class CassetteRecorder:
+    """Accoda le interazioni a un file JSONL per processo dentro la directory della cassetta."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"cassette-{os.getpid()}.jsonl"
+        self._lock = threading.Lock()
+
+    def record(self, key: str, agent: str, model: str, response: str, latency: float, source: str) -> None:
+        """Salva una interazione. `source` indica da dove arriva la risposta (es. "model" o "cache")."""
+        entry = {
+            "key": key,
+            "agent": agent,
+            "model": model,
+            "latency": latency,
+            "source": source,
+            "recorded_at": time.time(),
+            "response": response,
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    async def arecord(self, key: str, agent: str, model: str, response: str, latency: float, source: str) -> None:
+        """Variante di `record` per l'event loop: la scrittura su file avviene in un thread."""
+        await asyncio.to_thread(self.record, key, agent, model, response, latency, source)
+
+
+class CassettePlayer:
+    """Serve le risposte registrate, nell'ordine in cui sono state registrate per ciascuna chiave."""
+
+    def __init__(self, directory: Path, latency_scale: float = 1.0):
+        if latency_scale < 0:
+            raise ValueError("Il fattore di scala delle latenze non può essere negativo.")
+        self.directory = directory
+        self.latency_scale = latency_scale
+        self._entries: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        self._positions: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+        files = sorted(directory.glob("*.jsonl"))
+        if not files:
+            raise FileNotFoundError(f"Nessuna cassetta trovata in {directory}.")
+        for path in files:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]].append(entry)
+        logger.info(f"Cassetta caricata da {directory}: {sum(len(v) for v in self._entries.values())} interazioni.")
+
+    def next_entry(self, key: str) -> dict[str, Any]:
+        """Restituisce la prossima interazione registrata per `key`; esaurite le registrazioni, ripete l'ultima."""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(key)
+            position = self._positions[key]
+            self._positions[key] = position + 1
+        return entries[min(position, len(entries) - 1)]
+
+    async def aplay(self, key: str) -> str:
+        """Restituisce la risposta per `key` dopo averne riprodotto la latenza originale."""
+        entry = self.next_entry(key)
+        delay = entry["latency"] * self.latency_scale
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return entry["response"]
+
+
+_recorders: dict[str, CassetteRecorder] = {}
+_players: dict[tuple[str, float], CassettePlayer] = {}
+_cassette_lock = threading.Lock()
+
+
+def get_cassette_recorder() -> CassetteRecorder | None:
+    """Restituisce il registratore configurato, oppure None.
+
+    Env vars:
+        LLM_CONVERSATION_RECORD_DIR: Directory in cui registrare la cassetta (default: registrazione disattivata)
+    """
+    directory = os.getenv("LLM_CONVERSATION_RECORD_DIR")
+    if not directory:
+        return None
+    with _cassette_lock:
+        if directory not in _recorders:
+            _recorders[directory] = CassetteRecorder(Path(directory))
+        return _recorders[directory]
+
+
+def get_cassette_player() -> CassettePlayer | None:
+    """Restituisce il riproduttore configurato, oppure None.
+
+    Env vars:
+        LLM_CONVERSATION_REPLAY_DIR: Directory della cassetta da riprodurre (default: riproduzione disattivata)
+        LLM_CONVERSATION_REPLAY_SCALE: Fattore applicato alle latenze registrate (default: 1.0; 0 = nessuna attesa)
+    """
+    directory = os.getenv("LLM_CONVERSATION_REPLAY_DIR")
+    if not directory:
+        return None
+    try:
+        scale = float(os.getenv("LLM_CONVERSATION_REPLAY_SCALE", "1.0"))
+    except ValueError:
+        raise ValueError("LLM_CONVERSATION_REPLAY_SCALE deve essere un numero valido.")
+    with _cassette_lock:
+        if (directory, scale) not in _players:
+            _players[(directory, scale)] = CassettePlayer(Path(directory), latency_scale=scale)
+        return _players[(directory, scale)]
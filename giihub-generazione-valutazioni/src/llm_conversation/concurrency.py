@@ -0,0 +1,185 @@
+"""Controllo adattivo (AIMD) del numero di chiamate al modello in volo nel processo."""
+
+import asyncio
+import collections
+import os
+import threading
+import time
+from typing import Any
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_INITIAL = 8
+DEFAULT_MINIMUM = 1
+DEFAULT_MAXIMUM = 64
+# Una latenza oltre questo multiplo della media mobile è considerata un picco.
+LATENCY_SPIKE_FACTOR = 3.0
+# Campioni necessari prima di giudicare i picchi di latenza.
+LATENCY_WARMUP = 10
+LATENCY_EWMA_ALPHA = 0.05
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AIMDController:
+    """Limite di concorrenza ad aumento additivo e diminuzione moltiplicativa.
+
+    Ogni chiamata riuscita con latenza nella norma aumenta il limite di `1 / limite` (circa +1 per ogni "giro" di
+    chiamate), mentre un 429, un timeout o un picco di latenza lo moltiplica per `decrease`. Dopo una diminuzione
+    le altre segnalazioni vengono ignorate per un intervallo pari alla latenza media, così un'unica raffica di
+    errori conta una volta sola. Il controllore è condiviso da thread ed event loop diversi.
+
+    Args:
+        initial: Limite iniziale.
+        minimum: Limite minimo.
+        maximum: Limite massimo.
+        decrease: Fattore applicato al limite a ogni segnale di sovraccarico.
+    """
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_INITIAL,
+        minimum: int = DEFAULT_MINIMUM,
+        maximum: int = DEFAULT_MAXIMUM,
+        decrease: float = 0.5,
+    ):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("I limiti di concorrenza devono rispettare 1 <= minimo <= iniziale <= massimo.")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._waiters: collections.deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = collections.deque()
+        self._lock = threading.Lock()
+        self._latency_mean: float | None = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _grant_locked(self) -> None:
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _wake_locked(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            loop, future = self._waiters.popleft()
+            self._grant_locked()
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def acquire(self) -> None:
+        """Attende un posto libero entro il limite corrente."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.limit and not self._waiters:
+                self._grant_locked()
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Il posto era già stato assegnato: va restituito.
+                    self._in_flight -= 1
+                    self._wake_locked()
+            raise
+
+    def release(self, latency: float | None, overloaded: bool = False) -> None:
+        """Libera il posto e aggiorna il limite con l'esito della chiamata.
+
+        Args:
+            latency: Latenza osservata (fino al primo token), None se la chiamata non ha risposto.
+            overloaded: Se la chiamata è fallita per sovraccarico del servizio (429, timeout, 5xx).
+        """
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+            spike = (
+                latency is not None
+                and self._latency_mean is not None
+                and self._samples >= LATENCY_WARMUP
+                and latency > LATENCY_SPIKE_FACTOR * self._latency_mean
+            )
+            if overloaded or spike:
+                cooldown = self._latency_mean or 1.0
+                if now - self._last_decrease >= cooldown:
+                    self._last_decrease = now
+                    self._limit = max(float(self.minimum), self._limit * self.decrease)
+                    self.decreases += 1
+                    logger.info(
+                        f"Concorrenza ridotta a {self.limit} ({'sovraccarico' if overloaded else 'picco di latenza'})."
+                    )
+            elif latency is not None:
+                previous = self.limit
+                self._limit = min(float(self.maximum), self._limit + 1.0 / self._limit)
+                if self.limit > previous:
+                    self.increases += 1
+            if latency is not None and not spike:
+                self._samples += 1
+                if self._latency_mean is None:
+                    self._latency_mean = latency
+                else:
+                    self._latency_mean += LATENCY_EWMA_ALPHA * (latency - self._latency_mean)
+            self._wake_locked()
+
+    def stats(self) -> dict[str, Any]:
+        """Stato corrente, per la barra di avanzamento e le metriche."""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "waiting": len(self._waiters),
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "latency_mean_seconds": self._latency_mean,
+            }
+
+
+_controller: AIMDController | None = None
+_controller_lock = threading.Lock()
+
+
+def get_concurrency_controller() -> AIMDController | None:
+    """Restituisce il controllore del processo, oppure None se il controllo adattivo è disattivato.
+
+    Env vars:
+        LLM_CONVERSATION_ADAPTIVE_CONCURRENCY: Se "1"/"true", attiva il controllo adattivo (default: disattivato)
+        LLM_CONVERSATION_CONCURRENCY_INITIAL: Limite iniziale di chiamate in volo (default: 8)
+        LLM_CONVERSATION_CONCURRENCY_MIN: Limite minimo (default: 1)
+        LLM_CONVERSATION_CONCURRENCY_MAX: Limite massimo (default: 64)
+    """
+    global _controller
+    if os.getenv("LLM_CONVERSATION_ADAPTIVE_CONCURRENCY", "0").lower() not in ("1", "true"):
+        return None
+    with _controller_lock:
+        if _controller is None:
+            try:
+                _controller = AIMDController(
+                    initial=int(os.getenv("LLM_CONVERSATION_CONCURRENCY_INITIAL", str(DEFAULT_INITIAL))),
+                    minimum=int(os.getenv("LLM_CONVERSATION_CONCURRENCY_MIN", str(DEFAULT_MINIMUM))),
+                    maximum=int(os.getenv("LLM_CONVERSATION_CONCURRENCY_MAX", str(DEFAULT_MAXIMUM))),
+                )
+            except ValueError as e:
+                raise ValueError(f"Configurazione della concorrenza adattiva non valida: {e}")
+        return _controller
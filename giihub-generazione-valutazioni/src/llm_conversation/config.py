@@ -4,7 +4,7 @@ Modified by: Melania Balestri, 2025  adaptations for APP/IE matrix configuration
 License: GNU AGPL v3.0 (see LICENSE in project root)
 """
 
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel
 
 
@@ -14,15 +14,39 @@ class AgentConfig(BaseModel):
     temperature: float
     ctx_size: int
     system_prompt: str
+    # Budget di token (stimati) della cronologia inviata a ogni chiamata; None = cronologia completa.
+    history_budget: Optional[int] = None
+    # Cosa fare dei turni più vecchi oltre il budget: riassumerli o scartarli.
+    history_policy: Literal["summary", "drop"] = "summary"
 
 
 class Settings(BaseModel):
     initial_message: Optional[str] = None
+    # Se le frasi di chiusura degli agenti possono terminare la conversazione.
+    allow_termination: bool = True
+    # Numero massimo di risposte (di entrambi gli agenti) e di token di output per conversazione.
+    max_turns: Optional[int] = 31
+    max_tokens: Optional[int] = None
+    # Rilevamento dei loop, spento di default: similarità minima tra una risposta e la precedente dello stesso
+    # agente (per esempio 0.9) e numero di risposte consecutive ripetute che chiudono la conversazione.
+    loop_similarity: Optional[float] = None
+    loop_repeats: int = 2
+    # Interlocutori le cui frasi di chiusura terminano la conversazione e se valgono già per il saluto iniziale
+    # dell'Agente 1. Di default solo le risposte successive dell'Agente 1, come nel manager originale.
+    closing_speakers: List[Literal["agent1", "agent2"]] = ["agent1"]
+    close_on_opening: bool = False
+
+
+class RateLimit(BaseModel):
+    # Richieste e token (input + output) al minuto consentiti per un modello; None = nessun limite.
+    rpm: Optional[int] = None
+    tpm: Optional[int] = None
 
 
 class Config(BaseModel):
     agents: List[AgentConfig]
     settings: Settings
+    rate_limits: Dict[str, RateLimit] = {}
 
 
 def load_config(file_path: str) -> Config:
@@ -30,4 +54,4 @@ def load_config(file_path: str) -> Config:
     import json
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    return Config(**data)
+    return Config(**data)
@@ -0,0 +1,75 @@
+"""Finestra di contesto a budget di token per la cronologia di un agente."""
+
+import re
+from typing import Any, Literal
+
+HistoryPolicy = Literal["summary", "drop"]
+
+SUMMARY_HEADER = "[Summary of earlier turns in this conversation]"
+# Dopo una compattazione la cronologia scende a questa frazione del budget, così la sessione di chat
+# viene ricostruita solo ogni tanto e non a ogni turno.
+LOW_WATERMARK = 0.75
+# Quota massima del budget che il riepilogo può occupare.
+SUMMARY_SHARE = 0.25
+MIN_RECENT_MESSAGES = 2
+SUMMARY_LINE_CHARS = 200
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima approssimata dei token di un testo (circa quattro caratteri per token)."""
+    return len(text) // 4 + 1
+
+
+def _message_tokens(message: dict[str, Any]) -> int:
+    return estimate_tokens(str(message["content"]))
+
+
+def _summary_line(message: dict[str, Any]) -> str:
+    text = " ".join(str(message["content"]).split())
+    first_sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    if len(first_sentence) > SUMMARY_LINE_CHARS:
+        first_sentence = first_sentence[: SUMMARY_LINE_CHARS - 3] + "..."
+    speaker = "You" if message["role"] == "model" else "Other party"
+    return f"- {speaker}: {first_sentence}"
+
+
+def compact_messages(
+    messages: list[dict[str, Any]], budget: int, policy: HistoryPolicy = "summary"
+) -> list[dict[str, Any]] | None:
+    """Riduce la cronologia entro `budget` token stimati, oppure restituisce None se non serve.
+
+    Il messaggio di sistema (se presente in testa) e i turni più recenti restano invariati. I turni più vecchi
+    vengono eliminati (`drop`) oppure condensati in un riepilogo estrattivo che si aggiorna a ogni compattazione
+    (`summary`); il riepilogo è un messaggio marcato con `"summary": True` subito dopo quello di sistema.
+    """
+    if sum(_message_tokens(m) for m in messages) <= budget:
+        return None
+
+    head = messages[:1] if messages and messages[0]["role"] == "system" else []
+    rest = messages[len(head):]
+    previous_summary: list[str] = []
+    if rest and rest[0].get("summary"):
+        previous_summary = str(rest[0]["content"]).splitlines()[1:]
+        rest = rest[1:]
+
+    target = int(budget * LOW_WATERMARK)
+    summary_budget = int(budget * SUMMARY_SHARE) if policy == "summary" else 0
+    fixed = sum(_message_tokens(m) for m in head)
+    kept = list(rest)
+    dropped: list[dict[str, Any]] = []
+    while len(kept) > MIN_RECENT_MESSAGES and fixed + summary_budget + sum(_message_tokens(m) for m in kept) > target:
+        dropped.append(kept.pop(0))
+
+    if policy == "drop":
+        return head + kept
+
+    lines = previous_summary + [_summary_line(m) for m in dropped]
+    # Se il riepilogo supera la sua quota si scartano le righe più vecchie.
+    while lines and estimate_tokens("\n".join([SUMMARY_HEADER, *lines])) > summary_budget:
+        lines.pop(0)
+    if not lines:
+        return head + kept
+    summary = {"role": "user", "content": "\n".join([SUMMARY_HEADER, *lines]), "summary": True}
+    return head + [summary] + kept
@@ -5,11 +5,16 @@ License: GNU AGPL v3.0 (see LICENSE in project root)
 """
 
 import json
+import time
 from pathlib import Path
-from typing import List, Generator, Tuple, Dict
+from typing import Any, List, Generator, AsyncGenerator, Tuple, Dict
 
 # Importa la classe AIAgent, l'unica dipendenza di cui ha bisogno
 from .ai_agent import AIAgent
+from .async_utils import iterate_sync
+from .errors import ConversationAborted, ModelCallError
+from .termination import DEFAULT_CLOSING_PHRASES, TerminationEngine
+from .wavefront import get_wavefront_batcher
 
 
 class ConversationManager:
@@ -17,56 +22,246 @@ class ConversationManager:
     Manager semplice che orchestra un dialogo ping-pong tra due agenti.
     È progettato per essere compatibile con la versione finale di AIAgent.
     """
-    def __init__(self, agents: List[AIAgent], initial_message: str | None, **kwargs):
+    def __init__(
+        self,
+        agents: List[AIAgent],
+        initial_message: str | None,
+        termination: TerminationEngine | None = None,
+        **kwargs,
+    ):
         self.agents = agents
         self.initial_message = initial_message or ""
-        self.history: List[Dict[str, str]] = []
+        self.history: List[Dict[str, Any]] = []
+        self.started_at: float | None = None
+        self.ended_at: float | None = None
+        # Tempo di esecuzione delle sessioni precedenti (prima di una ripresa da checkpoint) e inizio di quella
+        # corrente: la durata non comprende le interruzioni.
+        self._previous_seconds = 0.0
+        self._session_started: float | None = None
+        # Senza un motore esplicito vale la regola storica: congedo dell'Agente 1 o 31 risposte. Il rilevamento dei
+        # loop si attiva dalle impostazioni (`TerminationEngine.from_settings`).
+        self.termination = termination or TerminationEngine({"agent1": DEFAULT_CLOSING_PHRASES})
+        self.terminated_by: str | None = None
+        # Se il dialogo è un ramo di un altro (vedi `fork`), da dove è partito e quante risposte condivide.
+        self.fork_point: Dict[str, Any] | None = None
 
         # Salviamo i prompt originali per il file di output.
         self._original_system_prompts = {agent.name: agent.system_prompt for agent in agents}
 
     def run_conversation(self) -> Generator[Tuple[str, List[str]], None, None]:
+        """Esegue il dialogo in modo sincrono, sopra `arun_conversation`."""
+        yield from iterate_sync(self.arun_conversation())
+
+    async def arun_conversation(self) -> AsyncGenerator[Tuple[str, List[str]], None]:
         """Esegue il dialogo e gestisce la cronologia per ogni agente."""
         
         if not self.agents or len(self.agents) < 2:
             # Aggiunto un controllo di sicurezza per evitare errori se non ci sono abbastanza agenti
             return
 
-        agent1 = self.agents[0]
-        agent2 = self.agents[1]
+        # Macchina a stati ripristinabile: chi parla dipende solo dalla lunghezza della cronologia, quindi la
+        # conversazione può riprendere da una cronologia già avviata.
+        if self.started_at is None:
+            self.started_at = time.time()
+        self._session_started = time.time()
+        if not self.history:
+            # L'Agente 1 riceve l'istruzione iniziale e genera il suo saluto.
+            self.agents[0].add_message("user", self.initial_message)
 
-        # --- Logica Corretta per il Primo Turno ---
-        # L'Agente 1 riceve l'istruzione iniziale e genera il suo saluto.
-        agent1.add_message("user", self.initial_message)
-        response1 = "".join(list(agent1.get_response()))
+        # In modalità a ondate il dialogo partecipa ai batch finché è in corso: i batch non lo aspettano più dopo.
+        batcher = get_wavefront_batcher()
+        if batcher is not None:
+            batcher.join()
+        try:
+            while self.terminated_by is None:
+                speaker = len(self.history) % 2
+                agent, listener = self.agents[speaker], self.agents[1 - speaker]
+                # Le risposte di chiusura vengono troncate alla fine della frase di congedo.
+                agent.stop_patterns = self.termination.stop_patterns(speaker, len(self.history))
+                response, chunks = await self._take_turn(agent)
 
-        # Registriamo la prima frase di dialogo
-        self.history.append({"speaker": agent1.name, "message": response1})
-        yield (agent1.name, [response1])
-        
-        # Aggiorniamo le cronologie di entrambi gli agenti
-        agent1.add_message("model", response1)
-        agent2.add_message("user", response1)
-
-        # Ciclo di conversazione per i turni successivi
-        for _ in range(15): # Limite di turni
-            # Turno Agente 2 (risponde al saluto dell'Agente 1)
-            response2 = "".join(list(agent2.get_response()))
-            self.history.append({"speaker": agent2.name, "message": response2})
-            yield (agent2.name, [response2])
-            agent2.add_message("model", response2)
-            agent1.add_message("user", response2)
-
-            # Turno Agente 1 (risponde alla risposta dell'Agente 2)
-            response1 = "".join(list(agent1.get_response()))
-            self.history.append({"speaker": agent1.name, "message": response1})
-            yield (agent1.name, [response1])
-            agent1.add_message("model", response1)
-            agent2.add_message("user", response1)
-
-            # Condizione di uscita
-            if "goodbye" in response1.lower() or "concludes my report" in response1.lower():
-                break
+                # Aggiorniamo le cronologie di entrambi gli agenti prima di restituire il turno, così lo stato è
+                # coerente anche se il chiamante smette di iterare.
+                agent.add_message("model", response)
+                listener.add_message("user", response)
+                self.terminated_by = self.termination.check(self.history, speaker)
+                yield (agent.name, chunks)
+        finally:
+            if batcher is not None:
+                batcher.leave()
+
+        self.ended_at = time.time()
+
+    async def _take_turn(self, agent: AIAgent) -> Tuple[str, List[str]]:
+        """Genera la risposta di un agente e la registra nella cronologia insieme alle misure della chiamata.
+
+        Restituisce il testo completo e i chunk ricevuti in streaming. Se la chiamata fallisce anche dopo i
+        tentativi previsti, solleva ConversationAborted invece di passare un messaggio di errore all'altro agente:
+        la cronologia resta quella dell'ultimo turno valido.
+        """
+        try:
+            chunks = [chunk async for chunk in agent.aget_response()]
+        except ModelCallError as e:
+            raise ConversationAborted(str(e), len(self.history) + 1) from e
+        response = "".join(chunks)
+        self.history.append({"speaker": agent.name, "message": response, "metrics": dict(agent.last_call)})
+        return response, chunks
+
+    def get_state(self) -> Dict[str, Any]:
+        """Stato serializzabile del dialogo: cronologia, esito e cronologie dei due agenti."""
+        return {
+            "history": [dict(message) for message in self.history],
+            "started_at": self.started_at,
+            "active_seconds": self.active_seconds,
+            "terminated_by": self.terminated_by,
+            "fork_point": self.fork_point,
+            "agents": [agent.get_state() for agent in self.agents],
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        """Ripristina uno stato salvato con `get_state`: `arun_conversation` riprende dal turno successivo."""
+        if len(state["agents"]) != len(self.agents):
+            raise ValueError("Lo stato salvato non corrisponde al numero di agenti della conversazione.")
+        self.history = [dict(message) for message in state["history"]]
+        self.started_at = state.get("started_at")
+        self._previous_seconds = state.get("active_seconds") or 0.0
+        self._session_started = None
+        self.terminated_by = state.get("terminated_by")
+        self.fork_point = state.get("fork_point")
+        for agent, agent_state in zip(self.agents, state["agents"]):
+            agent.load_state(agent_state)
+
+    def load_history(self, history: List[Dict[str, Any]]) -> None:
+        """Riparte da una cronologia data, ricostruendo da essa le cronologie dei due agenti.
+
+        Serve a proseguire un dialogo con agenti diversi da quelli che l'hanno generato (per esempio un'altra
+        persona per l'Agente 2) o a ripartire dalle prime k risposte di una trascrizione salvata. Le risposte
+        in posizione pari sono dell'Agente 1, quelle dispari dell'Agente 2.
+        """
+        self.history = [dict(message) for message in history]
+        self.terminated_by = None
+        self.ended_at = None
+        for index, agent in enumerate(self.agents[:2]):
+            messages: List[Dict[str, Any]] = []
+            if agent.system_prompt:
+                messages.append({"role": "system", "content": agent.system_prompt})
+            # Con una cronologia vuota l'istruzione iniziale viene aggiunta da arun_conversation.
+            if index == 0 and self.history:
+                messages.append({"role": "user", "content": self.initial_message})
+            for position, message in enumerate(self.history):
+                role = "model" if position % 2 == index else "user"
+                messages.append({"role": role, "content": message["message"]})
+            agent.load_state({"messages": messages})
+
+    def fork(
+        self,
+        agents: List[AIAgent] | None = None,
+        termination: TerminationEngine | None = None,
+        label: str | None = None,
+    ) -> "ConversationManager":
+        """Nuovo dialogo che prosegue da questo punto senza rigenerare le risposte già prodotte.
+
+        Args:
+            agents: Agenti del ramo. Di default sono copie degli agenti correnti con la stessa cronologia; agenti
+                diversi ricevono la cronologia ricostruita dalle risposte condivise.
+            termination: Regole di chiusura del ramo (default: quelle di questo dialogo).
+            label: Nome del punto di partenza, registrato nel `fork_point` del ramo.
+
+        Le misure delle risposte condivise restano nella cronologia del ramo, contrassegnate come condivise
+        nell'output, ma il riepilogo del ramo non le conta: sono già nel riepilogo di chi le ha generate. Anche la
+        durata del ramo parte da quando il ramo viene eseguito.
+        """
+        branch = ConversationManager(
+            agents if agents is not None else [agent.clone() for agent in self.agents],
+            self.initial_message,
+            termination=termination or self.termination,
+        )
+        if agents is None:
+            branch.load_state(self.get_state())
+        else:
+            branch.load_history(self.history)
+        branch.started_at = None
+        branch._previous_seconds = 0.0
+        branch.terminated_by = self.terminated_by
+        branch.fork_point = {"parent": label, "messages": len(self.history)}
+        return branch
+
+    def branch(self, n: int, label: str | None = None) -> List["ConversationManager"]:
+        """`n` rami che da questo punto generano risposte alternative dello stesso agente (studi "what-if").
+
+        Per ripartire da una risposta precedente, prima si tronca la cronologia con `load_history`. Ogni ramo usa
+        un indice di campione diverso, quindi la cache delle risposte non li fa coincidere.
+        """
+        branches = []
+        for sample in range(n):
+            branch = self.fork(label=label)
+            for agent in branch.agents:
+                agent.sample = sample
+            branches.append(branch)
+        return branches
+
+    @property
+    def active_seconds(self) -> float:
+        """Secondi in cui il dialogo è stato effettivamente in esecuzione, sommati tra le riprese da checkpoint."""
+        if self._session_started is None:
+            return self._previous_seconds
+        return self._previous_seconds + (self.ended_at or time.time()) - self._session_started
+
+    @property
+    def shared_messages(self) -> int:
+        """Numero di risposte iniziali ereditate dal dialogo da cui questo è un ramo (0 se non è un ramo)."""
+        return self.fork_point["messages"] if self.fork_point else 0
+
+    def generated_history(self) -> List[Dict[str, Any]]:
+        """Le risposte generate da questo dialogo, senza quelle ereditate con `fork`."""
+        return self.history[self.shared_messages:]
+
+    def save_checkpoint(self, path: Path, **extra: Any) -> None:
+        """Scrive lo stato corrente in `path` in modo atomico; `extra` viene salvato accanto allo stato."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**extra, "state": self.get_state()}, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def summary(self) -> Dict[str, Any]:
+        """Riepilogo della conversazione: durata, turni, token e tempi aggregati delle chiamate.
+
+        `messages` e `turns` contano l'intera trascrizione; token, tempi, tentativi e fonti solo le risposte generate
+        da questo dialogo (`shared_messages` sono quelle ereditate da un altro).
+        """
+        metrics = [msg.get("metrics", {}) for msg in self.generated_history()]
+        latencies = [m["latency_seconds"] for m in metrics if m.get("latency_seconds") is not None]
+        ttfts = [m["ttft_seconds"] for m in metrics if m.get("ttft_seconds") is not None]
+
+        def total(field: str) -> int | None:
+            values = [m[field] for m in metrics if m.get(field) is not None]
+            return sum(values) if values else None
+
+        sources: Dict[str, int] = {}
+        for m in metrics:
+            if m.get("source"):
+                sources[m["source"]] = sources.get(m["source"], 0) + 1
+
+        return {
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            # Tempo di esecuzione, senza le interruzioni tra un checkpoint e la ripresa.
+            "duration_seconds": self.active_seconds if self.ended_at else None,
+            "messages": len(self.history),
+            "turns": (len(self.history) + 1) // 2,
+            "shared_messages": self.shared_messages,
+            "model_seconds": sum(latencies),
+            "mean_latency_seconds": sum(latencies) / len(latencies) if latencies else None,
+            "max_latency_seconds": max(latencies) if latencies else None,
+            "mean_ttft_seconds": sum(ttfts) / len(ttfts) if ttfts else None,
+            "prompt_tokens": total("prompt_tokens"),
+            "output_tokens": total("output_tokens"),
+            "cached_tokens": total("cached_tokens"),
+            "retries": total("retries") or 0,
+            "sources": sources,
+            "terminated_by": self.terminated_by,
+        }
 
     def save_conversation(self, output_path: Path):
         """Salva la conversazione nel formato JSON richiesto."""
@@ -85,16 +280,24 @@ class ConversationManager:
         
         # Formatta la conversazione per il salvataggio
         formatted_conv = []
+        shared = self.shared_messages
         for i, msg in enumerate(self.history):
             turn_number = (i // 2) + 1
-            formatted_conv.append({
+            entry = {
                 "turn": turn_number,
                 "speaker": msg["speaker"],
-                "message": msg["message"]
-            })
+                "message": msg["message"],
+                "metrics": msg.get("metrics", {}),
+            }
+            if i < shared:
+                # Risposta generata una sola volta e condivisa con gli altri rami dello stesso prefisso.
+                entry["shared"] = True
+            formatted_conv.append(entry)
 
-        output_data = {"agents": agent_configs, "conversation": formatted_conv}
+        output_data = {"agents": agent_configs, "conversation": formatted_conv, "summary": self.summary()}
+        if self.fork_point:
+            output_data["fork_point"] = self.fork_point
         
         output_path.parent.mkdir(parents=True, exist_ok=True)
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=4, ensure_ascii=False)
+            json.dump(output_data, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,93 @@
+"""Eccezioni tipizzate delle chiamate al modello e delle conversazioni."""
+
+import asyncio
+from typing import Any
+
+# Codici HTTP/gRPC per cui ha senso ripetere la chiamata.
+RETRYABLE_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMConversationError(Exception):
+    """Classe base degli errori del pacchetto."""
+
+
+class ModelCallError(LLMConversationError):
+    """Una chiamata al modello è fallita.
+
+    Args:
+        agent: Nome dell'agente che ha fatto la chiamata.
+        message: Descrizione dell'errore.
+        retryable: Se ripetere la stessa chiamata può andare a buon fine.
+        retry_after: Attesa suggerita dal server prima di riprovare, in secondi.
+        code: Codice di stato restituito dal servizio, se disponibile.
+    """
+
+    def __init__(
+        self,
+        agent: str,
+        message: str,
+        retryable: bool = False,
+        retry_after: float | None = None,
+        code: int | None = None,
+    ):
+        super().__init__(f"Agente '{agent}': {message}")
+        self.agent = agent
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.code = code
+
+
+class ModelTimeoutError(ModelCallError):
+    """La chiamata non si è conclusa entro GEMINI_API_TIMEOUT."""
+
+    def __init__(self, agent: str, timeout_seconds: float | None = None):
+        detail = f" dopo {timeout_seconds:g}s" if timeout_seconds is not None else ""
+        super().__init__(agent, f"timeout della chiamata al modello{detail}", retryable=True)
+
+
+class RateLimitError(ModelCallError):
+    """Il servizio ha rifiutato la chiamata per quota o rate limit (429)."""
+
+
+class EmptyResponseError(ModelCallError):
+    """Il modello ha restituito una risposta vuota o bloccata."""
+
+    def __init__(self, agent: str, feedback: Any):
+        # Con temperatura > 0 un nuovo campionamento può produrre una risposta valida.
+        super().__init__(agent, f"risposta vuota o bloccata: {feedback}", retryable=True)
+        self.feedback = feedback
+
+
+class ConversationAborted(LLMConversationError):
+    """La conversazione è stata interrotta perché un turno non ha prodotto una risposta valida.
+
+    La trascrizione non viene salvata: la combinazione va rimessa in coda.
+    """
+
+    def __init__(self, reason: str, turn: int):
+        super().__init__(f"Conversazione interrotta al turno {turn}: {reason}")
+        self.reason = reason
+        self.turn = turn
+
+
+def classify_exception(error: BaseException, agent: str) -> ModelCallError:
+    """Converte un'eccezione dell'SDK o della rete nel corrispondente ModelCallError."""
+    if isinstance(error, ModelCallError):
+        return error
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return ModelTimeoutError(agent)
+    code = getattr(error, "code", None)
+    code = code if isinstance(code, int) else None
+    retry_after = getattr(error, "retry_after", None)
+    if code == 429:
+        return RateLimitError(agent, str(error), retryable=True, retry_after=retry_after, code=code)
+    if code is not None:
+        return ModelCallError(agent, str(error), retryable=code in RETRYABLE_CODES, retry_after=retry_after, code=code)
+    if isinstance(error, ConnectionError):
+        return ModelCallError(agent, str(error), retryable=True)
+    return ModelCallError(agent, f"{type(error).__name__}: {error}")
+
+
+def is_overload(error: ModelCallError) -> bool:
+    """Indica se l'errore segnala un servizio sovraccarico (429, 5xx o timeout)."""
+    return isinstance(error, (RateLimitError, ModelTimeoutError)) or (error.code is not None and error.code >= 500)
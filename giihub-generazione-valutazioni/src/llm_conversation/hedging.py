@@ -0,0 +1,157 @@
+"""Richieste "hedged": una copia della chiamata parte se l'originale è più lenta di un percentile delle latenze."""
+
+import asyncio
+import collections
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_BUDGET = 0.1
+# Campioni di latenza necessari prima di calcolare il percentile, e campioni conservati per modello.
+MIN_SAMPLES = 20
+WINDOW = 500
+
+
+def _succeeded(task: asyncio.Future) -> bool:
+    return task.done() and not task.cancelled() and task.exception() is None
+
+
+class Hedger:
+    """Decide quando duplicare una chiamata lenta e tiene il conto del budget di duplicati.
+
+    Per ogni modello si conservano le latenze recenti fino alla prima risposta. Se una chiamata supera il
+    `percentile` di queste latenze si avvia una copia; vince la prima che risponde e l'altra viene annullata. Le copie
+    non possono superare la frazione `budget` delle chiamate, così la spesa aggiuntiva resta limitata.
+
+    Args:
+        percentile: Percentile (0-100) delle latenze oltre il quale partire con la copia.
+        budget: Frazione massima di chiamate che possono essere duplicate.
+    """
+
+    def __init__(self, percentile: float = 95.0, budget: float = DEFAULT_BUDGET):
+        if not 0 < percentile < 100:
+            raise ValueError("Il percentile per le richieste hedged deve essere tra 0 e 100.")
+        if not 0 <= budget <= 1:
+            raise ValueError("Il budget delle richieste hedged deve essere tra 0 e 1.")
+        self.percentile = percentile
+        self.budget = budget
+        self._latencies: dict[str, collections.deque[float]] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, model: str, latency: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(model, collections.deque(maxlen=WINDOW)).append(latency)
+
+    def hedge_delay(self, model: str) -> float | None:
+        """Attesa dopo la quale duplicare una chiamata a `model`, oppure None se non ci sono abbastanza campioni."""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile / 100))]
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    async def race(
+        self, model: str, primary: Callable[[], Awaitable[T]], backup: Callable[[], Awaitable[T]]
+    ) -> tuple[T, bool]:
+        """Esegue `primary` e, se è lenta, anche `backup`; restituisce il primo risultato e se viene dalla copia.
+
+        Se una delle due fallisce si attende l'altra; l'errore viene sollevato solo se falliscono entrambe. Se
+        rispondono entrambe nello stesso momento vince l'originale. La risposta perdente viene chiusa (se ha un metodo
+        `close`), così la sua connessione non resta aperta.
+        """
+        with self._lock:
+            self.calls += 1
+        delay = self.hedge_delay(model)
+        started = time.perf_counter()
+        first = asyncio.ensure_future(primary())
+        tasks = [first]
+        winner: asyncio.Future | None = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done or not self._take_budget():
+                winner = first
+                result = await first
+                self.observe(model, time.perf_counter() - started)
+                return result, False
+
+            logger.debug(f"Richiesta a '{model}' oltre il p{self.percentile:g} ({delay:.2f}s): avvio una copia.")
+            hedge_started = time.perf_counter()
+            second = asyncio.ensure_future(backup())
+            tasks.append(second)
+            pending = {first, second}
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in tasks if task in done and _succeeded(task)), None)
+                if winner is None:
+                    error = next((task.exception() for task in done if not task.cancelled()), None) or error
+                    continue
+                won = winner is second
+                if won:
+                    with self._lock:
+                        self.hedge_wins += 1
+                self.observe(model, time.perf_counter() - (hedge_started if won else started))
+                return winner.result(), won
+            assert error is not None
+            raise error
+        finally:
+            # Il perdente (o entrambe, se il chiamante viene annullato) non deve restare in volo né aperto.
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif _succeeded(task):
+                    close = getattr(task.result(), "close", None)
+                    if close is not None:
+                        close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+
+_hedger: Hedger | None = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger | None:
+    """Restituisce il gestore delle richieste hedged del processo, oppure None se disattivato.
+
+    Env vars:
+        LLM_CONVERSATION_HEDGE_PERCENTILE: Percentile delle latenze oltre il quale duplicare una chiamata
+            (default: hedging disattivato)
+        LLM_CONVERSATION_HEDGE_BUDGET: Frazione massima di chiamate duplicate (default: 0.1)
+    """
+    global _hedger
+    raw = os.getenv("LLM_CONVERSATION_HEDGE_PERCENTILE")
+    if not raw:
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            try:
+                _hedger = Hedger(
+                    percentile=float(raw),
+                    budget=float(os.getenv("LLM_CONVERSATION_HEDGE_BUDGET", str(DEFAULT_BUDGET))),
+                )
+            except ValueError as e:
+                raise ValueError(f"Configurazione delle richieste hedged non valida: {e}")
+        return _hedger
@@ -0,0 +1,192 @@
+"""Coda persistente (SQLite) delle combinazioni, condivisa da più processi worker anche su macchine diverse."""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections.abc import Collection, Iterable
+from pathlib import Path
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_id() -> str:
+    """Identificativo del processo corrente, univoco tra le macchine che condividono la coda."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """Coda di combinazioni con lease, heartbeat e conteggio dei tentativi.
+
+    Ogni combinazione è identificata da una chiave stabile (per esempio "persona/scenario"): tutti i worker
+    costruiscono la stessa lista di combinazioni e usano la coda solo per decidere chi esegue cosa. Un worker
+    prende una combinazione in lease per `lease_seconds` e la rinnova con l'heartbeat finché la conversazione è
+    in corso; se il processo muore il lease scade e la combinazione torna disponibile per gli altri. Dopo
+    `max_attempts` tentativi la combinazione è segnata come fallita.
+
+    Il database non usa il journal WAL, che richiede memoria condivisa tra i processi e non funziona su file
+    system di rete: i lock di SQLite bastano perché le transazioni sono brevi.
+
+    Args:
+        path: File SQLite della coda.
+        lease_seconds: Durata di un lease senza heartbeat.
+        max_attempts: Tentativi massimi per combinazione, compresi quelli interrotti da un lease scaduto.
+    """
+
+    def __init__(
+        self, path: Path, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    ):
+        if lease_seconds <= 0 or max_attempts < 1:
+            raise ValueError("La durata del lease deve essere positiva e i tentativi almeno 1.")
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._held: dict[str, str] = {}
+        self._heartbeat: threading.Thread | None = None
+        self._stop = threading.Event()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=60)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "key TEXT PRIMARY KEY, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+            "lease_until REAL, error TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)")
+
+    def enqueue(self, keys: Iterable[str]) -> int:
+        """Aggiunge le combinazioni non ancora presenti e restituisce quante sono state aggiunte."""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (key, status, updated_at) VALUES (?, ?, ?)",
+                    ((key, PENDING, now) for key in keys),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def lease(self, worker: str, keys: Collection[str] | None = None) -> str | None:
+        """Prende in lease la prossima combinazione disponibile, oppure None se non ce ne sono.
+
+        Con `keys` si considerano solo le combinazioni indicate: quelle che il worker sa eseguire. Le altre restano
+        disponibili per i worker che le hanno accodate.
+        """
+        now = time.time()
+        # La lista viaggia come un unico parametro JSON, senza il limite di SQLite sul numero di parametri.
+        only = "" if keys is None else " AND key IN (SELECT value FROM json_each(?))"
+        params = (PENDING, LEASED, now) if keys is None else (PENDING, LEASED, now, json.dumps(list(keys)))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # I lease scaduti dopo l'ultimo tentativo non vanno riassegnati.
+                expired = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = 'lease scaduto', worker = NULL, lease_until = NULL, "
+                    "updated_at = ? WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, now, LEASED, now, self.max_attempts),
+                ).rowcount
+                row = self._conn.execute(
+                    "SELECT key, status, worker FROM jobs WHERE (status = ? OR (status = ? AND lease_until < ?))"
+                    f"{only} ORDER BY rowid LIMIT 1",
+                    params,
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, lease_until = ?, "
+                        "updated_at = ? WHERE key = ?",
+                        (LEASED, worker, now + self.lease_seconds, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if row is None:
+                if expired:
+                    logger.error(f"{expired} combinazioni abbandonate: lease scaduto all'ultimo tentativo.")
+                return None
+            if row[1] == LEASED:
+                logger.warning(f"Lease di '{row[0]}' scaduto (worker {row[2]}): la combinazione viene rieseguita.")
+            self._held[row[0]] = worker
+        self._start_heartbeat()
+        return row[0]
+
+    def _renew(self) -> None:
+        now = time.time()
+        with self._lock:
+            for key, worker in list(self._held.items()):
+                renewed = self._conn.execute(
+                    "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE key = ? AND status = ? AND worker = ?",
+                    (now + self.lease_seconds, now, key, LEASED, worker),
+                ).rowcount
+                if not renewed:
+                    logger.warning(f"Lease di '{key}' perso: un altro worker ha ripreso la combinazione.")
+                    del self._held[key]
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-queue-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self._renew()
+            except sqlite3.Error as e:
+                logger.warning(f"Heartbeat della coda non riuscito: {e}")
+
+    def _finish(self, key: str, worker: str, status: str, error: str | None) -> bool:
+        with self._lock:
+            self._held.pop(key, None)
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, worker = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE key = ? AND status = ? AND worker = ?",
+                (status, error, time.time(), key, LEASED, worker),
+            ).rowcount
+        if not updated:
+            logger.warning(f"Esito di '{key}' ignorato: il lease non appartiene più a {worker}.")
+        return bool(updated)
+
+    def complete(self, key: str, worker: str) -> bool:
+        """Segna la combinazione come completata; False se il lease era già passato a un altro worker."""
+        return self._finish(key, worker, DONE, None)
+
+    def fail(self, key: str, worker: str, error: str, retry: bool = True) -> bool:
+        """Restituisce la combinazione alla coda, oppure la segna come fallita se i tentativi sono esauriti."""
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE key = ?", (key,)).fetchone()
+        status = PENDING if retry and row is not None and row[0] < self.max_attempts else FAILED
+        return self._finish(key, worker, status, error)
+
+    def counts(self) -> dict[str, int]:
+        """Numero di combinazioni per stato."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self._conn.close()
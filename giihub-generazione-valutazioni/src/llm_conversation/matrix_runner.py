@@ -0,0 +1,681 @@
+"""Esecuzione della matrice di combinazioni (comportamento x conoscenza) condivisa dagli script run_*.
+
+Gli script definiscono solo i prompt, i metadati dei ticket e la selezione delle combinazioni; esecuzione,
+coda, manifest, prefissi condivisi e statistiche sono qui.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import copy
+import os
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .ai_agent import AIAgent
+from .backends import get_backend_registry
+from .concurrency import get_concurrency_controller
+from .config import Config, load_config
+from .conversation_manager import ConversationManager
+from .errors import ConversationAborted
+from .hedging import get_hedger
+from .job_queue import DEFAULT_LEASE_SECONDS, LEASED, JobQueue, default_worker_id
+from .logging_config import get_logger, setup_logging
+from .metrics import get_run_metrics
+from .prefix_tree import PrefixTree, prefix_key
+from .rate_limiter import get_rate_limiter
+from .response_cache import get_response_cache
+from .run_manifest import ABORTED, DONE, FAILED, RUNNING, RunManifest, checkpoint_path, input_hash, read_checkpoint
+from .scheduling import ORDERS, ConversationStats, estimate_makespan, order_jobs, simulate_prefix_hit_rate
+from .termination import DEFAULT_MAX_TURNS, TerminationEngine
+from .wavefront import get_wavefront_batcher
+
+logger = get_logger(__name__)
+
+# Intervallo massimo tra due tentativi di lease quando la coda non ha combinazioni libere.
+QUEUE_POLL_SECONDS = 5.0
+
+
+@dataclass
+class MatrixJob:
+    """Una singola combinazione della matrice, pronta per essere eseguita."""
+
+    behavior_name: str
+    knowledge_name: str
+    context_key: str
+    config: Config
+    output_path: Path
+    # Volte in cui la combinazione è già stata rimessa in coda dopo una conversazione interrotta.
+    requeues: int = 0
+
+    @property
+    def key(self) -> str:
+        """Chiave stabile della combinazione, uguale in tutti i processi che eseguono la stessa matrice."""
+        return f"{self.behavior_name}/{self.knowledge_name}"
+
+
+def build_jobs(
+    base_config: Config,
+    combinations: Iterable[tuple[dict[str, Any], dict[str, Any]]],
+    agent1_prompt: str,
+    ticket_metadata: dict[str, dict[str, str]],
+    output_dir: Path,
+) -> list[MatrixJob]:
+    """Costruisce la configurazione di ogni combinazione, formattando i prompt di sistema dei due agenti."""
+    jobs: list[MatrixJob] = []
+    for behavior_dict, knowledge_dict in combinations:
+        current_config = copy.deepcopy(base_config)
+        context_key = knowledge_dict["context_key"]
+        ticket_info = ticket_metadata[context_key]
+        current_config.agents[0].system_prompt = agent1_prompt.format(
+            ticket_id=ticket_info["ticket_id"], customer_problem=ticket_info["customer_problem"]
+        )
+        current_config.agents[1].system_prompt = behavior_dict["prompt"].format(knowledge=knowledge_dict["prompt"])
+        jobs.append(
+            MatrixJob(
+                behavior_name=behavior_dict["name"],
+                knowledge_name=knowledge_dict["name"],
+                context_key=context_key,
+                config=current_config,
+                output_path=output_dir / behavior_dict["name"] / f"{knowledge_dict['name']}.json",
+            )
+        )
+    return jobs
+
+
+def run_jobs(
+    jobs: list[MatrixJob],
+    run_fn: Callable[[MatrixJob], None],
+    workers: int = 1,
+    on_done: Callable[[MatrixJob], None] | None = None,
+    max_requeues: int = 0,
+) -> None:
+    """Esegue le combinazioni, in sequenza oppure su un pool limitato di `workers` thread.
+
+    Le combinazioni sono indipendenti tra loro e quasi tutto il tempo è attesa di rete, quindi un pool di thread
+    basta a sovrapporle. `on_done` viene sempre chiamato dal thread chiamante, così l'aggiornamento della barra
+    di avanzamento resta sequenziale come nel ciclo originale.
+
+    Se `run_fn` solleva ConversationAborted la combinazione viene rimessa in fondo alla coda, fino a
+    `max_requeues` volte; poi viene segnalata come fallita. Qualsiasi altra eccezione viene registrata nel log e
+    non ferma le combinazioni successive.
+    """
+
+    def requeue(job: MatrixJob, error: ConversationAborted) -> bool:
+        if job.requeues >= max_requeues:
+            logger.error(
+                f"Combinazione {job.behavior_name}/{job.knowledge_name} abbandonata dopo {job.requeues} "
+                f"nuovi tentativi: {error}"
+            )
+            return False
+        job.requeues += 1
+        logger.warning(
+            f"Combinazione {job.behavior_name}/{job.knowledge_name} rimessa in coda "
+            f"({job.requeues}/{max_requeues}): {error}"
+        )
+        return True
+
+    if workers <= 1:
+        queue = collections.deque(jobs)
+        while queue:
+            job = queue.popleft()
+            try:
+                run_fn(job)
+            except ConversationAborted as e:
+                if requeue(job, e):
+                    queue.append(job)
+                    continue
+            except Exception as e:
+                logger.error(f"Combinazione {job.behavior_name}/{job.knowledge_name} fallita: {e}", exc_info=True)
+            if on_done:
+                on_done(job)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="matrix") as executor:
+        futures = {executor.submit(run_fn, job): job for job in jobs}
+        while futures:
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                job = futures.pop(future)
+                try:
+                    future.result()
+                except ConversationAborted as e:
+                    if requeue(job, e):
+                        futures[executor.submit(run_fn, job)] = job
+                        continue
+                except Exception as e:
+                    # Un errore irreversibile chiude solo la sua combinazione, non il pool.
+                    logger.error(f"Combinazione {job.behavior_name}/{job.knowledge_name} fallita: {e}", exc_info=True)
+                if on_done:
+                    on_done(job)
+
+
+def run_queue(
+    queue: JobQueue,
+    jobs: list[MatrixJob],
+    run_fn: Callable[[MatrixJob], None],
+    worker_id: str,
+    workers: int = 1,
+    on_done: Callable[[MatrixJob], None] | None = None,
+) -> None:
+    """Esegue le combinazioni prese in lease da una coda condivisa, finché la coda non è vuota.
+
+    Ogni processo accoda la propria lista `jobs` e prende in lease solo combinazioni di quella lista; la coda
+    decide quali tocca eseguire a questo processo. Fino a `workers` combinazioni sono in corso contemporaneamente.
+    Una ConversationAborted restituisce la combinazione alla coda (fino ai tentativi massimi della coda), ogni altra
+    eccezione la segna come fallita; un crash del processo lascia scadere il lease e la combinazione viene ripresa
+    da un altro worker. Per questo un processo termina solo quando nessuna
+    combinazione è più in lease, nemmeno presso altri worker. `on_done` viene chiamato dal thread chiamante.
+    """
+    poll = min(QUEUE_POLL_SECONDS, queue.lease_seconds / 3)
+    by_key = {job.key: job for job in jobs}
+    queue.enqueue(by_key)
+
+    def lease() -> MatrixJob | None:
+        # Solo le combinazioni di questo worker: le altre (escluse da --limit o già completate secondo il suo
+        # manifest) restano in coda per i worker che le eseguono.
+        key = queue.lease(worker_id, keys=by_key)
+        return None if key is None else by_key[key]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="queue") as executor:
+        futures: dict[concurrent.futures.Future, MatrixJob] = {}
+        while True:
+            while len(futures) < max(1, workers) and (job := lease()) is not None:
+                futures[executor.submit(run_fn, job)] = job
+            if not futures:
+                if queue.counts()[LEASED] == 0:
+                    break
+                # Altri worker hanno combinazioni in corso: se muoiono i loro lease scadono e vanno ripresi.
+                time.sleep(poll)
+                continue
+            done, _ = concurrent.futures.wait(futures, timeout=poll, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                job = futures.pop(future)
+                try:
+                    future.result()
+                except ConversationAborted as e:
+                    logger.warning(f"Combinazione {job.key} restituita alla coda: {e}")
+                    queue.fail(job.key, worker_id, str(e))
+                    continue
+                except Exception as e:
+                    logger.error(f"Combinazione {job.key} fallita: {e}", exc_info=True)
+                    queue.fail(job.key, worker_id, f"{type(e).__name__}: {e}", retry=False)
+                else:
+                    queue.complete(job.key, worker_id)
+                if on_done:
+                    on_done(job)
+
+
+@dataclass
+class MatrixSpec:
+    """Parti della matrice che dipendono dallo script run_*: approccio, prompt dell'Agente 1 e frasi di congedo."""
+
+    approach: str
+    agent1_prompt: str
+    ticket_metadata: dict[str, dict[str, str]]
+    termination_phrases: dict[str, list[Any]]
+
+
+@dataclass
+class RunOptions:
+    """Opzioni di esecuzione comuni a tutti gli script run_*, lette dalla riga di comando."""
+
+    dry_run: bool = False
+    workers: int = 1
+    cache_path: Path | None = None
+    record_dir: Path | None = None
+    replay_dir: Path | None = None
+    replay_scale: float = 1.0
+    metrics_file: Path | None = None
+    context_cache: bool = False
+    requeue: int = 2
+    adaptive: bool = False
+    hedge: float | None = None
+    queue_path: Path | None = None
+    resume: bool = True
+    share_prefix: bool = False
+    order: str = "product"
+    wavefront: bool = False
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "RunOptions":
+        """Costruisce le opzioni dagli argomenti aggiunti da `add_run_arguments` (più `--dry-run` dello script)."""
+        return cls(
+            dry_run=args.dry_run,
+            workers=args.workers,
+            cache_path=args.cache,
+            record_dir=args.record,
+            replay_dir=args.replay,
+            replay_scale=args.replay_scale,
+            metrics_file=args.metrics_file,
+            context_cache=args.context_cache,
+            requeue=args.requeue,
+            adaptive=args.adaptive,
+            hedge=args.hedge,
+            queue_path=args.queue,
+            resume=not args.no_resume,
+            share_prefix=args.share_prefix,
+            order=args.order,
+            wavefront=args.wavefront,
+        )
+
+
+def add_run_arguments(parser: argparse.ArgumentParser) -> None:
+    """Aggiunge al parser di uno script run_* le opzioni di esecuzione comuni (vedi `RunOptions`)."""
+    parser.add_argument("--workers", type=int, default=1, help="Numero di conversazioni eseguite in parallelo.")
+    parser.add_argument(
+        "--context-cache",
+        action="store_true",
+        help="Registra ogni prompt di sistema una sola volta nella cache di contesto del modello.",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Adatta il numero di chiamate al modello in volo (AIMD) a latenza ed errori.",
+    )
+    parser.add_argument(
+        "--hedge",
+        type=float,
+        default=None,
+        metavar="PERCENTILE",
+        help="Duplica le chiamate più lente del percentile indicato (es. 95); la più veloce vince. "
+        "Budget di copie: LLM_CONVERSATION_HEDGE_BUDGET (default 0.1).",
+    )
+    parser.add_argument("--cache", type=Path, default=None, help="File SQLite della cache delle risposte del modello.")
+    parser.add_argument(
+        "--record", type=Path, default=None, help="Directory in cui registrare richieste e risposte del modello."
+    )
+    parser.add_argument(
+        "--replay", type=Path, default=None, help="Directory di una registrazione da riprodurre senza rete."
+    )
+    parser.add_argument(
+        "--replay-scale",
+        type=float,
+        default=1.0,
+        help="Fattore applicato alle latenze registrate (0 = nessuna attesa).",
+    )
+    parser.add_argument(
+        "--queue",
+        type=Path,
+        default=None,
+        help="File SQLite di una coda condivisa: più processi, anche su macchine diverse, si dividono le combinazioni.",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Rigenera tutte le combinazioni ignorando il manifest e i checkpoint di un'esecuzione precedente.",
+    )
+    parser.add_argument(
+        "--share-prefix",
+        action="store_true",
+        help="Genera il saluto iniziale dell'Agente 1 una volta per ticket e dirama da lì le combinazioni.",
+    )
+    parser.add_argument(
+        "--order",
+        choices=ORDERS,
+        default="product",
+        help="Ordine delle combinazioni: 'product' (comportamento x conoscenza), 'prefix' (raggruppate per ticket e "
+        "persona, per le cache di prefisso) o 'lpt' (prima le più lunghe secondo le run precedenti).",
+    )
+    parser.add_argument(
+        "--wavefront",
+        action="store_true",
+        help="Invia insieme, come un unico batch, i turni in attesa dei dialoghi in corso (backend con batching, "
+        "per esempio un server locale o lo shim).",
+    )
+    parser.add_argument(
+        "--requeue",
+        type=int,
+        default=2,
+        help="Volte in cui rimettere in coda una conversazione interrotta da un errore del modello.",
+    )
+    parser.add_argument(
+        "--metrics-file", type=Path, default=None, help="File di testo OpenMetrics con le misure dell'esecuzione."
+    )
+
+
+def run_conversation_job(
+    job: MatrixJob,
+    spec: MatrixSpec,
+    console: Any,
+    manifest: RunManifest | None = None,
+    resume: bool = True,
+    prefixes: PrefixTree | None = None,
+    stats: ConversationStats | None = None,
+) -> None:
+    """Esegue e salva la conversazione di una combinazione, registrandone stato, checkpoint e statistiche.
+
+    Le eccezioni vengono propagate dopo aver aggiornato il manifest: ConversationAborted perché `run_jobs` e
+    `run_queue` rimettano la combinazione in coda, le altre perché la segnino come fallita.
+    """
+    config, output_path, key = job.config, job.output_path, job.key
+    digest = input_hash(config)
+    checkpoint = checkpoint_path(output_path)
+    try:
+        agents = [AIAgent(config=agent_config) for agent_config in config.agents]
+        manager = ConversationManager(
+            agents=agents,
+            initial_message=config.settings.initial_message,
+            termination=TerminationEngine.from_settings(config.settings, spec.termination_phrases),
+        )
+        if manifest is not None:
+            state = read_checkpoint(checkpoint, digest) if resume else None
+            if state is not None:
+                manager.load_state(state)
+                logger.info(f"Conversazione {key} ripresa dal checkpoint dopo {len(manager.history)} risposte.")
+            manifest.mark(key, digest, RUNNING)
+        if prefixes is not None and not manager.history:
+            # Il saluto dell'Agente 1 non dipende dalla persona dell'Agente 2: si genera una volta per ticket e
+            # ogni combinazione ne è un ramo.
+            def run_opening() -> ConversationManager:
+                opening = ConversationManager(
+                    agents=[AIAgent(config=agent_config) for agent_config in config.agents],
+                    initial_message=config.settings.initial_message,
+                    termination=manager.termination,
+                )
+                for _ in opening.run_conversation():
+                    break
+                return opening
+
+            opening_key = prefix_key(config.agents[0], config.settings.initial_message)
+            manager = prefixes.get_or_run(opening_key, run_opening).fork(
+                agents=agents, termination=manager.termination, label=f"opening:{opening_key[:12]}"
+            )
+        for _ in manager.run_conversation():
+            # Dopo ogni turno lo stato di entrambi gli agenti è coerente: un'interruzione riprende da qui.
+            if manifest is not None:
+                manager.save_checkpoint(checkpoint, input_hash=digest)
+        manager.save_conversation(output_path)
+        if manifest is not None:
+            manifest.mark(key, digest, DONE, output_path)
+            checkpoint.unlink(missing_ok=True)
+        summary = manager.summary()
+        if stats is not None:
+            # Di un ramo si contano le sole risposte generate, le uniche coperte dalla sua durata.
+            stats.record(
+                spec.approach,
+                job.behavior_name,
+                job.knowledge_name,
+                len(manager.generated_history()),
+                summary["duration_seconds"],
+            )
+        get_run_metrics().observe_conversation(
+            summary,
+            manager.generated_history(),
+            {"approach": spec.approach, "persona": job.behavior_name, "scenario": job.knowledge_name},
+        )
+    except ConversationAborted:
+        # Nessuna trascrizione parziale: la combinazione viene rimessa in coda e, con il manifest, riprende
+        # dall'ultimo turno valido del checkpoint.
+        if manifest is not None:
+            manifest.mark(key, digest, ABORTED)
+        raise
+    except Exception as e:
+        if manifest is not None:
+            manifest.mark(key, digest, FAILED)
+        console.print(f"[bold red]Errore nella conversazione per {output_path.name}: {e}[/bold red]")
+        raise
+
+
+def _apply_options(options: RunOptions, console: Any) -> None:
+    """Attiva, tramite le variabili d'ambiente lette dai moduli, le funzioni richieste dalla riga di comando."""
+    if options.dry_run:
+        os.environ["LLM_CONVERSATION_DRY_RUN"] = "1"
+        console.print("[bold yellow]Modalità DRY-RUN attivata.[/bold yellow]")
+    if options.context_cache:
+        os.environ["LLM_CONVERSATION_CONTEXT_CACHE"] = "1"
+        console.print("[bold cyan]Cache di contesto dei prompt di sistema attiva.[/bold cyan]")
+    if options.adaptive:
+        os.environ["LLM_CONVERSATION_ADAPTIVE_CONCURRENCY"] = "1"
+        console.print("[bold cyan]Concorrenza adattiva (AIMD) delle chiamate al modello attiva.[/bold cyan]")
+    if options.hedge is not None:
+        os.environ["LLM_CONVERSATION_HEDGE_PERCENTILE"] = str(options.hedge)
+        console.print(
+            f"[bold cyan]Richieste hedged attive: copia delle chiamate oltre il p{options.hedge:g} della "
+            "latenza.[/bold cyan]"
+        )
+    if options.wavefront:
+        os.environ["LLM_CONVERSATION_WAVEFRONT"] = "1"
+        if options.workers <= 1:
+            console.print(
+                "[bold yellow]Attenzione: con un solo worker ogni batch contiene un turno; usare --workers > 1."
+                "[/bold yellow]"
+            )
+        else:
+            console.print(
+                f"[bold cyan]Modalità a ondate: i turni in attesa dei {options.workers} dialoghi in corso partono "
+                "in un unico batch.[/bold cyan]"
+            )
+    if options.cache_path is not None:
+        os.environ["LLM_CONVERSATION_CACHE"] = str(options.cache_path)
+        console.print(f"[bold cyan]Cache delle risposte attiva: {options.cache_path}[/bold cyan]")
+    if options.record_dir is not None:
+        os.environ["LLM_CONVERSATION_RECORD_DIR"] = str(options.record_dir)
+        console.print(f"[bold cyan]Registrazione delle risposte in: {options.record_dir}[/bold cyan]")
+    if options.replay_dir is not None:
+        os.environ["LLM_CONVERSATION_REPLAY_DIR"] = str(options.replay_dir)
+        os.environ["LLM_CONVERSATION_REPLAY_SCALE"] = str(options.replay_scale)
+        console.print(
+            f"[bold cyan]Riproduzione delle risposte da: {options.replay_dir} (latenze x{options.replay_scale})"
+            "[/bold cyan]"
+        )
+
+
+def _report_run(console: Any, order: str, estimated_hit_rate: float, prefixes: PrefixTree | None) -> None:
+    """Stampa ed esporta come metriche le statistiche dei componenti attivi durante l'esecuzione."""
+    metrics = get_run_metrics()
+    controller = get_concurrency_controller()
+    if controller is not None:
+        controller_stats = controller.stats()
+        for name in ("limit", "peak_in_flight", "increases", "decreases"):
+            metrics.set_gauge(f"adaptive_concurrency_{name}", controller_stats[name])
+        console.print(
+            f"[bold cyan]Concorrenza adattiva: limite finale {controller_stats['limit']}, picco "
+            f"{controller_stats['peak_in_flight']} chiamate in volo, {controller_stats['decreases']} riduzioni."
+            "[/bold cyan]"
+        )
+
+    hedger = get_hedger()
+    if hedger is not None:
+        hedge_stats = hedger.stats()
+        for name in ("calls", "hedges", "hedge_wins"):
+            metrics.set_gauge(f"hedged_requests_{name}", hedge_stats[name])
+        console.print(
+            f"[bold cyan]Richieste hedged: {hedge_stats['hedges']} copie su {hedge_stats['calls']} chiamate, "
+            f"{hedge_stats['hedge_wins']} vinte dalla copia.[/bold cyan]"
+        )
+
+    batcher = get_wavefront_batcher()
+    if batcher is not None:
+        batch_stats = batcher.stats()
+        for name in ("batches", "requests", "mean_batch_size", "largest_batch"):
+            metrics.set_gauge(f"wavefront_{name}", batch_stats[name])
+        console.print(
+            f"[bold cyan]Modalità a ondate: {batch_stats['requests']} turni in {batch_stats['batches']} batch "
+            f"(media {batch_stats['mean_batch_size']:.1f}, massimo {batch_stats['largest_batch']}).[/bold cyan]"
+        )
+
+    pool_stats = get_backend_registry().pool.stats()
+    if pool_stats["created"]:
+        for name in ("created", "reused"):
+            metrics.set_gauge(f"http_connections_{name}", pool_stats[name])
+        console.print(
+            f"[bold cyan]Connessioni HTTP ai backend locali: {pool_stats['created']} aperte, "
+            f"{pool_stats['reused']} riusate.[/bold cyan]"
+        )
+
+    # La stima iniziale confronta gli ordini; questa è la frazione dei token di prompt che il provider ha davvero
+    # servito dalla cache.
+    measured_hit_rate = metrics.prefix_cache_hit_rate()
+    if measured_hit_rate is not None:
+        metrics.set_gauge("prefix_cache_measured_hit_rate", measured_hit_rate, {"order": order})
+        console.print(
+            f"[bold cyan]Ordine '{order}': hit rate misurato della cache di prefisso {measured_hit_rate:.1%} "
+            f"(stimato {estimated_hit_rate:.1%}).[/bold cyan]"
+        )
+
+    if prefixes is not None:
+        console.print(
+            f"[bold cyan]Prefissi condivisi: {prefixes.misses} generati, {prefixes.hits} riusati.[/bold cyan]"
+        )
+
+
+def run_matrix(
+    spec: MatrixSpec,
+    combinations: list[tuple[dict[str, Any], dict[str, Any]]],
+    config_path: Path,
+    output_dir: Path,
+    options: RunOptions,
+    console: Any,
+    progress_factory: Callable[..., Any],
+) -> None:
+    """Esegue le combinazioni selezionate da uno script run_* con le opzioni della riga di comando.
+
+    `console` e `progress_factory` sono la Console e la classe Progress di rich, o i loro sostituti quando rich
+    non è installato.
+    """
+    setup_logging()  # Attiva il logging configurato nel .env
+    _apply_options(options, console)
+    if options.record_dir is not None and options.replay_dir is not None:
+        console.print("[bold red]Errore fatale: --record e --replay non possono essere usati insieme.[/bold red]")
+        return
+
+    try:
+        base_config = load_config(str(config_path))
+    except ValueError as e:
+        console.print(f"[bold red]Errore fatale: {e}[/bold red]")
+        return
+    # Limiti di richieste e token al minuto per modello, condivisi da tutte le conversazioni del processo.
+    get_rate_limiter().configure(base_config.rate_limits)
+    if options.wavefront:
+        batcher = get_wavefront_batcher()
+        unbatched = sorted({agent.model for agent in base_config.agents if not batcher.supports(agent.model)})
+        if unbatched:
+            console.print(
+                f"[bold yellow]Attenzione: il backend di {', '.join(unbatched)} non accetta richieste in batch, "
+                "i loro turni partono da soli.[/bold yellow]"
+            )
+
+    console.print(f"[bold cyan]Trovate {len(combinations)} combinazioni uniche da generare.[/bold cyan]")
+    jobs = build_jobs(base_config, combinations, spec.agent1_prompt, spec.ticket_metadata, output_dir)
+
+    # Il manifest registra stato e hash degli input di ogni combinazione. In dry-run non si registra nulla,
+    # altrimenti le risposte simulate passerebbero per conversazioni completate.
+    manifest = None if options.dry_run else RunManifest(output_dir / "run_manifest.jsonl")
+    if manifest is not None and options.resume:
+        pending_jobs = [job for job in jobs if not manifest.is_done(job.key, input_hash(job.config), job.output_path)]
+        if len(pending_jobs) < len(jobs):
+            console.print(
+                f"[bold cyan]{len(jobs) - len(pending_jobs)} combinazioni già completate con gli stessi input: "
+                "saltate.[/bold cyan]"
+            )
+        jobs = pending_jobs
+    if options.workers > 1:
+        console.print(f"[bold cyan]Esecuzione parallela con {options.workers} worker.[/bold cyan]")
+
+    # Durate attese delle combinazioni dalle run precedenti, per l'ordine "lpt" e la stima della durata totale.
+    stats = ConversationStats(output_dir / "conversation_stats.json")
+    default_messages = base_config.settings.max_turns or DEFAULT_MAX_TURNS
+
+    def expected(job: MatrixJob) -> float:
+        return stats.expected_seconds(spec.approach, job.behavior_name, job.knowledge_name, default_messages)
+
+    # Stima dell'effetto dell'ordine sulle cache di prefisso (provider o locali) e sulla durata totale,
+    # confrontabile tra gli ordini.
+    orders = {name: order_jobs(jobs, name, options.workers, expected) for name in ORDERS}
+    hit_rates = {name: simulate_prefix_hit_rate(ordered, options.workers) for name, ordered in orders.items()}
+    makespans = {name: estimate_makespan(ordered, options.workers, expected) for name, ordered in orders.items()}
+    for name in ORDERS:
+        get_run_metrics().set_gauge("prefix_cache_estimated_hit_rate", hit_rates[name], {"order": name})
+        get_run_metrics().set_gauge("makespan_estimated_seconds", makespans[name], {"order": name})
+    order = options.order
+    jobs = orders[order]
+    others = ", ".join(f"'{name}' {rate:.1%}" for name, rate in hit_rates.items() if name != order)
+    console.print(
+        f"[bold cyan]Ordine '{order}': hit rate della cache di prefisso stimato dalla simulazione "
+        f"{hit_rates[order]:.1%} ({others}).[/bold cyan]"
+    )
+    if stats.has_history():
+        others = ", ".join(f"'{name}' {seconds:.0f}s" for name, seconds in makespans.items() if name != order)
+        console.print(f"[bold cyan]Durata stimata dallo storico: {makespans[order]:.0f}s ({others}).[/bold cyan]")
+
+    def progress_description() -> str:
+        controller = get_concurrency_controller()
+        if controller is None:
+            return "[green]Generazione conversazioni..."
+        controller_stats = controller.stats()
+        return (
+            "[green]Generazione conversazioni... "
+            f"(chiamate in volo {controller_stats['in_flight']}/{controller_stats['limit']})"
+        )
+
+    prefixes = PrefixTree() if options.share_prefix else None
+    if prefixes is not None:
+        console.print(
+            "[bold cyan]Saluto iniziale dell'Agente 1 generato una volta per ticket e condiviso tra le combinazioni."
+            "[/bold cyan]"
+        )
+
+    queue = None
+    if options.queue_path is not None:
+        # I tentativi della coda comprendono la prima esecuzione: --requeue N equivale a N + 1 tentativi.
+        queue = JobQueue(
+            options.queue_path,
+            lease_seconds=float(os.getenv("LLM_CONVERSATION_QUEUE_LEASE", str(DEFAULT_LEASE_SECONDS))),
+            max_attempts=options.requeue + 1,
+        )
+        console.print(f"[bold cyan]Coda condivisa: {options.queue_path} (worker {default_worker_id()}).[/bold cyan]")
+
+    def run_job(job: MatrixJob) -> None:
+        run_conversation_job(job, spec, console, manifest, options.resume, prefixes, None if options.dry_run else stats)
+
+    with progress_factory(console=console) as progress:
+        task = progress.add_task("[green]Generazione conversazioni...", total=len(jobs))
+        if queue is None:
+            run_jobs(
+                jobs,
+                run_job,
+                workers=options.workers,
+                on_done=lambda job: progress.update(task, advance=1, description=progress_description()),
+                max_requeues=options.requeue,
+            )
+        else:
+            # L'avanzamento riflette tutta la coda, comprese le combinazioni completate dagli altri worker.
+            def queue_progress(job: MatrixJob) -> None:
+                counts = queue.counts()
+                progress.update(task, completed=counts["done"] + counts["failed"], description=progress_description())
+
+            run_queue(
+                queue,
+                jobs,
+                run_job,
+                worker_id=default_worker_id(),
+                workers=options.workers,
+                on_done=queue_progress,
+            )
+
+    if queue is not None:
+        counts = queue.counts()
+        queue.close()
+        console.print(
+            f"[bold cyan]Coda: {counts['done']} combinazioni completate, {counts['failed']} fallite.[/bold cyan]"
+        )
+
+    _report_run(console, order, hit_rates[order], prefixes)
+    stats.save()
+
+    if options.metrics_file is not None:
+        get_run_metrics().write_openmetrics(options.metrics_file)
+        console.print(f"[bold cyan]Metriche OpenMetrics scritte in: {options.metrics_file}[/bold cyan]")
+
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        console.print(
+            f"[bold cyan]Cache: {response_cache.hits} risposte riusate, {response_cache.misses} chiamate al modello."
+            "[/bold cyan]"
+        )
+
+    console.print("\n[bold green]Operazione completata![/bold green]")
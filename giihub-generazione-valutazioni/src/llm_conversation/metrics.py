@@ -0,0 +1,137 @@
+"""Raccolta delle misure di una esecuzione ed esportazione in formato testo OpenMetrics."""
+
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+PREFIX = "llm_conversation"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+class RunMetrics:
+    """Aggrega le misure per turno e per conversazione di tutta l'esecuzione, in modo thread-safe."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: dict[str, dict[tuple, float]] = defaultdict(dict)
+        self._histograms: dict[str, dict[tuple, _Histogram]] = defaultdict(dict)
+        # Token di prompt serviti dalla cache di prefisso e token di prompt totali, sui turni che li riportano entrambi.
+        self._cached_prompt_tokens = [0, 0]
+
+    def observe_conversation(
+        self, summary: dict[str, Any], turns: list[dict[str, Any]], labels: dict[str, str]
+    ) -> None:
+        """Registra una conversazione conclusa.
+
+        Args:
+            summary: Riepilogo prodotto da `ConversationManager.summary()`.
+            turns: Risposte generate dalla conversazione (`ConversationManager.generated_history()`), con le misure
+                di ogni turno nella chiave "metrics".
+            labels: Etichette della combinazione (per esempio approach, persona, scenario).
+        """
+        conversation_key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters["conversations_total"][conversation_key] += 1
+            if summary.get("duration_seconds") is not None:
+                self._gauges["conversation_duration_seconds"][conversation_key] = summary["duration_seconds"]
+            self._gauges["conversation_turns"][conversation_key] = summary.get("turns", 0)
+            for turn in turns:
+                metrics = turn.get("metrics", {})
+                key = tuple(sorted({**labels, "agent": turn["speaker"]}.items()))
+                self._counters["turns_total"][key] += 1
+                self._counters["retries_total"][key] += metrics.get("retries") or 0
+                for direction in ("prompt", "output", "cached"):
+                    tokens = metrics.get(f"{direction}_tokens")
+                    if tokens is not None:
+                        self._counters["tokens_total"][key + (("direction", direction),)] += tokens
+                if metrics.get("cached_tokens") is not None and metrics.get("prompt_tokens"):
+                    self._cached_prompt_tokens[0] += metrics["cached_tokens"]
+                    self._cached_prompt_tokens[1] += metrics["prompt_tokens"]
+                for name, field in (
+                    ("turn_latency_seconds", "latency_seconds"),
+                    ("turn_ttft_seconds", "ttft_seconds"),
+                ):
+                    value = metrics.get(field)
+                    if value is not None:
+                        self._histograms[name].setdefault(key, _Histogram()).observe(value)
+
+    def prefix_cache_hit_rate(self) -> float | None:
+        """Frazione misurata dei token di prompt serviti dalla cache di prefisso del provider.
+
+        Aggrega `cached_tokens / prompt_tokens` dei turni osservati; None se nessun turno riporta i token in cache.
+        """
+        with self._lock:
+            cached, prompt = self._cached_prompt_tokens
+        return cached / prompt if prompt else None
+
+    def set_gauge(self, name: str, value: float, labels: dict[str, str] | None = None) -> None:
+        """Imposta il valore corrente di un gauge."""
+        with self._lock:
+            self._gauges[name][tuple(sorted((labels or {}).items()))] = value
+
+    def render(self) -> str:
+        """Restituisce tutte le misure nel formato testo OpenMetrics."""
+        lines: list[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                family = f"{PREFIX}_{name.removesuffix('_total')}"
+                lines.append(f"# TYPE {family} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{family}_total{_labels(dict(key))} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                family = f"{PREFIX}_{name}"
+                lines.append(f"# TYPE {family} gauge")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{family}{_labels(dict(key))} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                family = f"{PREFIX}_{name}"
+                lines.append(f"# TYPE {family} histogram")
+                lines.append(f"# UNIT {family} seconds")
+                for key, histogram in sorted(series.items()):
+                    labels = dict(key)
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                        lines.append(f"{family}_bucket{_labels({**labels, 'le': f'{bound:g}'})} {count}")
+                    lines.append(f"{family}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+                    lines.append(f"{family}_count{_labels(labels)} {histogram.count}")
+                    lines.append(f"{family}_sum{_labels(labels)} {histogram.sum:g}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_openmetrics(self, path: Path) -> None:
+        """Scrive le misure in un file di testo OpenMetrics."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.render(), encoding="utf-8")
+
+
+_run_metrics = RunMetrics()
+
+
+def get_run_metrics() -> RunMetrics:
+    """Restituisce il collettore delle misure del processo."""
+    return _run_metrics
@@ -0,0 +1,138 @@
+"""Pool dei modelli condiviso dal processo, con cache di contesto opzionale per i prompt di sistema."""
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+import google.generativeai as genai
+
+from .backends import get_backend_registry
+from .logging_config import get_logger
+from .response_cache import sha256_text
+
+logger = get_logger(__name__)
+
+DEFAULT_CONTEXT_CACHE_TTL = 3600
+# Una cache di contesto viene ricreata quando le resta meno di questa frazione del TTL, così una conversazione
+# appena iniziata non si trova il prefisso scaduto a metà.
+REFRESH_FRACTION = 0.2
+
+
+@dataclass
+class PooledModel:
+    """Modello condiviso e numero di messaggi iniziali della cronologia già coperti dalla cache di contesto."""
+
+    model: Any
+    cached_messages: int = 0
+    expires_at: float | None = None
+
+
+class ModelPool:
+    """Crea un solo modello per coppia (modello, prompt di sistema) e lo riusa in tutte le conversazioni.
+
+    Il modello viene creato dal backend indicato dal prefisso del nome (vedi backends.split_model).
+
+    Con la cache di contesto attiva il prompt di sistema viene registrato una volta sola sul server, sia come
+    istruzione di sistema sia come primo messaggio della cronologia (che l'agente invia come turno utente): le
+    chiamate successive vi fanno riferimento per nome invece di rinviarlo. Se la registrazione fallisce (per
+    esempio perché il prompt è sotto la dimensione minima accettata dal servizio) si usa il modello semplice.
+
+    Args:
+        context_cache: Se registrare i prompt di sistema nella cache di contesto del servizio.
+        ttl_seconds: Durata di ogni contenuto in cache.
+    """
+
+    def __init__(self, context_cache: bool = False, ttl_seconds: float = DEFAULT_CONTEXT_CACHE_TTL):
+        self.context_cache = context_cache
+        self.ttl_seconds = ttl_seconds
+        self._models: dict[tuple[str, str], PooledModel] = {}
+        self._lock = threading.Lock()
+        # Un lock per coppia: la creazione di una cache di contesto (una chiamata di rete) blocca solo chi
+        # aspetta lo stesso modello, non l'intero pool.
+        self._create_locks: dict[tuple[str, str], threading.Lock] = {}
+
+    def _key(self, model_name: str, system_prompt: str) -> tuple[str, str]:
+        return model_name, sha256_text(system_prompt or "")
+
+    def _ready(self, key: tuple[str, str]) -> PooledModel | None:
+        """Il modello già nel pool per `key`, se esiste e la sua cache di contesto non è in scadenza."""
+        with self._lock:
+            pooled = self._models.get(key)
+        if pooled is None or (
+            pooled.expires_at is not None
+            and pooled.expires_at - time.monotonic() < self.ttl_seconds * REFRESH_FRACTION
+        ):
+            return None
+        return pooled
+
+    def get(self, model_name: str, system_prompt: str) -> PooledModel:
+        """Restituisce il modello per la coppia (modello, prompt di sistema), creandolo se necessario."""
+        key = self._key(model_name, system_prompt)
+        pooled = self._ready(key)
+        if pooled is not None:
+            return pooled
+        with self._lock:
+            create_lock = self._create_locks.setdefault(key, threading.Lock())
+        with create_lock:
+            # Un altro thread potrebbe averlo creato mentre si attendeva il lock.
+            pooled = self._ready(key)
+            if pooled is None:
+                pooled = self._create(model_name, system_prompt)
+                with self._lock:
+                    self._models[key] = pooled
+            return pooled
+
+    async def aget(self, model_name: str, system_prompt: str) -> PooledModel:
+        """Variante di `get` per l'event loop: se il modello va creato, la creazione avviene in un thread."""
+        pooled = self._ready(self._key(model_name, system_prompt))
+        if pooled is not None:
+            return pooled
+        return await asyncio.to_thread(self.get, model_name, system_prompt)
+
+    def _create(self, model_name: str, system_prompt: str) -> PooledModel:
+        backend, backend_model = get_backend_registry().resolve(model_name)
+        if self.context_cache and system_prompt and backend.context_cache:
+            try:
+                cached_content = genai.caching.CachedContent.create(
+                    model=backend_model,
+                    system_instruction=system_prompt,
+                    contents=[{"role": "user", "parts": [{"text": system_prompt}]}],
+                    ttl=timedelta(seconds=self.ttl_seconds),
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+                logger.info(f"Cache di contesto '{cached_content.name}' creata per il modello '{model_name}'.")
+                return PooledModel(model, cached_messages=1, expires_at=time.monotonic() + self.ttl_seconds)
+            except Exception as e:
+                logger.warning(
+                    f"Cache di contesto non disponibile per il modello '{model_name}', uso il modello semplice: {e}"
+                )
+        return PooledModel(backend.create_model(backend_model, system_prompt))
+
+
+_pool: ModelPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> ModelPool:
+    """Restituisce il pool dei modelli del processo, creandolo alla prima chiamata.
+
+    Env vars:
+        LLM_CONVERSATION_CONTEXT_CACHE: Se "1"/"true", registra i prompt di sistema nella cache di contesto
+        LLM_CONVERSATION_CONTEXT_CACHE_TTL: Durata di ogni contenuto in cache, in secondi (default: 3600)
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                ttl_seconds = float(os.getenv("LLM_CONVERSATION_CONTEXT_CACHE_TTL", str(DEFAULT_CONTEXT_CACHE_TTL)))
+            except ValueError:
+                raise ValueError("LLM_CONVERSATION_CONTEXT_CACHE_TTL deve essere un numero valido.")
+            _pool = ModelPool(
+                context_cache=os.getenv("LLM_CONVERSATION_CONTEXT_CACHE", "0").lower() in ("1", "true"),
+                ttl_seconds=ttl_seconds,
+            )
+        return _pool
@@ -0,0 +1,57 @@
+"""Prefissi di conversazione condivisi: le risposte iniziali identiche vengono generate una volta sola."""
+
+import concurrent.futures
+import json
+import threading
+from collections.abc import Callable
+
+from .config import AgentConfig
+from .conversation_manager import ConversationManager
+from .logging_config import get_logger
+from .response_cache import sha256_text
+
+logger = get_logger(__name__)
+
+
+def prefix_key(agent: AgentConfig, initial_message: str | None) -> str:
+    """Chiave del saluto iniziale: dipende solo dalla configurazione dell'Agente 1 e dall'istruzione iniziale."""
+    return sha256_text(json.dumps([agent.model_dump(), initial_message or ""], sort_keys=True, ensure_ascii=False))
+
+
+class PrefixTree:
+    """Registro dei dialoghi di apertura già eseguiti, da cui le singole combinazioni si diramano con `fork`.
+
+    Se più thread chiedono lo stesso prefisso nello stesso momento, solo il primo lo esegue e gli altri ne
+    attendono il risultato. Un prefisso fallito non resta nel registro: la richiesta successiva lo riesegue.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prefixes: dict[str, concurrent.futures.Future[ConversationManager]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_run(self, key: str, run: Callable[[], ConversationManager]) -> ConversationManager:
+        """Restituisce il dialogo di apertura per `key`, eseguendo `run` solo se non è già disponibile."""
+        with self._lock:
+            future = self._prefixes.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = concurrent.futures.Future()
+                self._prefixes[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not is_leader:
+            return future.result()
+        try:
+            opening = run()
+        except BaseException as e:
+            with self._lock:
+                self._prefixes.pop(key, None)
+            future.set_exception(e)
+            # Nessun altro thread potrebbe leggere l'errore.
+            future.exception()
+            raise
+        future.set_result(opening)
+        return opening
@@ -0,0 +1,122 @@
+"""Limitatore di richieste e token al minuto per modello, condiviso da tutti gli agenti del processo."""
+
+import asyncio
+import threading
+import time
+from collections.abc import Mapping
+
+from .config import RateLimit
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class TokenBucket:
+    """Secchio di gettoni che si ricarica a `per_minute` gettoni al minuto, fino a `per_minute`.
+
+    Le prenotazioni possono mandare il saldo in negativo: chi prenota riceve l'attesa necessaria a coprire il
+    debito, così le richieste vengono servite nell'ordine in cui hanno prenotato.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Preleva `amount` gettoni e restituisce i secondi da attendere prima di poterli usare."""
+        self._refill(now)
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def adjust(self, amount: float, now: float) -> None:
+        """Corregge una prenotazione già fatta (positivo = altri gettoni consumati, negativo = restituiti)."""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class ModelRateLimiter:
+    """Limiti di un singolo modello: richieste al minuto, token al minuto e pause imposte dal server."""
+
+    def __init__(self, limit: RateLimit):
+        self.requests = TokenBucket(limit.rpm) if limit.rpm else None
+        self.tokens = TokenBucket(limit.tpm) if limit.tpm else None
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """Prenota una richiesta da `tokens` token e restituisce l'attesa necessaria, in secondi."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.blocked_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            return wait
+
+    def adjust_tokens(self, tokens: int) -> None:
+        with self._lock:
+            if self.tokens is not None:
+                self.tokens.adjust(tokens, time.monotonic())
+
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Registro dei limitatori per modello. Senza limiti configurati si attendono solo le pause chieste dal server."""
+
+    def __init__(self):
+        self._models: dict[str, ModelRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limits: Mapping[str, RateLimit]) -> None:
+        """Imposta i limiti per modello (sostituisce quelli già presenti per gli stessi modelli)."""
+        with self._lock:
+            for model, limit in limits.items():
+                self._models[model] = ModelRateLimiter(limit)
+                logger.info(
+                    f"Limiti per il modello '{model}': {limit.rpm or '-'} richieste/min, {limit.tpm or '-'} token/min."
+                )
+
+    def _get(self, model: str) -> ModelRateLimiter | None:
+        with self._lock:
+            return self._models.get(model)
+
+    async def acquire(self, model: str, tokens: int) -> float:
+        """Attende che `model` abbia capacità per una richiesta da `tokens` token; restituisce i secondi attesi."""
+        limiter = self._get(model)
+        if limiter is None:
+            return 0.0
+        wait = limiter.reserve(tokens)
+        if wait > 0:
+            logger.debug(f"Limite di frequenza per il modello '{model}': attesa di {wait:.2f}s.")
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, model: str, reserved: int, used: int) -> None:
+        """Allinea il secchio dei token al consumo reale riportato dal servizio dopo la chiamata."""
+        limiter = self._get(model)
+        if limiter is not None and used != reserved:
+            limiter.adjust_tokens(used - reserved)
+
+    def honour_retry_after(self, model: str, seconds: float) -> None:
+        """Sospende tutte le richieste verso `model` per il tempo indicato dal server (retry-after)."""
+        with self._lock:
+            limiter = self._models.setdefault(model, ModelRateLimiter(RateLimit()))
+        limiter.block_for(seconds)
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Restituisce il limitatore del processo."""
+    return _rate_limiter
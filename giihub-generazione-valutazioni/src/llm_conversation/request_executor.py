@@ -0,0 +1,141 @@
+"""Executor condiviso dal processo per le chiamate bloccanti verso il modello, con scadenze reali."""
+
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_WORKERS = 32
+
+
+class RequestExecutor:
+    """Pool di thread persistente per le chiamate bloccanti, con rilascio del chiamante alla scadenza.
+
+    A differenza di un `ThreadPoolExecutor` creato e chiuso a ogni turno, il pool resta vivo per tutto il processo
+    e il chiamante non aspetta mai la fine del thread: alla scadenza riceve `TimeoutError` e la chiamata viene
+    contata come abbandonata. I thread sono daemon, così una chiamata appesa non blocca l'uscita dal programma.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        if max_workers < 1:
+            raise ValueError("max_workers deve essere almeno 1.")
+        self.max_workers = max_workers
+        self._queue: queue.SimpleQueue[tuple[concurrent.futures.Future[Any], Callable[..., Any], tuple, dict]] = (
+            queue.SimpleQueue()
+        )
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._idle = 0
+        self._pending = 0
+        self._in_flight = 0
+        self._abandoned = 0
+        self._abandoned_running = 0
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> concurrent.futures.Future[Any]:
+        """Accoda `fn` sul pool e ne restituisce il future."""
+        future: concurrent.futures.Future[Any] = concurrent.futures.Future()
+        with self._lock:
+            self._in_flight += 1
+            self._pending += 1
+            # Si crea un thread solo se quelli in attesa non bastano a coprire il lavoro accodato.
+            if self._pending > self._idle and len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._worker, name=f"llm-request-{len(self._threads)}", daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def call(self, fn: Callable[..., Any], /, *args: Any, timeout: float | None = None, **kwargs: Any) -> Any:
+        """Esegue `fn` sul pool e ne attende il risultato al massimo per `timeout` secondi."""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            self._abandon(future)
+            raise
+
+    async def acall(self, fn: Callable[..., Any], /, *args: Any, timeout: float | None = None, **kwargs: Any) -> Any:
+        """Variante asincrona di `call`: l'event loop resta libero mentre la chiamata è in corso."""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            # shield: alla scadenza non si vuole cancellare il future concorrente, se ne occupa _abandon.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=timeout)
+        except (TimeoutError, asyncio.CancelledError):
+            self._abandon(future)
+            raise
+
+    def stats(self) -> dict[str, int]:
+        """Restituisce i contatori correnti del pool."""
+        with self._lock:
+            return {
+                "threads": len(self._threads),
+                "in_flight": self._in_flight,
+                "abandoned": self._abandoned,
+                "abandoned_running": self._abandoned_running,
+            }
+
+    def _abandon(self, future: concurrent.futures.Future[Any]) -> None:
+        # Se la chiamata non è ancora partita basta cancellarla; altrimenti il thread la porta a termine
+        # e il risultato viene scartato.
+        if future.cancel():
+            return
+        with self._lock:
+            self._abandoned += 1
+            self._abandoned_running += 1
+        logger.warning("Chiamata al modello abbandonata alla scadenza; il thread la completerà in background.")
+        future.add_done_callback(self._on_abandoned_done)
+
+    def _on_abandoned_done(self, _future: concurrent.futures.Future[Any]) -> None:
+        with self._lock:
+            self._abandoned_running -= 1
+
+    def _worker(self) -> None:
+        while True:
+            with self._lock:
+                self._idle += 1
+            future, fn, args, kwargs = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+                self._pending -= 1
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+
+_executor: RequestExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_request_executor() -> RequestExecutor:
+    """Restituisce l'executor del processo, creandolo alla prima chiamata.
+
+    Env vars:
+        LLM_CONVERSATION_REQUEST_WORKERS: Numero massimo di thread del pool (default: 32)
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            try:
+                max_workers = int(os.getenv("LLM_CONVERSATION_REQUEST_WORKERS", str(DEFAULT_MAX_WORKERS)))
+            except ValueError:
+                raise ValueError("LLM_CONVERSATION_REQUEST_WORKERS deve essere un numero intero valido.")
+            _executor = RequestExecutor(max_workers=max_workers)
+        return _executor
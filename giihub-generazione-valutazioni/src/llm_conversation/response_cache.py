@@ -0,0 +1,207 @@
+"""Cache su disco (SQLite) delle risposte del modello, indirizzata per contenuto della richiesta."""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_MAX_MB = 256
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+def sha256_text(text: str) -> str:
+    """Restituisce l'hash SHA-256 esadecimale di un testo."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chain_hash(previous: str, role: str, content: str) -> str:
+    """Estende un hash di cronologia con un nuovo messaggio, senza dover ripassare i messaggi precedenti."""
+    return sha256_text(json.dumps([previous, role, content], ensure_ascii=False))
+
+
+class ResponseCache:
+    """Cache delle risposte con eviction per età e per dimensione, e deduplica delle richieste in volo.
+
+    La chiave comprende modello, temperatura, limite di token in uscita, hash del prompt di sistema e hash della
+    cronologia: due richieste con la stessa chiave sono la stessa richiesta e ricevono la stessa risposta.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+        max_age_seconds: float = DEFAULT_MAX_AGE_DAYS * 86400,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inflight: dict[str, concurrent.futures.Future[str]] = {}
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    @staticmethod
+    def make_key(
+        model: str, temperature: float, max_output_tokens: int, system_prompt_hash: str, history_hash: str
+    ) -> str:
+        """Costruisce la chiave di cache di una richiesta."""
+        return sha256_text(json.dumps([model, temperature, max_output_tokens, system_prompt_hash, history_hash]))
+
+    def get(self, key: str) -> str | None:
+        """Restituisce la risposta in cache per `key`, oppure None se assente o scaduta."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.max_age_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        """Salva una risposta e applica le regole di eviction."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        # Oltre i limiti si eliminano le voci usate meno di recente.
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM "
+            "(SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS running FROM responses) WHERE running > ?)",
+            (self.max_bytes,),
+        )
+
+    async def aget_or_compute(self, key: str, model: str, compute: Callable[[], Awaitable[str]]) -> tuple[str, bool]:
+        """Restituisce la risposta per `key` e un flag che indica se è stata servita senza chiamare il modello.
+
+        Se un'altra richiesta con la stessa chiave è già in volo (anche da un altro thread o event loop), si attende
+        il suo risultato invece di fare una seconda chiamata.
+        """
+
+        async def stream() -> AsyncIterator[str]:
+            yield await compute()
+
+        parts: list[str] = []
+        cached = False
+        async for chunk, cached in self.astream_or_compute(key, model, stream):
+            parts.append(chunk)
+        return "".join(parts), cached
+
+    async def astream_or_compute(
+        self, key: str, model: str, stream: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[tuple[str, bool]]:
+        """Variante in streaming di `aget_or_compute`: produce coppie (chunk, servito_dalla_cache).
+
+        La richiesta che chiama davvero il modello inoltra i chunk man mano che arrivano; le risposte in cache e
+        quelle condivise con una richiesta già in volo arrivano in un unico chunk.
+        """
+        # Le letture e le scritture su SQLite girano in un thread: l'event loop è condiviso da tutte le conversazioni.
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            self.hits += 1
+            yield cached, True
+            return
+
+        with self._lock:
+            leader_future = self._inflight.get(key)
+            is_leader = leader_future is None
+            if is_leader:
+                leader_future = concurrent.futures.Future()
+                self._inflight[key] = leader_future
+
+        if not is_leader:
+            self.hits += 1
+            yield await asyncio.wrap_future(leader_future), True
+            return
+
+        self.misses += 1
+        parts: list[str] = []
+        try:
+            async for chunk in stream():
+                parts.append(chunk)
+                yield chunk, False
+        except BaseException as e:
+            # Un annullamento del leader non deve propagarsi come annullamento dei follower.
+            error = e if isinstance(e, Exception) else RuntimeError("Richiesta condivisa annullata.")
+            leader_future.set_exception(error)
+            # Il risultato del leader potrebbe non essere mai letto da nessun follower.
+            leader_future.exception()
+            raise
+        else:
+            response = "".join(parts)
+            leader_future.set_result(response)
+            await asyncio.to_thread(self.put, key, model, response)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+_caches: dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Restituisce la cache configurata tramite variabili d'ambiente, oppure None se disattivata.
+
+    Env vars:
+        LLM_CONVERSATION_CACHE: Percorso del file SQLite della cache (default: cache disattivata)
+        LLM_CONVERSATION_CACHE_MAX_ENTRIES: Numero massimo di risposte conservate (default: 50000)
+        LLM_CONVERSATION_CACHE_MAX_MB: Dimensione massima delle risposte conservate, in MB (default: 256)
+        LLM_CONVERSATION_CACHE_MAX_AGE_DAYS: Età massima di una risposta, in giorni (default: 30)
+    """
+    path = os.getenv("LLM_CONVERSATION_CACHE")
+    if not path:
+        return None
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            try:
+                cache = ResponseCache(
+                    Path(path),
+                    max_entries=int(os.getenv("LLM_CONVERSATION_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+                    max_bytes=int(float(os.getenv("LLM_CONVERSATION_CACHE_MAX_MB", str(DEFAULT_MAX_MB))) * 1024 * 1024),
+                    max_age_seconds=float(os.getenv("LLM_CONVERSATION_CACHE_MAX_AGE_DAYS", str(DEFAULT_MAX_AGE_DAYS)))
+                    * 86400,
+                )
+            except ValueError:
+                raise ValueError("I limiti della cache (LLM_CONVERSATION_CACHE_*) devono essere numeri validi.")
+            _caches[path] = cache
+            logger.info(f"Cache delle risposte attiva su '{path}'.")
+        return cache
@@ -0,0 +1,50 @@
+"""Politica di ripetizione delle chiamate al modello: backoff esponenziale con jitter."""
+
+import os
+import random
+from dataclasses import dataclass
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Quante volte ripetere una chiamata fallita e quanto attendere tra un tentativo e l'altro.
+
+    L'attesa prima del tentativo `n` (contando da 0) è estratta uniformemente in
+    `[(1 - jitter) * d, d]` con `d = min(max_delay, base_delay * multiplier ** n)`: con `jitter=1` è il "full jitter",
+    che evita che molte conversazioni fallite insieme riprovino tutte nello stesso istante. Un'attesa suggerita dal
+    server (retry-after) viene sempre rispettata.
+    """
+
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    base_delay: float = DEFAULT_BASE_DELAY
+    max_delay: float = DEFAULT_MAX_DELAY
+    multiplier: float = 2.0
+    jitter: float = 1.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Secondi da attendere prima di ripetere il tentativo `attempt` (0 = primo tentativo fallito)."""
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        wait = random.uniform((1 - self.jitter) * ceiling, ceiling)
+        return max(wait, retry_after or 0.0)
+
+
+def get_retry_policy() -> RetryPolicy:
+    """Restituisce la politica di ripetizione configurata tramite variabili d'ambiente.
+
+    Env vars:
+        LLM_CONVERSATION_RETRY_ATTEMPTS: Numero massimo di tentativi per chiamata, compreso il primo (default: 4)
+        LLM_CONVERSATION_RETRY_BASE_DELAY: Attesa di base del backoff, in secondi (default: 1)
+        LLM_CONVERSATION_RETRY_MAX_DELAY: Attesa massima tra due tentativi, in secondi (default: 30)
+    """
+    try:
+        return RetryPolicy(
+            max_attempts=max(1, int(os.getenv("LLM_CONVERSATION_RETRY_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS)))),
+            base_delay=float(os.getenv("LLM_CONVERSATION_RETRY_BASE_DELAY", str(DEFAULT_BASE_DELAY))),
+            max_delay=float(os.getenv("LLM_CONVERSATION_RETRY_MAX_DELAY", str(DEFAULT_MAX_DELAY))),
+        )
+    except ValueError:
+        raise ValueError("I parametri di ripetizione (LLM_CONVERSATION_RETRY_*) devono essere numeri validi.")
@@ -0,0 +1,109 @@
+"""Manifest di un'esecuzione della matrice: stato e hash degli input di ogni combinazione, per riprendere le run."""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from .config import Config
+from .logging_config import get_logger
+from .response_cache import sha256_text
+
+logger = get_logger(__name__)
+
+RUNNING = "running"
+DONE = "done"
+ABORTED = "aborted"
+FAILED = "failed"
+
+
+def input_hash(config: Config) -> str:
+    """Hash di ciò che determina una conversazione: agenti (prompt, modello, temperatura, limiti) e impostazioni."""
+    payload = {
+        "agents": [agent.model_dump() for agent in config.agents],
+        "settings": config.settings.model_dump(),
+    }
+    return sha256_text(json.dumps(payload, sort_keys=True, ensure_ascii=False))
+
+
+class RunManifest:
+    """Registro delle combinazioni di una directory di output, in un file JSONL in sola aggiunta.
+
+    Ogni cambio di stato è una riga `{"key", "input_hash", "status", "output", "at"}`; lo stato corrente di una
+    combinazione è l'ultima riga con la sua chiave. Le righe brevi aggiunte in append non si mescolano, quindi più
+    processi (per esempio i worker di una coda condivisa) possono scrivere sullo stesso manifest.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, Any]] = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Riga troncata da un processo interrotto durante la scrittura.
+                        logger.warning(f"Riga {line_number} del manifest {path} illeggibile: ignorata.")
+                        continue
+                    self._entries[entry["key"]] = entry
+
+    def is_done(self, key: str, digest: str, output_path: Path) -> bool:
+        """Indica se la combinazione è già stata completata con gli stessi input e il suo file esiste ancora."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return (
+            entry is not None
+            and entry["status"] == DONE
+            and entry["input_hash"] == digest
+            and output_path.exists()
+        )
+
+    def mark(self, key: str, digest: str, status: str, output_path: Path | None = None) -> None:
+        """Registra il nuovo stato di una combinazione."""
+        entry = {
+            "key": key,
+            "input_hash": digest,
+            "status": status,
+            "output": str(output_path) if output_path is not None else None,
+            "at": time.time(),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._entries[key] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def counts(self) -> dict[str, int]:
+        """Numero di combinazioni per stato."""
+        counts: dict[str, int] = {}
+        with self._lock:
+            for entry in self._entries.values():
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+
+def checkpoint_path(output_path: Path) -> Path:
+    """File di checkpoint di una conversazione, accanto al suo output ma con un'estensione diversa da .json."""
+    return output_path.with_name(output_path.stem + ".checkpoint")
+
+
+def read_checkpoint(path: Path, digest: str) -> dict[str, Any] | None:
+    """Legge lo stato salvato in un checkpoint, se esiste ed è stato prodotto con gli stessi input."""
+    if not path.exists():
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Checkpoint {path} illeggibile, la conversazione riparte da capo: {e}")
+        return None
+    if data.get("input_hash") != digest:
+        logger.info(f"Checkpoint {path} prodotto con input diversi: la conversazione riparte da capo.")
+        return None
+    return data["state"]
@@ -0,0 +1,290 @@
+"""Ordine di esecuzione delle combinazioni della matrice e stima del suo effetto sulle cache di prefisso."""
+
+from __future__ import annotations
+
+import collections
+import hashlib
+import heapq
+import json
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .logging_config import get_logger
+
+if TYPE_CHECKING:
+    # matrix_runner importa questo modulo: MatrixJob serve solo nelle annotazioni.
+    from .matrix_runner import MatrixJob
+
+logger = get_logger(__name__)
+
+# Granularità e capacità della cache di prefisso simulata: blocchi di caratteri dei prompt di sistema, come le
+# cache dei provider che riusano il prompt a blocchi di token a partire dall'inizio.
+PREFIX_BLOCK_CHARS = 256
+PREFIX_CACHE_BLOCKS = 128
+# Turni (coppie di risposte) simulati per ogni combinazione in corso.
+SIMULATED_ROUNDS = 15
+
+
+def product_order(jobs: list[MatrixJob], workers: int = 1) -> list[MatrixJob]:
+    """Ordine di itertools.product(comportamenti, conoscenze): i ticket si alternano ogni poche combinazioni."""
+    return list(jobs)
+
+
+def prefix_order(jobs: list[MatrixJob], workers: int = 1) -> list[MatrixJob]:
+    """Ordina le combinazioni per riusare al massimo i prefissi dei prompt di sistema già in cache.
+
+    Il prompt dell'Agente 1 dipende solo dal ticket e quello dell'Agente 2 comincia con il testo della persona,
+    quindi le combinazioni vengono raggruppate per ticket e poi persona, oppure per persona e poi ticket. Per
+    ciascun raggruppamento si considera anche la variante in cui, ogni volta che uno dei `workers` posti si
+    libera, parte la combinazione con più blocchi di prompt già nella cache simulata. Vince l'ordine con l'hit
+    rate simulato più alto: con molti worker in parallelo la cache non contiene tutti i prompt in corso, e quale
+    raggruppamento conviene dipende dalle dimensioni dei prompt.
+    """
+
+    def first_seen(values: list[str]) -> dict[str, int]:
+        return {value: index for index, value in reversed(list(enumerate(values)))}
+
+    tickets = first_seen([job.context_key for job in jobs])
+    personas = first_seen([job.behavior_name for job in jobs])
+    scenarios = first_seen([job.knowledge_name for job in jobs])
+    def by_ticket(job: MatrixJob) -> tuple[int, int, int]:
+        return tickets[job.context_key], personas[job.behavior_name], scenarios[job.knowledge_name]
+
+    def by_persona(job: MatrixJob) -> tuple[int, int, int]:
+        return personas[job.behavior_name], tickets[job.context_key], scenarios[job.knowledge_name]
+
+    groupings = [sorted(jobs, key=by_ticket), sorted(jobs, key=by_persona)]
+    best: tuple[float, list[MatrixJob]] | None = None
+    for grouped in groupings:
+        for greedy in (False, True):
+            simulation = _PrefixCacheSimulation(grouped, workers)
+            rate = simulation.run(choose=simulation.most_cached if greedy else None)
+            if best is None or rate > best[0]:
+                best = (rate, [grouped[index] for index in simulation.dispatched])
+    return best[1] if best is not None else []
+
+
+_EMPTY_ENTRY = {"runs": 0, "messages": 0, "timed_runs": 0, "timed_messages": 0, "seconds": 0.0}
+
+
+class ConversationStats:
+    """Lunghezza (risposte) e durata delle conversazioni delle run precedenti, per (approccio, persona, scenario).
+
+    Il file JSON contiene i totali per chiave; al salvataggio vengono riletti e sommati ai nuovi campioni, così
+    più processi che condividono il file (per esempio i worker di una coda) non si sovrascrivono i dati.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._totals = self._read()
+        self._new: dict[str, dict[str, float]] = {}
+
+    def _read(self) -> dict[str, dict[str, float]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Statistiche {self.path} illeggibili, si riparte senza storico: {e}")
+            return {}
+
+    @staticmethod
+    def key(approach: str, persona: str, scenario: str) -> str:
+        return f"{approach}/{persona}/{scenario}"
+
+    def record(self, approach: str, persona: str, scenario: str, messages: int, seconds: float | None) -> None:
+        """Aggiunge una conversazione completata."""
+        key = self.key(approach, persona, scenario)
+        with self._lock:
+            for totals in (self._totals, self._new):
+                entry = totals.setdefault(key, dict(_EMPTY_ENTRY))
+                entry["runs"] += 1
+                entry["messages"] += messages
+                if seconds is not None:
+                    entry["timed_runs"] += 1
+                    entry["timed_messages"] += messages
+                    entry["seconds"] += seconds
+
+    def save(self) -> None:
+        """Somma i nuovi campioni ai totali su disco e riscrive il file in modo atomico."""
+        with self._lock:
+            if not self._new:
+                return
+            totals = self._read()
+            for key, new in self._new.items():
+                entry = totals.setdefault(key, dict(_EMPTY_ENTRY))
+                for field, value in new.items():
+                    entry[field] = entry.get(field, 0) + value
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(totals, f, indent=2, sort_keys=True)
+            tmp_path.replace(self.path)
+            self._totals = totals
+            self._new = {}
+
+    def has_history(self) -> bool:
+        with self._lock:
+            return bool(self._totals)
+
+    def _pooled(self, match: Callable[[str, str, str], bool]) -> dict[str, float] | None:
+        pooled = dict(_EMPTY_ENTRY)
+        for key, entry in self._totals.items():
+            if match(*key.split("/", 2)):
+                for field in pooled:
+                    pooled[field] += entry.get(field, 0)
+        return pooled if pooled["runs"] else None
+
+    def expected_seconds(self, approach: str, persona: str, scenario: str, default_messages: int) -> float:
+        """Durata attesa di una conversazione.
+
+        Senza storico per la combinazione esatta si usa, nell'ordine: la stessa persona e lo stesso approccio
+        (altri scenari), la stessa persona con qualsiasi approccio, lo stesso scenario, tutte le conversazioni.
+        Se lo storico ha solo il numero di risposte, la durata è stimata con i secondi per risposta medi di
+        tutte le conversazioni; alla prima run in assoluto vale `default_messages` secondi per tutte.
+        """
+        with self._lock:
+            fallbacks = (
+                lambda a, p, s: (a, p, s) == (approach, persona, scenario),
+                lambda a, p, s: (a, p) == (approach, persona),
+                lambda a, p, s: p == persona,
+                lambda a, p, s: s == scenario,
+                lambda a, p, s: True,
+            )
+            entry = next((pooled for match in fallbacks if (pooled := self._pooled(match)) is not None), None)
+            overall = self._pooled(lambda a, p, s: True)
+        if entry is None:
+            return float(default_messages)
+        if entry["timed_runs"]:
+            return entry["seconds"] / entry["timed_runs"]
+        messages = entry["messages"] / entry["runs"]
+        if overall is not None and overall["timed_messages"]:
+            return messages * overall["seconds"] / overall["timed_messages"]
+        return messages
+
+
+def lpt_order(jobs: list[MatrixJob], expected: Callable[[MatrixJob], float]) -> list[MatrixJob]:
+    """Longest processing time first: le combinazioni più lunghe partono per prime, a parità nell'ordine originale.
+
+    Con un pool che prende la prossima combinazione appena un worker si libera, le conversazioni brevi finali
+    riempiono i buchi invece di lasciare i worker fermi ad aspettare una conversazione lunga partita tardi.
+    """
+    return sorted(jobs, key=lambda job: -expected(job))
+
+
+def estimate_makespan(jobs: list[MatrixJob], workers: int, expected: Callable[[MatrixJob], float]) -> float:
+    """Durata stimata dell'esecuzione di `jobs` in ordine su `workers` worker, con le durate attese."""
+    finish_times = [0.0] * max(1, workers)
+    for job in jobs:
+        heapq.heapreplace(finish_times, finish_times[0] + expected(job))
+    return max(finish_times)
+
+
+ORDERS = ("product", "prefix", "lpt")
+
+
+def order_jobs(
+    jobs: list[MatrixJob],
+    order: str,
+    workers: int = 1,
+    expected: Callable[[MatrixJob], float] | None = None,
+) -> list[MatrixJob]:
+    """Restituisce le combinazioni nell'ordine indicato (uno di ORDERS) per `workers` esecuzioni parallele.
+
+    L'ordine "lpt" richiede `expected`, la durata attesa di ciascuna combinazione.
+    """
+    if order == "product":
+        return product_order(jobs, workers)
+    if order == "prefix":
+        return prefix_order(jobs, workers)
+    if order == "lpt":
+        if expected is None:
+            raise ValueError("L'ordine 'lpt' richiede le durate attese delle combinazioni.")
+        return lpt_order(jobs, expected)
+    raise ValueError(f"Ordine '{order}' non valido. Valori ammessi: {', '.join(ORDERS)}.")
+
+
+def _prefix_blocks(prompt: str) -> list[str]:
+    """Hash cumulativi dei blocchi del prompt: due prompt condividono un blocco solo se coincidono fino a lì."""
+    digest = hashlib.sha256()
+    blocks = []
+    for start in range(0, len(prompt), PREFIX_BLOCK_CHARS):
+        digest.update(prompt[start:start + PREFIX_BLOCK_CHARS].encode("utf-8"))
+        blocks.append(digest.copy().hexdigest())
+    return blocks
+
+
+class _PrefixCacheSimulation:
+    """Esecuzione simulata delle combinazioni contro una cache di prefisso LRU a blocchi.
+
+    Fino a `workers` combinazioni sono in corso insieme e a ogni giro ciascuna chiama entrambi gli agenti, così
+    le chiamate di combinazioni diverse si alternano nella cache come in una run parallela. La cronologia della
+    conversazione non è considerata: è diversa per ogni combinazione e non cambia con l'ordine.
+    """
+
+    def __init__(
+        self,
+        jobs: list[MatrixJob],
+        workers: int = 1,
+        capacity_blocks: int = PREFIX_CACHE_BLOCKS,
+        rounds: int = SIMULATED_ROUNDS,
+    ):
+        self.prompts = [[_prefix_blocks(agent.system_prompt) for agent in job.config.agents] for job in jobs]
+        self.workers = max(1, workers)
+        self.capacity_blocks = capacity_blocks
+        self.rounds = rounds
+        self.cache: collections.OrderedDict[str, None] = collections.OrderedDict()
+        self.hits = 0
+        self.lookups = 0
+        self.dispatched: list[int] = []
+
+    def most_cached(self, pending: list[int]) -> int:
+        """La combinazione in attesa con più blocchi di prompt già in cache (a parità, la prima)."""
+        return max(
+            pending,
+            key=lambda index: (sum(block in self.cache for blocks in self.prompts[index] for block in blocks), -index),
+        )
+
+    def _lookup(self, block: str) -> None:
+        self.lookups += 1
+        if block in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(block)
+        else:
+            self.cache[block] = None
+            if len(self.cache) > self.capacity_blocks:
+                self.cache.popitem(last=False)
+
+    def run(self, choose: Callable[[list[int]], int] | None = None) -> float:
+        """Simula l'esecuzione e restituisce la frazione di blocchi serviti dalla cache.
+
+        `choose` sceglie la prossima combinazione tra quelle in attesa; di default si segue l'ordine della lista.
+        """
+        pending = list(range(len(self.prompts)))
+        active: list[list[int]] = []  # [indice combinazione, giri rimanenti]
+        while pending or active:
+            while pending and len(active) < self.workers:
+                index = choose(pending) if choose is not None else pending[0]
+                pending.remove(index)
+                self.dispatched.append(index)
+                active.append([index, self.rounds])
+            for slot in active:
+                for blocks in self.prompts[slot[0]]:
+                    for block in blocks:
+                        self._lookup(block)
+                slot[1] -= 1
+            active = [slot for slot in active if slot[1] > 0]
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+def simulate_prefix_hit_rate(jobs: list[MatrixJob], workers: int = 1) -> float:
+    """Stima la frazione dei blocchi dei prompt di sistema serviti da una cache LRU, eseguendo `jobs` in ordine.
+
+    È una stima a priori, utile solo per confrontare gli ordini tra loro: la frazione misurata sui token in cache
+    riportati dal provider è `RunMetrics.prefix_cache_hit_rate()`.
+    """
+    return _PrefixCacheSimulation(jobs, workers).run()
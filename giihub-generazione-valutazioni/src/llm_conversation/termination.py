@@ -0,0 +1,158 @@
+"""Condizioni di chiusura di una conversazione: frasi di congedo, ripetizioni in loop e budget di turni e token."""
+
+import re
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from .config import Settings
+from .context_window import estimate_tokens
+
+# Comportamento storico del manager: l'Agente 1 chiude con una di queste frasi, al massimo dopo 31 risposte
+# (il saluto iniziale più 15 scambi).
+DEFAULT_CLOSING_PHRASES = ("goodbye", "concludes my report")
+DEFAULT_MAX_TURNS = 31
+
+SPEAKERS = ("agent1", "agent2")
+
+_WORD = re.compile(r"\w+")
+
+
+def compile_phrases(phrases: Iterable[str | re.Pattern]) -> tuple[re.Pattern, ...]:
+    """Compila frasi (confrontate senza distinzione di maiuscole) ed espressioni regolari già compilate."""
+    return tuple(p if isinstance(p, re.Pattern) else re.compile(re.escape(p), re.IGNORECASE) for p in phrases)
+
+
+def shingles(text: str, size: int = 3) -> frozenset[tuple[str, ...]]:
+    """Insieme delle sequenze di `size` parole consecutive del testo normalizzato (minuscolo, solo parole)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([tuple(words)])
+    return frozenset(tuple(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Indice di Jaccard tra due insiemi di shingle."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class LoopDetector:
+    """Riconosce una conversazione degenerata in cui i due agenti si ripetono.
+
+    C'è un loop quando ciascuna delle ultime `repeats` risposte è quasi identica alla risposta precedente dello
+    stesso agente (quella di due turni prima), con similarità di Jaccard sugli shingle di parole almeno pari a
+    `threshold`. Con `repeats=2` servono quindi due risposte consecutive, una per agente, che ripetono le proprie.
+
+    Args:
+        threshold: Similarità minima (0-1) perché due risposte siano considerate ripetute.
+        repeats: Numero di risposte consecutive ripetute che indica un loop.
+        shingle_size: Lunghezza in parole degli shingle.
+    """
+
+    def __init__(self, threshold: float = 0.9, repeats: int = 2, shingle_size: int = 3):
+        if not 0 < threshold <= 1:
+            raise ValueError("La soglia di similarità del rilevatore di loop deve essere in (0, 1].")
+        if repeats < 1:
+            raise ValueError("Il numero di ripetizioni del rilevatore di loop deve essere almeno 1.")
+        self.threshold = threshold
+        self.repeats = repeats
+        self.shingle_size = shingle_size
+
+    def is_looping(self, history: list[dict[str, Any]]) -> bool:
+        """Indica se le ultime risposte della cronologia formano un loop."""
+        if len(history) < self.repeats + 2:
+            return False
+        for i in range(1, self.repeats + 1):
+            current = shingles(history[-i]["message"], self.shingle_size)
+            previous = shingles(history[-i - 2]["message"], self.shingle_size)
+            if similarity(current, previous) < self.threshold:
+                return False
+        return True
+
+
+class TerminationEngine:
+    """Decide dopo ogni risposta se la conversazione è conclusa.
+
+    Un turno è una singola risposta di uno dei due agenti. Le condizioni vengono valutate in quest'ordine: frase di
+    chiusura di chi ha appena parlato, loop di risposte ripetute, numero massimo di turni, numero massimo di token
+    di output. Le frasi di chiusura non valgono per il saluto iniziale dell'Agente 1, salvo `close_on_opening`.
+
+    Args:
+        patterns: Frasi o regex di chiusura per interlocutore ("agent1", "agent2").
+        max_turns: Numero massimo di risposte complessive (None = nessun limite).
+        max_tokens: Numero massimo di token di output complessivi (None = nessun limite).
+        loop_detector: Rilevatore delle conversazioni che si ripetono (None = disattivato).
+        close_on_opening: Se anche il saluto iniziale può chiudere (e troncare) la conversazione.
+    """
+
+    def __init__(
+        self,
+        patterns: Mapping[str, Iterable[str | re.Pattern]] | None = None,
+        max_turns: int | None = DEFAULT_MAX_TURNS,
+        max_tokens: int | None = None,
+        loop_detector: LoopDetector | None = None,
+        close_on_opening: bool = False,
+    ):
+        patterns = patterns or {}
+        unknown = set(patterns) - set(SPEAKERS)
+        if unknown:
+            raise ValueError(f"Interlocutori sconosciuti nelle frasi di chiusura: {sorted(unknown)}")
+        self.patterns = tuple(compile_phrases(patterns.get(speaker, ())) for speaker in SPEAKERS)
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.loop_detector = loop_detector
+        self.close_on_opening = close_on_opening
+
+    @classmethod
+    def from_settings(
+        cls, settings: Settings, phrases: Mapping[str, Iterable[str | re.Pattern]]
+    ) -> "TerminationEngine":
+        """Costruisce il motore dalle impostazioni.
+
+        Le frasi valgono solo se `allow_termination` è attivo e solo per gli interlocutori di `closing_speakers`.
+        """
+        # Le chiavi sconosciute restano, perché il costruttore le segnali.
+        closing = {
+            speaker: patterns
+            for speaker, patterns in phrases.items()
+            if speaker not in SPEAKERS or speaker in settings.closing_speakers
+        }
+        return cls(
+            patterns=closing if settings.allow_termination else None,
+            max_turns=settings.max_turns,
+            max_tokens=settings.max_tokens,
+            loop_detector=(
+                LoopDetector(settings.loop_similarity, settings.loop_repeats)
+                if settings.loop_similarity is not None
+                else None
+            ),
+            close_on_opening=settings.close_on_opening,
+        )
+
+    def stop_patterns(self, speaker: int, turn: int) -> tuple[re.Pattern, ...]:
+        """Frasi di chiusura dell'interlocutore `speaker` (0 o 1) per la risposta in posizione `turn` (da 0).
+
+        Sono le stesse usate per troncare lo streaming della risposta.
+        """
+        if turn == 0 and not self.close_on_opening:
+            return ()
+        return self.patterns[speaker]
+
+    def check(self, history: list[dict[str, Any]], speaker: int) -> str | None:
+        """Restituisce il motivo della chiusura dopo l'ultima risposta di `history`, oppure None se si continua."""
+        message = history[-1]["message"]
+        if any(pattern.search(message) for pattern in self.stop_patterns(speaker, len(history) - 1)):
+            return "phrase"
+        if self.loop_detector is not None and self.loop_detector.is_looping(history):
+            return "loop"
+        if self.max_turns is not None and len(history) >= self.max_turns:
+            return "max_turns"
+        if self.max_tokens is not None:
+            used = 0
+            for turn in history:
+                tokens = turn.get("metrics", {}).get("output_tokens")
+                used += tokens if tokens is not None else estimate_tokens(turn["message"])
+            if used >= self.max_tokens:
+                return "max_tokens"
+        return None
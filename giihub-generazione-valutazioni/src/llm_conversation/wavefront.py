@@ -0,0 +1,194 @@
+"""Esecuzione "a ondate": i turni in attesa di tutti i dialoghi attivi partono insieme come un'unica richiesta."""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from .backends import get_backend_registry
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT = 0.1
+
+# Funzione del backend che invia un batch di (sessione, messaggio, generation_config) e restituisce, nello stesso
+# ordine, la risposta oppure l'eccezione di ciascuna richiesta.
+SendBatch = Callable[..., Awaitable[list[Any]]]
+# Restituisce la funzione di batch del backend di un modello (valore di `AgentConfig.model`), oppure None.
+BatchSender = Callable[[str], SendBatch | None]
+
+
+@dataclass(eq=False)
+class _Request:
+    model: str
+    chat: Any
+    content: str
+    generation_config: Any
+    future: concurrent.futures.Future = field(default_factory=concurrent.futures.Future)
+
+
+class WavefrontBatcher:
+    """Raccoglie le richieste dei dialoghi attivi e le invia al backend come un unico batch per modello.
+
+    Ogni ConversationManager in corso si registra come partecipante. Quando tutti i partecipanti hanno un turno in
+    attesa, oppure il batch raggiunge `max_batch` richieste, il batch parte subito; altrimenti parte dopo
+    `max_wait` secondi dalla prima richiesta, così un dialogo servito dalla cache o in pausa tra due tentativi non
+    ferma gli altri. I dialoghi possono girare su thread ed event loop diversi: il batch viene inviato dalla
+    richiesta che lo chiude e le risposte tornano a ciascun dialogo attraverso un future.
+
+    Args:
+        batch_sender: Restituisce la funzione che invia il batch al backend di un modello; None se il backend non
+            fa batching, e allora `supports` è falso e l'agente invia il messaggio da solo.
+        max_batch: Richieste massime per batch.
+        max_wait: Attesa massima, in secondi, di una richiesta prima che il batch parta incompleto.
+    """
+
+    def __init__(
+        self, batch_sender: BatchSender, max_batch: int = DEFAULT_MAX_BATCH, max_wait: float = DEFAULT_MAX_WAIT
+    ):
+        if max_batch < 1 or max_wait < 0:
+            raise ValueError("La dimensione massima del batch deve essere almeno 1 e l'attesa non negativa.")
+        self.batch_sender = batch_sender
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._pending: list[_Request] = []
+        self.participants = 0
+        self.batches = 0
+        self.requests = 0
+        self.largest_batch = 0
+
+    def supports(self, model: str) -> bool:
+        """Se il backend di `model` accetta i turni in batch."""
+        return self.batch_sender(model) is not None
+
+    def join(self) -> None:
+        """Registra un dialogo attivo."""
+        with self._lock:
+            self.participants += 1
+
+    def leave(self) -> None:
+        """Ritira un dialogo concluso: se gli altri stanno già aspettando, il loro batch non deve attenderlo."""
+        with self._lock:
+            self.participants -= 1
+
+    def _take_batch(self, force: bool = False) -> list[_Request]:
+        # Da chiamare con il lock: toglie dalla coda il batch pronto, se c'è.
+        if not self._pending:
+            return []
+        if not force and len(self._pending) < min(self.max_batch, max(1, self.participants)):
+            return []
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        return batch
+
+    async def submit(self, model: str, chat: Any, content: str, generation_config: Any) -> tuple[Any, int]:
+        """Accoda un messaggio per la sessione `chat` e restituisce la risposta e la dimensione del batch."""
+        request = _Request(model, chat, content, generation_config)
+        with self._lock:
+            self._pending.append(request)
+            batch = self._take_batch()
+        deadline = time.monotonic() + self.max_wait
+        answered = asyncio.wrap_future(request.future)
+        # L'esito viene letto da request.future: l'errore copiato su `answered` non va segnalato come ignorato.
+        answered.add_done_callback(lambda future: future.cancelled() or future.exception())
+        try:
+            while not batch and not request.future.done():
+                done, _ = await asyncio.wait({answered}, timeout=max(0.0, deadline - time.monotonic()))
+                if done:
+                    break
+                with self._lock:
+                    # Scaduta l'attesa parte ciò che è in coda, purché questa richiesta non sia già in volo.
+                    batch = self._take_batch(force=request in self._pending)
+                deadline = time.monotonic() + self.max_wait
+        except asyncio.CancelledError:
+            with self._lock:
+                if request in self._pending:
+                    self._pending.remove(request)
+            raise
+        if batch:
+            await self._send(batch)
+        return request.future.result()
+
+    async def _send(self, batch: list[_Request]) -> None:
+        by_model: dict[str, list[_Request]] = {}
+        for request in batch:
+            by_model.setdefault(request.model, []).append(request)
+        with self._lock:
+            self.batches += len(by_model)
+            self.requests += len(batch)
+            self.largest_batch = max(self.largest_batch, *(len(group) for group in by_model.values()))
+        try:
+            await asyncio.gather(*(self._send_group(group) for group in by_model.values()))
+        except BaseException as e:
+            # Chi ha inviato il batch è stato annullato (per esempio alla sua scadenza): gli altri dialoghi non
+            # devono restare in attesa di un batch che non arriverà, e lo trattano come una scadenza.
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(TimeoutError(f"Batch interrotto: {type(e).__name__}"))
+            raise
+
+    async def _send_group(self, group: list[_Request]) -> None:
+        try:
+            send_batch = self.batch_sender(group[0].model)
+            results = await send_batch(
+                [(request.chat, request.content, request.generation_config) for request in group], stream=True
+            )
+        except Exception as e:
+            results = [e] * len(group)
+        for request, result in zip(group, results):
+            if request.future.done():
+                continue
+            if isinstance(result, BaseException):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result((result, len(group)))
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+            }
+
+
+_batcher: WavefrontBatcher | None = None
+_batcher_lock = threading.Lock()
+
+
+def _backend_batch_sender(model: str) -> SendBatch | None:
+    backend, _ = get_backend_registry().resolve(model)
+    return backend.send_batch_async if backend.batching else None
+
+
+def get_wavefront_batcher() -> WavefrontBatcher | None:
+    """Restituisce il batcher a ondate del processo, oppure None se disattivato.
+
+    I modelli il cui backend non fa batching (vedi `WavefrontBatcher.supports`) inviano i turni da soli.
+
+    Env vars:
+        LLM_CONVERSATION_WAVEFRONT: "1" per inviare insieme i turni in attesa di tutti i dialoghi (default: "0")
+        LLM_CONVERSATION_WAVEFRONT_MAX_BATCH: Richieste massime per batch (default: 64)
+        LLM_CONVERSATION_WAVEFRONT_MAX_WAIT: Secondi di attesa massima prima di un batch incompleto (default: 0.1)
+    """
+    global _batcher
+    if os.getenv("LLM_CONVERSATION_WAVEFRONT", "0").lower() not in ("1", "true"):
+        return None
+    with _batcher_lock:
+        if _batcher is None:
+            try:
+                _batcher = WavefrontBatcher(
+                    _backend_batch_sender,
+                    max_batch=int(os.getenv("LLM_CONVERSATION_WAVEFRONT_MAX_BATCH", str(DEFAULT_MAX_BATCH))),
+                    max_wait=float(os.getenv("LLM_CONVERSATION_WAVEFRONT_MAX_WAIT", str(DEFAULT_MAX_WAIT))),
+                )
+            except ValueError as e:
+                raise ValueError(f"Configurazione della modalità a ondate non valida: {e}")
+        return _batcher
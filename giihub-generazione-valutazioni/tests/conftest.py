@@ -0,0 +1,41 @@
+"""Fixture comuni dei test: agenti sullo shim di google.generativeai, senza rete."""
+
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import pytest
+
+import google.generativeai as genai
+from llm_conversation.ai_agent import AIAgent
+from llm_conversation.config import AgentConfig
+
+
+@pytest.fixture
+def shim(monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+    """Shim con risposte immediate e deterministiche, riportato al profilo di default dopo il test."""
+    monkeypatch.delenv("LLM_CONVERSATION_DRY_RUN", raising=False)
+    monkeypatch.setenv("LLM_CONVERSATION_RETRY_BASE_DELAY", "0")
+    genai.configure_simulator(seed=0)
+    yield genai
+    genai.configure_simulator()
+
+
+@pytest.fixture
+def make_agent(shim: Any) -> Callable[..., AIAgent]:
+    """Crea un agente sullo shim con un primo messaggio dell'interlocutore già in cronologia."""
+
+    def make(model: str = "gemini-test", message: str = "Buongiorno, parliamo del ticket.", **config: Any) -> AIAgent:
+        agent = AIAgent(
+            AgentConfig(
+                name="Agent_1",
+                model=model,
+                temperature=0.0,
+                ctx_size=512,
+                system_prompt="Sei un assistente che raccoglie il resoconto di un intervento.",
+                **config,
+            )
+        )
+        agent.add_message("user", message)
+        return agent
+
+    return make
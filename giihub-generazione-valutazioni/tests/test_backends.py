@@ -0,0 +1,107 @@
+"""Test dei backend HTTP su un server locale: scadenza delle letture e chiusura durante una lettura."""
+
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_conversation.backends import ConnectionPool, HTTPChatSession, OpenAIBackend, StreamedResponse
+
+
+class StallingHandler(BaseHTTPRequestHandler):
+    """Risponde in streaming SSE con un primo chunk, poi si ferma finché il test non sblocca il secondo."""
+
+    release = threading.Event()
+
+    def do_POST(self) -> None:
+        """Invia i chunk della risposta di /chat/completions."""
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self.wfile.write(self.event("Buon"))
+        self.wfile.flush()
+        self.release.wait(5)
+        self.wfile.write(self.event("giorno") + b"data: [DONE]\n\n")
+
+    @staticmethod
+    def event(text: str) -> bytes:
+        """Riga SSE con un chunk di testo."""
+        return b"data: " + json.dumps({"choices": [{"delta": {"content": text}}]}).encode() + b"\n\n"
+
+    def log_message(self, *args: object) -> None:
+        """Niente log delle richieste nell'output dei test."""
+
+
+@pytest.fixture
+def session() -> Iterator[HTTPChatSession]:
+    """Sessione di chat verso un server locale che si blocca dopo il primo chunk."""
+    StallingHandler.release = threading.Event()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StallingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend = OpenAIBackend(f"http://127.0.0.1:{server.server_address[1]}", ConnectionPool(timeout=10))
+    yield backend.create_model("modello", "").start_chat(history=[])
+    StallingHandler.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def wait_released(response: StreamedResponse) -> bool:
+    """Attende che la connessione della risposta sia stata rilasciata dal thread che la leggeva."""
+    for _ in range(100):
+        if response._response._released:
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_each_read_stops_at_the_request_deadline(session: HTTPChatSession) -> None:
+    """Una lettura ferma oltre la scadenza della richiesta solleva TimeoutError invece di aspettare il socket."""
+
+    async def scenario() -> tuple[list[str], float]:
+        response = await session.send_message_async("Ciao", stream=True, request_options={"timeout": 0.3})
+        chunks: list[str] = []
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            async for chunk in response:
+                chunks.append(chunk.text)
+        elapsed = time.monotonic() - started
+        response.close()
+        StallingHandler.release.set()
+        assert wait_released(response)
+        return chunks, elapsed
+
+    chunks, elapsed = asyncio.run(scenario())
+    assert chunks == ["Buon"]
+    assert elapsed < 2
+    assert session.history == []
+
+
+def test_close_waits_for_the_pending_read(session: HTTPChatSession) -> None:
+    """`close()` durante una lettura non blocca il loop: la risposta viene chiusa appena la riga è letta."""
+
+    async def scenario() -> StreamedResponse:
+        response = await session.send_message_async("Ciao", stream=True)
+        stream = aiter(response)
+        assert (await anext(stream)).text == "Buon"
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        response.close()
+        assert time.monotonic() - started < 0.05
+        assert not response._response._released
+        StallingHandler.release.set()
+        assert (await pending).text == "giorno"
+        with pytest.raises(StopAsyncIteration):
+            await anext(stream)
+        return response
+
+    response = asyncio.run(scenario())
+    assert wait_released(response)
+    # La risposta chiusa prima della fine non viene registrata nella cronologia.
+    assert session.history == []
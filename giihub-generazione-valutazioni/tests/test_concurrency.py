@@ -0,0 +1,112 @@
+"""Test del controllo adattivo (AIMD) delle chiamate in volo."""
+
+import asyncio
+
+import pytest
+
+from llm_conversation import concurrency
+from llm_conversation.concurrency import LATENCY_SPIKE_FACTOR, LATENCY_WARMUP, AIMDController
+from llm_conversation.errors import RateLimitError
+
+
+def complete(controller: AIMDController, latency: float | None = 0.1, overloaded: bool = False) -> None:
+    """Esegue una chiamata completa: acquisisce un posto e lo rilascia con l'esito indicato."""
+    asyncio.run(controller.acquire())
+    controller.release(latency, overloaded)
+
+
+def test_successful_calls_raise_the_limit_by_about_one_per_round() -> None:
+    """Ogni risposta regolare aggiunge `1 / limite`: dopo un giro di chiamate il limite cresce di uno."""
+    controller = AIMDController(initial=4, maximum=8)
+    for _ in range(4):
+        complete(controller)
+    assert controller.limit == 4
+    complete(controller)
+    assert controller.limit == 5
+    assert controller.increases == 1
+
+
+def test_overload_halves_the_limit_once_per_burst() -> None:
+    """Un 429 dimezza il limite; gli altri errori della stessa raffica, entro il cooldown, non contano."""
+    controller = AIMDController(initial=16)
+    for _ in range(3):
+        complete(controller, latency=None, overloaded=True)
+    assert controller.limit == 8
+    assert controller.decreases == 1
+
+
+def test_limit_never_drops_below_the_minimum(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Le diminuzioni successive si fermano al minimo."""
+    controller = AIMDController(initial=4, minimum=2)
+    clock = iter(range(0, 1000, 10))
+    monkeypatch.setattr(concurrency.time, "monotonic", lambda: float(next(clock)))
+    for _ in range(5):
+        complete(controller, latency=None, overloaded=True)
+    assert controller.limit == 2
+    assert controller.decreases == 5
+
+
+def test_latency_spike_counts_as_overload_after_warmup() -> None:
+    """Una latenza molto sopra la media è un segnale di sovraccarico, ma solo dopo i campioni di riscaldamento."""
+    controller = AIMDController(initial=8, maximum=8)
+    complete(controller, latency=0.1)
+    complete(controller, latency=0.1 * LATENCY_SPIKE_FACTOR * 2)
+    assert controller.decreases == 0
+    for _ in range(LATENCY_WARMUP):
+        complete(controller, latency=0.1)
+    complete(controller, latency=10.0)
+    assert controller.decreases == 1
+    assert controller.limit == 4
+
+
+def test_acquire_waits_for_a_free_slot() -> None:
+    """Oltre il limite le chiamate attendono e ripartono, in ordine, man mano che i posti si liberano."""
+    controller = AIMDController(initial=1, maximum=1)
+    order: list[int] = []
+
+    async def call(index: int) -> None:
+        await controller.acquire()
+        order.append(index)
+        await asyncio.sleep(0.01)
+        controller.release(0.01)
+
+    async def main() -> None:
+        await asyncio.gather(*(call(i) for i in range(3)))
+
+    asyncio.run(main())
+    assert order == [0, 1, 2]
+    assert controller.stats()["peak_in_flight"] == 1
+
+
+def test_cancelled_waiter_does_not_leak_a_slot() -> None:
+    """Una chiamata annullata mentre attende il suo posto non lo trattiene."""
+    controller = AIMDController(initial=1, maximum=1)
+
+    async def main() -> None:
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        controller.release(0.01)
+        await asyncio.wait_for(controller.acquire(), 1)
+        controller.release(0.01)
+
+    asyncio.run(main())
+    assert controller.in_flight == 0
+
+
+def test_rate_limited_agent_on_the_shim_lowers_the_limit(make_agent, shim, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Un 429 dello shim, con il controllo adattivo attivo, riduce il limite del processo."""
+    monkeypatch.setenv("LLM_CONVERSATION_ADAPTIVE_CONCURRENCY", "1")
+    monkeypatch.setenv("LLM_CONVERSATION_CONCURRENCY_INITIAL", "8")
+    monkeypatch.setenv("LLM_CONVERSATION_RETRY_ATTEMPTS", "1")
+    monkeypatch.setattr(concurrency, "_controller", None)
+    model = "gemini-aimd-test"
+    shim.configure_simulator(models={model: {"error_rate_429": 1.0}}, seed=0)
+    with pytest.raises(RateLimitError):
+        "".join(make_agent(model=model).get_response())
+    controller = concurrency.get_concurrency_controller()
+    assert controller is not None
+    assert (controller.limit, controller.decreases, controller.in_flight) == (4, 1, 0)
@@ -0,0 +1,92 @@
+"""Test della compattazione della cronologia entro il budget di token."""
+
+from typing import Any
+
+from llm_conversation.context_window import (
+    LOW_WATERMARK,
+    MIN_RECENT_MESSAGES,
+    SUMMARY_HEADER,
+    compact_messages,
+    estimate_tokens,
+)
+
+
+def conversation(turns: int, words: int = 40) -> list[dict[str, Any]]:
+    """Costruisce una cronologia con prompt di sistema e `turns` messaggi alternati di `words` parole."""
+    messages: list[dict[str, Any]] = [{"role": "system", "content": "Prompt di sistema."}]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "model"
+        messages.append({"role": role, "content": f"Messaggio {i}. " + "parola " * words})
+    return messages
+
+
+def total_tokens(messages: list[dict[str, Any]]) -> int:
+    """Stima i token dell'intera cronologia."""
+    return sum(estimate_tokens(str(m["content"])) for m in messages)
+
+
+def test_history_within_budget_is_left_alone() -> None:
+    """Sotto il budget non c'è nulla da compattare."""
+    messages = conversation(4)
+    assert compact_messages(messages, total_tokens(messages)) is None
+
+
+def test_drop_keeps_system_prompt_and_recent_turns_under_the_low_watermark() -> None:
+    """`drop` scarta i turni più vecchi fino a scendere sotto la soglia bassa del budget."""
+    messages = conversation(20)
+    budget = total_tokens(messages) // 2
+    compacted = compact_messages(messages, budget, "drop")
+    assert compacted is not None
+    assert compacted[0] == messages[0]
+    assert compacted[1:] == messages[-(len(compacted) - 1) :]
+    assert total_tokens(compacted) <= budget * LOW_WATERMARK
+
+
+def test_summary_replaces_dropped_turns_with_one_line_each() -> None:
+    """`summary` condensa i turni scartati in un riepilogo subito dopo il prompt di sistema."""
+    messages = conversation(20)
+    budget = total_tokens(messages) // 2
+    compacted = compact_messages(messages, budget, "summary")
+    assert compacted is not None
+    summary = compacted[1]
+    assert summary["summary"] is True
+    assert summary["content"].startswith(SUMMARY_HEADER)
+    assert "- Other party: Messaggio 0." in summary["content"]
+    assert "- You: Messaggio 1." in summary["content"]
+    assert total_tokens(compacted) <= budget
+
+
+def test_summary_is_extended_by_later_compactions() -> None:
+    """Una nuova compattazione aggiunge le proprie righe al riepilogo precedente invece di sostituirlo."""
+    messages = conversation(20)
+    budget = total_tokens(messages) // 2
+    compacted = compact_messages(messages, budget, "summary")
+    assert compacted is not None
+    first_lines = compacted[1]["content"].splitlines()[1:]
+    grown = compacted + conversation(12)[1:]
+    recompacted = compact_messages(grown, budget, "summary")
+    assert recompacted is not None
+    assert sum(1 for m in recompacted if m.get("summary")) == 1
+    lines = recompacted[1]["content"].splitlines()[1:]
+    assert first_lines[-1] in lines
+    assert lines.index(first_lines[-1]) < len(lines) - 1
+
+
+def test_most_recent_turns_survive_a_tiny_budget() -> None:
+    """Anche con un budget minimo restano almeno gli ultimi scambi."""
+    messages = conversation(10, words=200)
+    compacted = compact_messages(messages, 10, "drop")
+    assert compacted is not None
+    assert compacted[1:] == messages[-MIN_RECENT_MESSAGES:]
+
+
+def test_agent_applies_its_budget_before_calling_the_shim(make_agent) -> None:
+    """L'agente compatta la cronologia prima dell'invio e registra i token stimati della chiamata."""
+    agent = make_agent(history_budget=300, history_policy="drop")
+    for message in conversation(20)[1:]:
+        agent.add_message(message["role"], message["content"])
+    agent.add_message("user", "Ultima domanda.")
+    response = "".join(agent.get_response())
+    assert response
+    assert agent.last_call["history_tokens"] <= 300
+    assert agent._messages[-1]["content"] == "Ultima domanda."
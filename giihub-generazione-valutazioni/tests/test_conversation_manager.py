@@ -0,0 +1,121 @@
+"""Test del ConversationManager sullo shim: rami, riepilogo e stato del dialogo."""
+
+from pathlib import Path
+from typing import Any
+
+from llm_conversation.ai_agent import AIAgent
+from llm_conversation.config import AgentConfig, Settings
+from llm_conversation.conversation_manager import ConversationManager
+from llm_conversation.run_manifest import read_checkpoint
+from llm_conversation.termination import TerminationEngine
+
+
+def make_manager(max_turns: int = 4, **kwargs: Any) -> ConversationManager:
+    """Dialogo tra due agenti sullo shim che si chiude dopo `max_turns` risposte."""
+    agents = [
+        AIAgent(
+            AgentConfig(
+                name=f"Agent_{i}", model="gemini-test", temperature=0.0, ctx_size=256, system_prompt=f"Agente {i}."
+            )
+        )
+        for i in (1, 2)
+    ]
+    return ConversationManager(
+        agents, "Inizia la chiamata.", termination=TerminationEngine(max_turns=max_turns), **kwargs
+    )
+
+
+def run_turns(manager: ConversationManager, turns: int | None = None) -> None:
+    """Esegue `turns` risposte del dialogo, oppure fino alla chiusura."""
+    for done, _ in enumerate(manager.run_conversation(), start=1):
+        if done == turns:
+            break
+
+
+def test_fork_summary_counts_only_the_branch_turns(shim) -> None:
+    """Le risposte condivise con `fork` restano nella trascrizione ma non nelle misure del ramo."""
+    opening = make_manager()
+    run_turns(opening, 1)
+    branches = [opening.fork(label="opening") for _ in range(2)]
+    for branch in branches:
+        run_turns(branch)
+
+    for branch in branches:
+        summary = branch.summary()
+        assert (summary["messages"], summary["shared_messages"]) == (4, 1)
+        assert branch.generated_history() == branch.history[1:]
+        generated = [turn["metrics"] for turn in branch.history[1:]]
+        assert summary["output_tokens"] == sum(metrics["output_tokens"] for metrics in generated)
+        assert sum(summary["sources"].values()) == 3
+    # Sommando il dialogo di partenza e i rami, ogni risposta generata è contata una volta sola.
+    unique = opening.history + [turn for branch in branches for turn in branch.history[1:]]
+    summaries = [opening.summary()] + [branch.summary() for branch in branches]
+    assert sum(s["output_tokens"] for s in summaries) == sum(turn["metrics"]["output_tokens"] for turn in unique)
+
+
+def test_closing_phrases_apply_to_agent1_after_the_opening(shim) -> None:
+    """Di default chiude solo l'Agente 1 dopo il saluto; saluto e Agente 2 restano interi e non chiudono."""
+    phrases = {"agent1": ["generativeai"], "agent2": ["generativeai"]}
+    manager = make_manager(max_turns=10)
+    manager.termination = TerminationEngine.from_settings(Settings(max_turns=10), phrases)
+    run_turns(manager)
+    assert (manager.terminated_by, len(manager.history)) == ("phrase", 3)
+    assert manager.history[0]["message"] == manager.history[1]["message"]
+    assert manager.history[0]["message"].endswith("'gemini-test']")
+    assert manager.history[2]["message"].endswith("generativeai.")
+
+
+def test_closing_on_other_speakers_is_opt_in(shim) -> None:
+    """Con `closing_speakers` e `close_on_opening` anche il saluto iniziale può chiudere la conversazione."""
+    phrases = {"agent1": ["generativeai"], "agent2": ["generativeai"]}
+    settings = Settings(max_turns=10, closing_speakers=["agent1", "agent2"], close_on_opening=True)
+    engine = TerminationEngine.from_settings(settings, phrases)
+    assert engine.check([{"message": "Goodbye generativeai"}] * 2, 1) == "phrase"
+    manager = make_manager(max_turns=10)
+    manager.termination = engine
+    run_turns(manager)
+    assert (manager.terminated_by, len(manager.history)) == ("phrase", 1)
+    assert manager.history[0]["message"].endswith("generativeai.")
+
+
+def test_checkpoint_round_trip_resumes_from_the_next_turn(tmp_path: Path, shim) -> None:
+    """Lo stato salvato con `save_checkpoint` e ricaricato con `load_state` riprende dalla risposta successiva."""
+    path = tmp_path / "dialogo.checkpoint"
+    interrupted = make_manager()
+    run_turns(interrupted, 2)
+    interrupted.save_checkpoint(path, input_hash="abc")
+    assert read_checkpoint(path, "altri-input") is None
+
+    state = read_checkpoint(path, "abc")
+    resumed = make_manager()
+    resumed.load_state(state)
+    assert resumed.get_state() == state
+    run_turns(resumed)
+    assert resumed.history[:2] == interrupted.history
+    assert (len(resumed.history), resumed.terminated_by) == (4, "max_turns")
+    # L'Agente 1 ha nella sua cronologia l'istruzione iniziale, le due risposte ripristinate e le due nuove.
+    assert [message["role"] for message in resumed.agents[0].get_state()["messages"][-5:]] == [
+        "user",
+        "model",
+        "user",
+        "model",
+        "user",
+    ]
+
+
+def test_resumed_duration_excludes_the_interruption(tmp_path: Path, shim) -> None:
+    """La durata di un dialogo ripreso somma solo i tempi di esecuzione, non l'attesa prima della ripresa."""
+    path = tmp_path / "dialogo.checkpoint"
+    interrupted = make_manager()
+    run_turns(interrupted, 2)
+    interrupted.save_checkpoint(path, input_hash="abc")
+    state = read_checkpoint(path, "abc")
+    # Ripresa un'ora dopo la partenza.
+    state["started_at"] -= 3600
+
+    resumed = make_manager()
+    resumed.load_state(state)
+    run_turns(resumed)
+    summary = resumed.summary()
+    assert summary["started_at"] == state["started_at"]
+    assert state["active_seconds"] <= summary["duration_seconds"] < 60
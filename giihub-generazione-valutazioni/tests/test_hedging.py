@@ -0,0 +1,66 @@
+"""Test delle richieste hedged: chiusura della risposta perdente e posto della copia nel controllore adattivo."""
+
+import asyncio
+
+import pytest
+
+from llm_conversation import ai_agent
+from llm_conversation.concurrency import AIMDController
+from llm_conversation.hedging import MIN_SAMPLES, Hedger
+
+PRIMARY_LATENCY = 0.3
+
+
+class FakeResponse:
+    """Risposta in streaming di prova che ricorda se è stata chiusa."""
+
+    def __init__(self, name: str) -> None:
+        """Crea una risposta aperta."""
+        self.name = name
+        self.closed = False
+
+    def close(self) -> None:
+        """Chiude la connessione della risposta."""
+        self.closed = True
+
+
+def warmed_hedger(latency: float = 0.05) -> Hedger:
+    """Hedger con abbastanza campioni da duplicare le chiamate più lente di `latency` e budget illimitato."""
+    hedger = Hedger(percentile=50, budget=1.0)
+    for _ in range(MIN_SAMPLES):
+        hedger.observe("gemini-test", latency)
+    return hedger
+
+
+def test_loser_finished_in_the_same_round_is_closed() -> None:
+    """Se originale e copia rispondono insieme vince l'originale e la risposta della copia viene chiusa."""
+    responses = {"primary": FakeResponse("primary"), "backup": FakeResponse("backup")}
+
+    async def scenario() -> tuple[FakeResponse, bool]:
+        ready = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.2, ready.set)
+
+        async def reply(name: str) -> FakeResponse:
+            await ready.wait()
+            return responses[name]
+
+        return await warmed_hedger().race("gemini-test", lambda: reply("primary"), lambda: reply("backup"))
+
+    response, hedge_won = asyncio.run(scenario())
+    assert (response.name, hedge_won) == ("primary", False)
+    assert not responses["primary"].closed
+    assert responses["backup"].closed
+
+
+@pytest.mark.parametrize("limit", [1, 2])
+def test_hedge_takes_a_slot_of_the_adaptive_controller(limit: int, shim, make_agent, monkeypatch) -> None:
+    """La copia passa dal controllore adattivo: con un solo posto aspetta l'originale, con due vanno in parallelo."""
+    shim.configure_simulator(default={"latency_median": PRIMARY_LATENCY}, seed=0)
+    controller = AIMDController(initial=limit, minimum=limit, maximum=limit)
+    hedger = warmed_hedger()
+    monkeypatch.setattr(ai_agent, "get_concurrency_controller", lambda: controller)
+    monkeypatch.setattr(ai_agent, "get_hedger", lambda: hedger)
+    assert "".join(make_agent().get_response())
+    assert hedger.stats()["hedges"] == 1
+    assert controller.stats()["peak_in_flight"] == limit
+    assert controller.in_flight == 0
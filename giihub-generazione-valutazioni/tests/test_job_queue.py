@@ -0,0 +1,147 @@
+"""Test della coda persistente delle combinazioni: lease, heartbeat, tentativi e worker concorrenti."""
+
+import threading
+import time
+from pathlib import Path
+
+from llm_conversation.ai_agent import AIAgent
+from llm_conversation.config import AgentConfig, Config, Settings
+from llm_conversation.conversation_manager import ConversationManager
+from llm_conversation.job_queue import DONE, FAILED, LEASED, PENDING, JobQueue
+from llm_conversation.matrix_runner import MatrixJob, run_queue
+from llm_conversation.termination import TerminationEngine
+
+
+def crashed_worker(path: Path, worker: str, lease_seconds: float, max_attempts: int = 3) -> str | None:
+    """Prende un lease e si ferma senza completarlo, come un processo terminato a metà conversazione."""
+    queue = JobQueue(path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    key = queue.lease(worker)
+    queue.close()
+    return key
+
+
+def test_expired_lease_is_taken_over_by_another_worker(tmp_path: Path) -> None:
+    """Senza heartbeat il lease scade e la combinazione passa a un altro worker; il vecchio esito è ignorato."""
+    path = tmp_path / "queue.sqlite"
+    queue = JobQueue(path, lease_seconds=0.2)
+    queue.enqueue(["a"])
+    assert crashed_worker(path, "w1", lease_seconds=0.2) == "a"
+    assert queue.lease("w2") is None
+    time.sleep(0.3)
+    assert queue.lease("w2") == "a"
+    assert not queue.complete("a", "w1")
+    assert queue.complete("a", "w2")
+    assert queue.counts()[DONE] == 1
+    queue.close()
+
+
+def test_lease_expired_on_the_last_attempt_fails_the_job(tmp_path: Path) -> None:
+    """Un lease scaduto consuma un tentativo: all'ultimo la combinazione è segnata come fallita."""
+    path = tmp_path / "queue.sqlite"
+    queue = JobQueue(path, lease_seconds=0.1, max_attempts=1)
+    queue.enqueue(["a"])
+    assert crashed_worker(path, "w1", lease_seconds=0.1, max_attempts=1) == "a"
+    time.sleep(0.2)
+    assert queue.lease("w2") is None
+    assert queue.counts()[FAILED] == 1
+    queue.close()
+
+
+def test_heartbeat_keeps_a_running_job_leased(tmp_path: Path) -> None:
+    """Finché il worker è vivo l'heartbeat rinnova il lease, anche oltre la sua durata."""
+    path = tmp_path / "queue.sqlite"
+    owner = JobQueue(path, lease_seconds=0.15)
+    owner.enqueue(["a"])
+    assert owner.lease("w1") == "a"
+    time.sleep(0.5)
+    other = JobQueue(path, lease_seconds=0.15)
+    assert other.lease("w2") is None
+    assert other.counts()[LEASED] == 1
+    assert owner.complete("a", "w1")
+    owner.close()
+    other.close()
+
+
+def test_failed_job_is_retried_until_attempts_run_out(tmp_path: Path) -> None:
+    """Un fallimento ripetibile rimette la combinazione in coda fino ai tentativi massimi."""
+    queue = JobQueue(tmp_path / "queue.sqlite", max_attempts=2)
+    assert queue.enqueue(["a", "b"]) == 2
+    assert queue.enqueue(["a"]) == 0
+    assert queue.lease("w1") == "a"
+    assert queue.fail("a", "w1", "conversazione interrotta")
+    assert queue.counts()[PENDING] == 2
+    assert queue.lease("w1") == "a"
+    assert queue.fail("a", "w1", "conversazione interrotta")
+    assert queue.counts() == {PENDING: 1, LEASED: 0, DONE: 0, FAILED: 1}
+    queue.close()
+
+
+def test_two_workers_share_the_queue_and_run_each_job_once(tmp_path: Path, shim) -> None:
+    """Due worker sulla stessa coda eseguono, sullo shim, ciascuna combinazione una sola volta."""
+    path = tmp_path / "queue.sqlite"
+    agent = AgentConfig(name="Agent_1", model="gemini-test", temperature=0.0, ctx_size=256, system_prompt="Ciao.")
+    config = Config(agents=[agent, agent.model_copy(update={"name": "Agent_2"})], settings=Settings(max_turns=4))
+    jobs = [
+        MatrixJob(f"persona{p}", f"scenario{s}", "A", config, tmp_path / f"persona{p}" / f"scenario{s}.json")
+        for p in range(3)
+        for s in range(2)
+    ]
+    executed: list[str] = []
+    lock = threading.Lock()
+
+    def run(job: MatrixJob) -> None:
+        manager = ConversationManager(
+            agents=[AIAgent(agent_config) for agent_config in job.config.agents],
+            initial_message="Buongiorno.",
+            termination=TerminationEngine(max_turns=job.config.settings.max_turns),
+        )
+        for _ in manager.run_conversation():
+            pass
+        assert len(manager.history) == 4
+        with lock:
+            executed.append(job.key)
+
+    def worker(worker_id: str) -> None:
+        queue = JobQueue(path, lease_seconds=3)
+        run_queue(queue, jobs, run, worker_id=worker_id, workers=2)
+        queue.close()
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert sorted(executed) == sorted(job.key for job in jobs)
+    queue = JobQueue(path)
+    assert queue.counts()[DONE] == len(jobs)
+    queue.close()
+
+
+def test_worker_leases_only_the_jobs_it_knows(tmp_path: Path) -> None:
+    """Le combinazioni accodate da altri worker (o escluse da --limit) restano in coda, non vengono fallite."""
+    queue = JobQueue(tmp_path / "queue.sqlite")
+    queue.enqueue(["a", "b", "c"])
+    assert queue.lease("w1", keys={"c"}) == "c"
+    assert queue.lease("w1", keys={"c"}) is None
+    assert queue.counts() == {PENDING: 2, LEASED: 1, DONE: 0, FAILED: 0}
+    assert queue.lease("w2") == "a"
+    queue.close()
+
+
+def test_failed_conversation_is_not_completed(tmp_path: Path) -> None:
+    """Un errore irreversibile della conversazione segna la combinazione come fallita, senza nuovi tentativi."""
+    config = Config(agents=[], settings=Settings())
+    jobs = [MatrixJob("persona", f"scenario{s}", "A", config, tmp_path / f"scenario{s}.json") for s in range(2)]
+    queue = JobQueue(tmp_path / "queue.sqlite")
+    queue.enqueue(["altra/matrice"])
+    attempts: list[str] = []
+
+    def run(job: MatrixJob) -> None:
+        attempts.append(job.key)
+        if job.knowledge_name == "scenario0":
+            raise ValueError("risposta non valida")
+
+    run_queue(queue, jobs, run, worker_id="w1")
+    assert sorted(attempts) == ["persona/scenario0", "persona/scenario1"]
+    assert queue.counts() == {PENDING: 1, LEASED: 0, DONE: 1, FAILED: 1}
+    queue.close()
@@ -0,0 +1,81 @@
+"""Test del rilevamento delle conversazioni che si ripetono."""
+
+import pytest
+
+from llm_conversation.config import Settings
+from llm_conversation.conversation_manager import ConversationManager
+from llm_conversation.termination import LoopDetector, TerminationEngine, shingles, similarity
+
+REPORT = "The turnstile was blocked by the photocell timeout and I raised it from three to six seconds."
+
+
+def turns(*messages: str) -> list[dict[str, str]]:
+    """Costruisce una cronologia in cui i due agenti si alternano, a partire da Agent_1."""
+    return [{"speaker": f"Agent_{i % 2 + 1}", "message": message} for i, message in enumerate(messages)]
+
+
+def test_similarity_is_jaccard_on_word_shingles() -> None:
+    """Maiuscole e punteggiatura non contano; una parola diversa cambia solo gli shingle che la contengono."""
+    assert similarity(shingles("Thank you, the TICKET is closed."), shingles("thank you the ticket is closed")) == 1.0
+    changed = similarity(shingles("a b c d e"), shingles("a b c d f"))
+    assert changed == pytest.approx(2 / 4)
+    assert similarity(shingles(""), shingles("")) == 1.0
+    assert similarity(shingles("one two"), shingles("three four")) == 0.0
+
+
+def test_loop_needs_each_agent_to_repeat_its_own_reply() -> None:
+    """Con `repeats=2` entrambi gli agenti devono ripetere la propria risposta precedente."""
+    detector = LoopDetector(threshold=0.9, repeats=2)
+    assert detector.is_looping(turns("Hello.", REPORT, "Hello.", REPORT))
+    assert not detector.is_looping(turns("Hello.", REPORT, "Something new entirely.", REPORT))
+    assert not detector.is_looping(turns(REPORT, REPORT, REPORT))
+
+
+def test_near_duplicates_count_above_the_threshold_only() -> None:
+    """Una risposta quasi uguale è un loop con una soglia bassa, non con una soglia alta."""
+    reworded = REPORT.replace("six", "seven")
+    history = turns("Hello.", REPORT, "Hello.", reworded)
+    assert LoopDetector(threshold=0.6, repeats=1).is_looping(history)
+    assert not LoopDetector(threshold=0.95, repeats=1).is_looping(history)
+
+
+def test_invalid_settings_are_rejected() -> None:
+    """Soglia fuori da (0, 1] e ripetizioni nulle sono errori di configurazione."""
+    with pytest.raises(ValueError):
+        LoopDetector(threshold=0)
+    with pytest.raises(ValueError):
+        LoopDetector(repeats=0)
+
+
+def test_conversation_on_the_shim_ends_on_a_loop(make_agent) -> None:
+    """Con lo shim a testo fisso gli agenti si ripetono e il dialogo si chiude per loop, prima di `max_turns`."""
+    manager = ConversationManager(
+        agents=[make_agent(), make_agent()],
+        initial_message="Buongiorno.",
+        termination=TerminationEngine(max_turns=31, loop_detector=LoopDetector()),
+    )
+    for _ in manager.run_conversation():
+        pass
+    assert manager.terminated_by == "loop"
+    assert len(manager.history) < 31
+
+
+def test_loop_detection_is_enabled_only_from_the_settings() -> None:
+    """Il motore di default e le impostazioni di default non rilevano i loop; `loop_similarity` li attiva."""
+    assert ConversationManager(agents=[], initial_message=None).termination.loop_detector is None
+    assert TerminationEngine.from_settings(Settings(), {}).loop_detector is None
+    detector = TerminationEngine.from_settings(Settings(loop_similarity=0.8, loop_repeats=3), {}).loop_detector
+    assert (detector.threshold, detector.repeats) == (0.8, 3)
+
+
+def test_dry_run_reaches_max_turns_with_the_default_settings(make_agent, monkeypatch: pytest.MonkeyPatch) -> None:
+    """In dry-run ogni risposta è uguale: senza rilevamento dei loop il dialogo arriva comunque a `max_turns`."""
+    monkeypatch.setenv("LLM_CONVERSATION_DRY_RUN", "1")
+    manager = ConversationManager(
+        agents=[make_agent(), make_agent()],
+        initial_message="Buongiorno.",
+        termination=TerminationEngine.from_settings(Settings(max_turns=8), {"agent1": ["goodbye"]}),
+    )
+    for _ in manager.run_conversation():
+        pass
+    assert (manager.terminated_by, len(manager.history)) == ("max_turns", 8)
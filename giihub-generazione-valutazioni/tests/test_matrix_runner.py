@@ -0,0 +1,125 @@
+"""Test dell'esecuzione della matrice condivisa dagli script run_*."""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from llm_conversation.config import Config, Settings
+from llm_conversation.errors import ConversationAborted
+from llm_conversation.matrix_runner import MatrixJob, MatrixSpec, RunOptions, add_run_arguments, run_jobs, run_matrix
+from llm_conversation.run_manifest import DONE, RunManifest
+
+SPEC = MatrixSpec(
+    approach="T",
+    agent1_prompt="Chiama il tecnico per il ticket {ticket_id}: {customer_problem}.",
+    ticket_metadata={"A": {"ticket_id": "ST-A", "customer_problem": "tornello bloccato"}},
+    termination_phrases={"agent1": ["goodbye"]},
+)
+BEHAVIORS = [
+    {"name": "Conciso", "prompt": "Rispondi in breve. {knowledge}"},
+    {"name": "Loquace", "prompt": "{knowledge}"},
+]
+KNOWLEDGE = [{"name": "Scenario_A1", "context_key": "A", "prompt": "Fotocellula sporca."}]
+
+
+class RecordingConsole:
+    """Console che conserva le righe stampate, al posto di quella di rich."""
+
+    def __init__(self) -> None:
+        """Parte senza righe stampate."""
+        self.lines: list[str] = []
+
+    def print(self, *args: Any, **kwargs: Any) -> None:
+        """Registra la riga stampata."""
+        self.lines.append(" ".join(str(arg) for arg in args))
+
+
+class SilentProgress:
+    """Barra di avanzamento che non stampa nulla, come il sostituto usato dagli script senza rich."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Accetta e ignora le colonne di rich."""
+
+    def __enter__(self) -> "SilentProgress":
+        """Apre la barra."""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Chiude la barra."""
+
+    def add_task(self, *args: Any, **kwargs: Any) -> int:
+        """Crea il task di avanzamento."""
+        return 0
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        """Aggiorna il task di avanzamento."""
+
+
+def write_config(path: Path, max_turns: int = 4) -> Path:
+    """Scrive una configurazione con due agenti sullo shim e conversazioni di `max_turns` risposte."""
+    agent = {"model": "gemini-test", "temperature": 0.0, "ctx_size": 256, "system_prompt": "Segnaposto."}
+    config = {
+        "agents": [{"name": "Agent_1", **agent}, {"name": "Agent_2", **agent}],
+        "settings": {"initial_message": "Inizia la chiamata.", "max_turns": max_turns},
+    }
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return path
+
+
+def run(tmp_path: Path, options: RunOptions) -> RecordingConsole:
+    """Esegue la matrice di prova e restituisce la console con le righe stampate."""
+    console = RecordingConsole()
+    combinations = [(behavior, knowledge) for behavior in BEHAVIORS for knowledge in KNOWLEDGE]
+    config_path = write_config(tmp_path / "config.json")
+    run_matrix(SPEC, combinations, config_path, tmp_path / "out", options, console, SilentProgress)
+    return console
+
+
+def test_options_come_from_the_shared_arguments() -> None:
+    """Le opzioni comuni si leggono dagli argomenti aggiunti da `add_run_arguments`."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true")
+    add_run_arguments(parser)
+    options = RunOptions.from_args(parser.parse_args(["--workers", "3", "--no-resume", "--order", "lpt"]))
+    assert options == RunOptions(workers=3, resume=False, order="lpt")
+
+
+def test_every_combination_is_saved_and_recorded_in_the_manifest(tmp_path: Path, shim) -> None:
+    """Ogni combinazione produce la sua trascrizione e una voce completata nel manifest."""
+    console = run(tmp_path, RunOptions(workers=2))
+    assert console.lines[-1].endswith("Operazione completata![/bold green]")
+    for behavior in BEHAVIORS:
+        path = tmp_path / "out" / behavior["name"] / "Scenario_A1.json"
+        assert len(json.loads(path.read_text(encoding="utf-8"))["conversation"]) == 4
+    assert RunManifest(tmp_path / "out" / "run_manifest.jsonl").counts() == {DONE: 2}
+
+
+def test_completed_combinations_are_skipped_on_the_next_run(tmp_path: Path, shim) -> None:
+    """Una seconda esecuzione con gli stessi input salta le combinazioni già completate."""
+    run(tmp_path, RunOptions())
+    console = run(tmp_path, RunOptions())
+    assert any("2 combinazioni già completate" in line for line in console.lines)
+    assert any("Trovate 2 combinazioni" in line for line in console.lines)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_aborted_conversation_is_requeued_until_the_limit(tmp_path: Path, workers: int) -> None:
+    """Una ConversationAborted rimette la combinazione in coda fino a `max_requeues` volte, poi la abbandona."""
+    config = Config(agents=[], settings=Settings())
+    jobs = [MatrixJob("persona", scenario, "A", config, tmp_path / f"{scenario}.json") for scenario in ("s1", "s2")]
+    attempts: dict[str, int] = {"persona/s1": 0, "persona/s2": 0}
+    finished: list[str] = []
+
+    def run(job: MatrixJob) -> None:
+        attempts[job.key] += 1
+        # s1 si interrompe al primo tentativo, s2 a tutti.
+        if job.knowledge_name == "s2" or attempts[job.key] == 1:
+            raise ConversationAborted("risposta vuota", 3)
+
+    run_jobs(jobs, run, workers=workers, on_done=lambda job: finished.append(job.key), max_requeues=2)
+    assert attempts == {"persona/s1": 2, "persona/s2": 3}
+    assert sorted(finished) == ["persona/s1", "persona/s2"]
+    assert [job.requeues for job in jobs] == [1, 2]
@@ -0,0 +1,83 @@
+"""Test del limitatore di richieste e token al minuto."""
+
+import asyncio
+import time
+
+import pytest
+
+from llm_conversation.config import RateLimit
+from llm_conversation.errors import RateLimitError
+from llm_conversation.rate_limiter import ModelRateLimiter, RateLimiter, TokenBucket, get_rate_limiter
+
+
+def test_bucket_starts_full_and_refills_at_its_rate() -> None:
+    """Il secchio parte pieno, si ricarica di `per_minute / 60` gettoni al secondo e non supera la capacità."""
+    bucket = TokenBucket(60)
+    start = bucket.updated
+    assert bucket.reserve(60, start) == 0.0
+    assert bucket.reserve(1, start) == pytest.approx(1.0)
+    # Dopo tre secondi il debito di un gettone è coperto e ne restano due.
+    assert bucket.reserve(2, start + 3) == 0.0
+    assert bucket.tokens == pytest.approx(0.0)
+    bucket.reserve(0, start + 3600)
+    assert bucket.tokens == pytest.approx(60)
+
+
+def test_reservations_queue_up_in_order() -> None:
+    """Oltre la capacità, ogni prenotazione attende dopo quelle già fatte."""
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.reserve(60, now)
+    waits = [bucket.reserve(1, now) for _ in range(3)]
+    assert waits == pytest.approx([1.0, 2.0, 3.0])
+
+
+def test_adjust_returns_unused_tokens() -> None:
+    """Il consumo reale inferiore alla stima restituisce gettoni al secchio, senza superare la capacità."""
+    bucket = TokenBucket(1000)
+    now = bucket.updated
+    bucket.reserve(800, now)
+    bucket.adjust(-300, now)
+    assert bucket.tokens == pytest.approx(500)
+    bucket.adjust(-10_000, now)
+    assert bucket.tokens == pytest.approx(1000)
+
+
+def test_model_limiter_waits_for_the_tighter_bucket() -> None:
+    """L'attesa è quella del limite più stretto tra richieste e token al minuto."""
+    limiter = ModelRateLimiter(RateLimit(rpm=600, tpm=6000))
+    assert limiter.reserve(6000) == 0.0
+    # Il secchio delle richieste ha ancora capacità, quello dei token no: 100 token a 100 token/s.
+    assert limiter.reserve(100) == pytest.approx(1.0, abs=0.05)
+
+
+def test_acquire_sleeps_for_the_reserved_wait() -> None:
+    """`acquire` attende davvero il tempo necessario e lo restituisce."""
+    limiter = RateLimiter()
+    limiter.configure({"gemini-test": RateLimit(rpm=600)})
+
+    async def main() -> list[float]:
+        return [await limiter.acquire("gemini-test", 0) for _ in range(601)]
+
+    started = time.monotonic()
+    waits = asyncio.run(main())
+    assert waits[:600] == [0.0] * 600
+    assert waits[600] == pytest.approx(0.1, abs=0.02)
+    assert time.monotonic() - started >= 0.09
+
+
+def test_unconfigured_model_is_not_limited() -> None:
+    """Un modello senza limiti configurati non attende."""
+    assert asyncio.run(RateLimiter().acquire("other-model", 10**9)) == 0.0
+
+
+def test_retry_after_from_the_shim_pauses_the_model(make_agent, shim, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Un 429 con retry-after dello shim sospende tutte le richieste successive verso lo stesso modello."""
+    model = "gemini-retry-after-test"
+    monkeypatch.setenv("LLM_CONVERSATION_RETRY_ATTEMPTS", "1")
+    shim.configure_simulator(models={model: {"error_rate_429": 1.0, "retry_after": 30}}, seed=0)
+    agent = make_agent(model=model)
+    with pytest.raises(RateLimitError):
+        "".join(agent.get_response())
+    wait = get_rate_limiter()._get(model).reserve(0)
+    assert 25 < wait <= 30
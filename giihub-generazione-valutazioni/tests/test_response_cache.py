@@ -0,0 +1,145 @@
+"""Test della cache delle risposte: riuso su disco e deduplica delle richieste identiche in volo."""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import pytest
+
+from llm_conversation.response_cache import ResponseCache, get_response_cache
+
+
+def make_cache(tmp_path: Path) -> ResponseCache:
+    """Crea una cache vuota nella cartella temporanea del test."""
+    return ResponseCache(tmp_path / "cache.sqlite")
+
+
+async def collect(cache: ResponseCache, key: str, stream) -> tuple[str, bool]:
+    """Consuma lo stream della cache e restituisce il testo completo e il flag di risposta servita dalla cache."""
+    parts: list[str] = []
+    cached = False
+    async for chunk, cached in cache.astream_or_compute(key, "gemini-test", stream):
+        parts.append(chunk)
+    return "".join(parts), cached
+
+
+def test_second_request_is_served_from_disk(tmp_path: Path) -> None:
+    """Una richiesta già completata viene servita dalla cache senza chiamare il modello."""
+    cache = make_cache(tmp_path)
+    calls = 0
+
+    async def stream() -> AsyncIterator[str]:
+        nonlocal calls
+        calls += 1
+        yield "Buon"
+        yield "giorno"
+
+    assert asyncio.run(collect(cache, "k", stream)) == ("Buongiorno", False)
+    assert asyncio.run(collect(cache, "k", stream)) == ("Buongiorno", True)
+    assert calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_identical_requests_in_flight_share_one_call(tmp_path: Path) -> None:
+    """Le richieste con la stessa chiave arrivate mentre la prima è in volo ne attendono il risultato."""
+    cache = make_cache(tmp_path)
+    calls = 0
+
+    async def main() -> list[tuple[str, bool]]:
+        release = asyncio.Event()
+
+        async def stream() -> AsyncIterator[str]:
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            yield "risposta"
+
+        tasks = [asyncio.create_task(collect(cache, "k", stream)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert sorted(results) == [("risposta", False), ("risposta", True), ("risposta", True)]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_in_flight_dedup_across_threads_and_loops(tmp_path: Path) -> None:
+    """La deduplica vale anche tra richieste di thread con event loop diversi."""
+    cache = make_cache(tmp_path)
+    started = threading.Event()
+    release = threading.Event()
+    calls = 0
+    results: list[tuple[str, bool]] = []
+
+    async def stream() -> AsyncIterator[str]:
+        nonlocal calls
+        calls += 1
+        started.set()
+        await asyncio.to_thread(release.wait)
+        yield "risposta"
+
+    def worker() -> None:
+        results.append(asyncio.run(collect(cache, "k", stream)))
+
+    leader = threading.Thread(target=worker)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=worker)
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert calls == 1
+    assert sorted(results) == [("risposta", False), ("risposta", True)]
+
+
+def test_failed_leader_fails_followers_and_frees_the_key(tmp_path: Path) -> None:
+    """Un errore del leader arriva a chi lo attendeva e la richiesta successiva chiama di nuovo il modello."""
+    cache = make_cache(tmp_path)
+
+    async def main() -> list[object]:
+        release = asyncio.Event()
+
+        async def failing() -> AsyncIterator[str]:
+            await release.wait()
+            raise RuntimeError("errore del modello")
+            yield ""
+
+        tasks = [asyncio.create_task(collect(cache, "k", failing)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def ok() -> AsyncIterator[str]:
+        yield "di nuovo"
+
+    assert asyncio.run(collect(cache, "k", ok)) == ("di nuovo", False)
+    assert cache.get("k") == "di nuovo"
+
+
+def test_agents_with_identical_history_call_the_shim_once(
+    tmp_path: Path, make_agent, shim, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Due agenti con la stessa richiesta in volo contemporaneamente producono una sola chiamata allo shim."""
+    monkeypatch.setenv("LLM_CONVERSATION_CACHE", str(tmp_path / "agents.sqlite"))
+    shim.configure_simulator(default={"latency_median": 0.05, "response_tokens_mean": 20}, seed=0)
+    agents = [make_agent(), make_agent()]
+
+    async def respond(agent) -> str:
+        return "".join([chunk async for chunk in agent.aget_response()])
+
+    async def main() -> list[str]:
+        return await asyncio.gather(*(respond(agent) for agent in agents))
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert sorted(agent.last_call["source"] for agent in agents) == ["cache", "model"]
+    cache = get_response_cache()
+    assert cache is not None
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,85 @@
+"""Test dell'event loop condiviso: le operazioni bloccanti non devono fermare le altre conversazioni."""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator, Awaitable
+from pathlib import Path
+
+import pytest
+
+from llm_conversation.async_utils import _shared_loop, iterate_sync
+from llm_conversation.model_pool import ModelPool, PooledModel
+from llm_conversation.response_cache import ResponseCache
+
+BLOCKING_SECONDS = 0.2
+
+
+async def ticks_during(operation: Awaitable[object]) -> int:
+    """Conta quante volte un'altra coroutine riesce a girare sul loop mentre `operation` è in corso."""
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    await operation
+    task.cancel()
+    return ticks
+
+
+def test_context_cache_creation_does_not_stall_the_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    """La creazione di un modello nel pool (una chiamata di rete con la cache di contesto) gira in un thread."""
+    pool = ModelPool()
+
+    def slow_create(model_name: str, system_prompt: str) -> PooledModel:
+        time.sleep(BLOCKING_SECONDS)
+        return PooledModel(object())
+
+    monkeypatch.setattr(pool, "_create", slow_create)
+    assert asyncio.run(ticks_during(pool.aget("gemini-test", "prompt"))) >= 10
+    assert pool.get("gemini-test", "prompt") is pool.get("gemini-test", "prompt")
+
+
+def test_cache_io_does_not_stall_the_loop(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Lettura e scrittura della cache su SQLite avvengono fuori dall'event loop."""
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    get, put = cache.get, cache.put
+
+    def slow_get(key: str) -> str | None:
+        time.sleep(BLOCKING_SECONDS)
+        return get(key)
+
+    def slow_put(key: str, model: str, response: str) -> None:
+        time.sleep(BLOCKING_SECONDS)
+        put(key, model, response)
+
+    monkeypatch.setattr(cache, "get", slow_get)
+    monkeypatch.setattr(cache, "put", slow_put)
+
+    async def stream() -> AsyncIterator[str]:
+        yield "risposta"
+
+    async def consume() -> None:
+        async for _ in cache.astream_or_compute("k", "gemini-test", stream):
+            pass
+
+    assert asyncio.run(ticks_during(consume())) >= 20
+    assert get("k") == "risposta"
+
+
+def test_iterate_sync_refuses_to_run_on_the_shared_loop() -> None:
+    """Chiamato dal loop condiviso, `iterate_sync` solleva un errore invece di bloccarsi per sempre."""
+
+    async def items() -> AsyncIterator[int]:
+        yield 1
+
+    async def nested() -> list[int]:
+        return list(iterate_sync(items()))
+
+    future = asyncio.run_coroutine_threadsafe(nested(), _shared_loop())
+    with pytest.raises(RuntimeError):
+        future.result(5)
+    assert list(iterate_sync(items())) == [1]
@@ -0,0 +1,71 @@
+"""Test della modalità a ondate: composizione dei batch e batch interrotti."""
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from llm_conversation.wavefront import WavefrontBatcher
+
+
+class FakeBackend:
+    """Backend che registra i batch ricevuti e risponde dopo `delay` secondi."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        """Crea un backend senza batch ricevuti."""
+        self.delay = delay
+        self.batches: list[list[str]] = []
+
+    async def send_batch(self, requests: list[tuple[Any, str, Any]], stream: bool = False) -> list[Any]:
+        """Risponde a ciascun messaggio del batch con il suo testo."""
+        self.batches.append([content for _, content, _ in requests])
+        await asyncio.sleep(self.delay)
+        return [f"risposta a {content}" for _, content, _ in requests]
+
+
+def make_batcher(backend: FakeBackend, participants: int, max_wait: float = 5.0) -> WavefrontBatcher:
+    """Batcher con `participants` dialoghi attivi che inviano i batch a `backend`."""
+    batcher = WavefrontBatcher(lambda model: backend.send_batch, max_wait=max_wait)
+    for _ in range(participants):
+        batcher.join()
+    return batcher
+
+
+def test_turns_of_all_active_conversations_leave_together() -> None:
+    """Quando tutti i dialoghi attivi hanno un turno in attesa parte un unico batch, senza aspettare `max_wait`."""
+    backend = FakeBackend()
+    batcher = make_batcher(backend, participants=3)
+
+    async def scenario() -> list[tuple[Any, int]]:
+        return await asyncio.gather(*(batcher.submit("gemini-test", None, f"m{i}", None) for i in range(3)))
+
+    results = asyncio.run(asyncio.wait_for(scenario(), timeout=1))
+    assert results == [(f"risposta a m{i}", 3) for i in range(3)]
+    assert backend.batches == [["m0", "m1", "m2"]]
+    assert batcher.stats()["largest_batch"] == 3
+
+
+def test_incomplete_batch_leaves_after_max_wait() -> None:
+    """Se un dialogo non arriva (per esempio servito dalla cache), il batch parte dopo `max_wait`."""
+    backend = FakeBackend()
+    batcher = make_batcher(backend, participants=2, max_wait=0.05)
+    assert asyncio.run(batcher.submit("gemini-test", None, "m0", None)) == ("risposta a m0", 1)
+    assert backend.batches == [["m0"]]
+
+
+def test_interrupted_batch_times_out_the_other_conversations() -> None:
+    """Se chi ha inviato il batch viene annullato, gli altri dialoghi ricevono TimeoutError invece di restare appesi."""
+    backend = FakeBackend(delay=5.0)
+    batcher = make_batcher(backend, participants=2)
+
+    async def scenario() -> None:
+        waiting = asyncio.ensure_future(batcher.submit("gemini-test", None, "m0", None))
+        await asyncio.sleep(0.01)
+        sender = asyncio.ensure_future(batcher.submit("gemini-test", None, "m1", None))
+        await asyncio.sleep(0.05)
+        assert backend.batches == [["m0", "m1"]]
+        sender.cancel()
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(waiting, timeout=1)
+
+    asyncio.run(scenario())